@@ -0,0 +1,175 @@
+import asyncio
+import contextvars
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from api.llm import complete, acomplete, stream_complete, LLMError
+from utils.chunking import chunk_text, count_tokens, select_evenly, CHUNK_MAX_TOKENS
+from utils.streaming import JsonArrayStream
+from utils.metrics import span
+
+# Map-reduce generation settings (override via .env)
+# Documents longer than this are generated chunk by chunk instead of in one call
+CHUNKING_THRESHOLD_TOKENS = int(os.getenv("CHUNKING_THRESHOLD_TOKENS", str(CHUNK_MAX_TOKENS)))
+# Upper bound on chunk calls per document, which bounds the cost of huge uploads
+MAX_CHUNKS = int(os.getenv("MAX_CHUNKS", "8"))
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+# Ask each chunk for this many times its share of cards, so dedupe still leaves enough
+OVERSAMPLE = float(os.getenv("GENERATION_OVERSAMPLE", "1.5"))
+
+
+def strip_code_fences(reply):
+    # Remove Markdown formatting if present
+    reply = reply.strip()
+    if reply.startswith("```"):
+        lines = reply.splitlines()
+        if lines[0].startswith("```"):
+            lines = lines[1:]
+        if lines and lines[-1].startswith("```"):
+            lines = lines[:-1]
+        reply = "\n".join(lines).strip()
+    return reply
+
+
+def parse_flashcards_reply(reply):
+    with span("json_parse"):
+        flashcards = json.loads(strip_code_fences(reply))
+    if not isinstance(flashcards, list):
+        raise ValueError("Expected a JSON array of flashcards.")
+    return [fc for fc in flashcards if isinstance(fc, dict) and fc.get("question")]
+
+
+def stream_flashcards(messages, reply_parts=None):
+    """
+    Stream a flashcard-generation call, yielding each flashcard dict as soon as
+    its closing brace arrives rather than after the whole reply.
+
+    Parameters:
+        messages (list): The chat messages to send.
+        reply_parts (list): Optional list that collects the raw reply text, so
+                            the caller can keep it in the chat history.
+    """
+    parser = JsonArrayStream()
+    for delta in stream_complete(messages):
+        if reply_parts is not None:
+            reply_parts.append(delta)
+        for flashcard in parser.feed(delta):
+            if isinstance(flashcard, dict) and flashcard.get("question"):
+                yield flashcard
+
+
+def needs_chunking(text):
+    return count_tokens(text) > CHUNKING_THRESHOLD_TOKENS
+
+
+def _question_key(flashcard):
+    return " ".join(str(flashcard.get("question", "")).lower().split())
+
+
+def _round_robin(lists):
+    for i in range(max((len(cards) for cards in lists), default=0)):
+        yield [cards[i] for cards in lists if i < len(cards)]
+
+
+def merge_flashcards(per_chunk, count):
+    """
+    Deduplicate flashcards by normalized question text and take count of them,
+    round-robin across chunks so every part of the document is represented.
+    """
+    merged, seen = [], set()
+    for round_cards in _round_robin(per_chunk):
+        for flashcard in round_cards:
+            key = _question_key(flashcard)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(flashcard)
+            if len(merged) == count:
+                return merged
+    return merged
+
+
+def _plan_chunks(text, count):
+    chunks = select_evenly(chunk_text(text), MAX_CHUNKS)
+    per_chunk_count = max(2, math.ceil(count * OVERSAMPLE / len(chunks)))
+    return chunks, per_chunk_count
+
+
+def _chunk_messages(system_prompt, chunks, i, per_chunk_count, user_request):
+    content = (
+        f"Document excerpt (part {i + 1} of {len(chunks)}):\n{chunks[i]}\n\n"
+        f"Generate exactly {per_chunk_count} flashcards covering this excerpt."
+    )
+    if user_request:
+        content += f"\n\nUser request: {user_request}"
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": content}]
+
+
+def generate_flashcards_chunked(system_prompt, text, user_request="", count=10):
+    """
+    Map-reduce flashcard generation for documents too large for one prompt.
+
+    The text is split into token-bounded, overlapping chunks (at most
+    MAX_CHUNKS, picked evenly across the document). Each chunk is sent as an
+    independent request, concurrently, asking for its share of the cards; the
+    results are deduplicated and merged down to count flashcards.
+
+    Parameters:
+        system_prompt (str): The endpoint's flashcard-generation system prompt.
+        text (str): The extracted document text.
+        user_request (str): Optional extra instructions from the user.
+        count (int): Number of flashcards to return.
+
+    Returns:
+        list: Up to count flashcard dicts.
+
+    Raises:
+        ValueError: if no chunk produced parseable flashcards.
+    """
+    chunks, per_chunk_count = _plan_chunks(text, count)
+
+    def generate(i):
+        try:
+            reply = complete(_chunk_messages(system_prompt, chunks, i, per_chunk_count, user_request))
+            return parse_flashcards_reply(reply)
+        except (json.JSONDecodeError, ValueError, LLMError) as e:
+            # One bad chunk shouldn't sink the whole document
+            print(f"Skipping chunk {i + 1}/{len(chunks)}: {e}")
+            return []
+
+    with ThreadPoolExecutor(max_workers=min(GENERATION_CONCURRENCY, len(chunks))) as executor:
+        # Each task runs in a copy of the request's context, so its spans reach the request profile
+        futures = [executor.submit(contextvars.copy_context().run, generate, i) for i in range(len(chunks))]
+        per_chunk = [future.result() for future in futures]
+
+    flashcards = merge_flashcards(per_chunk, count)
+    if not flashcards:
+        raise ValueError("No flashcards could be generated from any part of the document.")
+    return flashcards
+
+
+async def agenerate_flashcards_chunked(system_prompt, text, user_request="", count=10):
+    """Async counterpart of generate_flashcards_chunked for the ASGI app (same chunking and merge)."""
+    chunks, per_chunk_count = _plan_chunks(text, count)
+    limit = asyncio.Semaphore(GENERATION_CONCURRENCY)
+
+    async def generate(i):
+        async with limit:
+            try:
+                reply = await acomplete(_chunk_messages(system_prompt, chunks, i, per_chunk_count, user_request))
+                return parse_flashcards_reply(reply)
+            except (json.JSONDecodeError, ValueError, LLMError) as e:
+                print(f"Skipping chunk {i + 1}/{len(chunks)}: {e}")
+                return []
+
+    per_chunk = await asyncio.gather(*(generate(i) for i in range(len(chunks))))
+
+    flashcards = merge_flashcards(per_chunk, count)
+    if not flashcards:
+        raise ValueError("No flashcards could be generated from any part of the document.")
+    return flashcards
+
+
+__all__ = ['generate_flashcards_chunked', 'agenerate_flashcards_chunked', 'needs_chunking', 'parse_flashcards_reply', 'stream_flashcards', 'strip_code_fences', 'merge_flashcards']
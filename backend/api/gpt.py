@@ -2,48 +2,42 @@
 
 import os
 from flask import Flask, request, jsonify
-from openai import OpenAI
+from api.llm import complete
 from dotenv import load_dotenv
-import io
-from PyPDF2 import PdfReader
 import json
 
 # Import the refactored function    
-from controllers.flashcards_controller import add_flashcard_func
+from controllers.flashcards_controller import add_flashcards_func
+from utils.pdf_extraction import extract_uploads, PdfExtractionError
+from utils.conversation_store import conversation_store
 
 # Load environment variables
 load_dotenv()
-openai_api_key = os.getenv('OPENAI_API_KEY')
 
 app = Flask(__name__)
 
-def question(chats):
+def question(chats=conversation_store):
     """
     Expects:
       - multipart/form-data with:
           - PDF files under the field "pdfs"
           - A "chat_id" to identify conversation
           - Optional "user_request" field
+    chats is the conversation store holding the history (see utils/conversation_store.py).
     Generates flashcards via ChatGPT in JSON format, parses them, and
-    stores each one in MongoDB using add_flashcard_func.
+    stores them in MongoDB in one batch using add_flashcards_func.
     """
     chat_id = request.form.get("chat_id", None)
     if not chat_id:
         return jsonify({"error": "Missing chat_id."}), 400
 
     # 1. Initialize conversation if needed
-    if chat_id not in chats:
-        chats[chat_id] = [
-            {
-                "role": "system",
-                "content": (
-                    "You are a helpful assistant that processes PDF documents and extracts information. "
-                    "Generate 10 flashcards in valid JSON format, with each flashcard containing "
-                    "the keys: question, answer, topic, difficulty. Return ONLY JSON, e.g.:\n"
-                    "[\n  {\n    \"question\": \"...\",\n    \"answer\": \"...\",\n    \"topic\": \"...\",\n    \"difficulty\": \"...\"\n  },\n  ...\n]"
-                )
-            }
-        ]
+    chats.ensure(chat_id, (
+        "You are a helpful assistant that processes PDF documents and extracts information. "
+        "Generate 10 flashcards in valid JSON format, with each flashcard containing "
+        "the keys: question, answer, topic, difficulty. Return ONLY JSON, e.g.:\n"
+        "[\n  {\n    \"question\": \"...\",\n    \"answer\": \"...\",\n    \"topic\": \"...\",\n    \"difficulty\": \"...\"\n  },\n  ...\n]"
+    ))
 
     user_request = request.form.get("user_request", "").strip()
 
@@ -55,20 +49,10 @@ def question(chats):
     if not files:
         return jsonify({"error": "No PDF files found."}), 400
 
-    extracted_text = ""
-    for file in files:
-        if file.filename.lower().endswith(".pdf"):
-            try:
-                file_bytes = file.read()
-                reader = PdfReader(io.BytesIO(file_bytes))
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        extracted_text += page_text + "\n"
-            except Exception as e:
-                return jsonify({"error": f"Error processing {file.filename}: {str(e)}"}), 500
-        else:
-            return jsonify({"error": f"File {file.filename} is not a PDF."}), 400
+    try:
+        extracted_text = extract_uploads(files)
+    except PdfExtractionError as e:
+        return jsonify({"error": str(e)}), e.status_code
 
     if not extracted_text.strip():
         return jsonify({"error": "No text could be extracted from the uploaded PDFs."}), 400
@@ -78,21 +62,11 @@ def question(chats):
     if user_request:
         user_content += f"\n\nUser request: {user_request}"
 
-    chats[chat_id].append({"role": "user", "content": user_content})
+    chats.append(chat_id, {"role": "user", "content": user_content})
 
     # 3. Call ChatGPT
-    client = OpenAI(api_key=openai_api_key)
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=chats[chat_id],
-    )
-    assistant_reply = response.choices[0].message.content
-    chats[chat_id].append({"role": "assistant", "content": assistant_reply})
-
-    # Debug print
-    print("\n============ GPT Reply ============")
-    print(f"""\"\"\"{assistant_reply}\"\"\"""")
-    print("===================================\n")
+    assistant_reply = complete(chats.messages(chat_id))
+    chats.append(chat_id, {"role": "assistant", "content": assistant_reply})
 
     # 4. Parse JSON flashcards
     try:
@@ -100,12 +74,9 @@ def question(chats):
         if not isinstance(flashcards, list):
             raise ValueError("Expected a JSON array of flashcards.")
 
-        # 5. Insert each flashcard into the DB using the new function
-        flashcards_added = 0
-        for fc in flashcards:
-            resp, status_code = add_flashcard_func(fc)
-            if status_code == 201:
-                flashcards_added += 1
+        # 5. Embed and insert all flashcards in one batch
+        resp, status_code = add_flashcards_func(flashcards)
+        flashcards_added = len(resp["flashcard_ids"]) if status_code == 201 else 0
 
         return jsonify({
             "flashcards_added": flashcards_added,
@@ -118,14 +89,14 @@ def question(chats):
             "raw_reply": assistant_reply,
             "exception": str(e)
         }), 500
-def infer_flashcard_topic(flashcard, openai_api_key):
+def infer_flashcard_topic(flashcard, openai_api_key=None):
     """
     Use an LLM to determine the topic of the given flashcard.
     The flashcard is expected to have a 'question' or 'content' field.
     
     Parameters:
         flashcard (dict): The flashcard document.
-        openai_api_key (str): Your OpenAI API key.
+        openai_api_key (str): Unused; kept for compatibility. The key is read by api/llm.py.
     
     Returns:
         str: The inferred topic.
@@ -142,19 +113,12 @@ def infer_flashcard_topic(flashcard, openai_api_key):
         "Topic:"
     )
 
-    # Set your OpenAI API key
-    OpenAI.api_key = openai_api_key
-
-    # Call the OpenAI API
-    response = OpenAI.Completion.create(
-        engine="text-davinci-003",  # or another engine of your choice
-        prompt=prompt,
+    # Call the LLM through the shared gateway (the API key is configured there)
+    response = complete(
+        [{"role": "user", "content": prompt}],
         max_tokens=20,
         temperature=0.3,
-        top_p=1,
-        frequency_penalty=0,
-        presence_penalty=0
     )
 
-    topic = response.choices[0].text.strip()
+    topic = response.strip()
     return topic
\ No newline at end of file
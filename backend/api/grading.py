@@ -0,0 +1,239 @@
+import math
+import os
+import re
+import threading
+
+import numpy as np
+
+from controllers.flashcards_controller import get_embeddings
+from utils.grading_cache import normalize_answer
+
+# Local grading settings (override via .env). Set LOCAL_GRADING=0 to send every answer to the LLM.
+LOCAL_GRADING = os.getenv("LOCAL_GRADING", "1") == "1"
+# Embedding-similarity tier, off by default: it can only accept, and only answers at or above
+# GRADER_ACCEPT_SIMILARITY that don't differ from the stored answer by a negation; the rest go to the LLM
+GRADER_SIMILARITY = os.getenv("GRADER_SIMILARITY", "0") == "1"
+GRADER_ACCEPT_SIMILARITY = float(os.getenv("GRADER_ACCEPT_SIMILARITY", "0.9"))
+GRADER_NUMERIC_TOLERANCE = float(os.getenv("GRADER_NUMERIC_TOLERANCE", "1e-6"))
+# A decimal rounded to fewer significant digits than this isn't taken as a match ("0.3" for "1/3" goes to the LLM)
+GRADER_NUMERIC_MIN_DIGITS = int(os.getenv("GRADER_NUMERIC_MIN_DIGITS", "2"))
+# Stored answers up to this many words are treated as terms that must match exactly
+GRADER_TERM_MAX_WORDS = int(os.getenv("GRADER_TERM_MAX_WORDS", "4"))
+
+# A stored answer is only treated as true/false when it is exactly one of these words...
+_TRUE = {"true", "yes"}
+_FALSE = {"false", "no"}
+# ...and a given answer when it is exactly one of these ("N" as a stored answer may be nitrogen; given, it's "no")
+_GIVEN_TRUE = _TRUE | {"t", "y"}
+_GIVEN_FALSE = _FALSE | {"f", "n"}
+_NEGATIONS = {"not", "no", "never", "none", "nothing", "neither", "nor", "without", "cannot", "isn't", "aren't",
+              "wasn't", "weren't", "doesn't", "don't", "didn't", "can't", "won't", "hasn't", "haven't", "non"}
+_NEGATING_PREFIXES = ("non-", "non", "un", "in", "im", "ir", "il", "dis", "a")
+_CHOICE = re.compile(r"^\(?([a-h])\)?[.):]?(?:\s+(.*))?$")
+_NUMBER = re.compile(r"^([-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:e[-+]?\d+)?)(?:\s*/\s*(\d+(?:\.\d*)?))?\s*(%|[a-z]+)?$")
+
+
+def _truth(text, true_words=_TRUE, false_words=_FALSE):
+    # The whole answer must be the single word: "Right atrium" or "No, because..." are for later tiers
+    text = normalize_answer(text)
+    if text in true_words:
+        return True
+    if text in false_words:
+        return False
+    return None
+
+
+def _parse_number(text):
+    # (value, unit, significant digits, exponent of the last digit), or None
+    match = _NUMBER.match(normalize_answer(text).replace(",", ""))
+    if not match:
+        return None
+    literal = match.group(1)
+    value = float(literal)
+    if match.group(2):
+        denominator = float(match.group(2))
+        if denominator == 0:
+            return None
+        # Fractions are exact
+        return value / denominator, match.group(3) or "", math.inf, -math.inf
+    mantissa, _, exponent = literal.lstrip("+-").partition("e")
+    if "." not in mantissa and not exponent:
+        # So are integers: "42" for a count is not "42.3" rounded
+        return value, match.group(3) or "", math.inf, -math.inf
+    whole, _, fraction = mantissa.partition(".")
+    digits = len((whole + fraction).lstrip("0")) or 1
+    return value, match.group(3) or "", digits, int(exponent or 0) - len(fraction)
+
+
+def parse_number(text):
+    """Parse "42", "-1.5e3", "3/4", "1,000", "12 kg" or "50%" into (value, unit); None if it isn't one."""
+    number = _parse_number(text)
+    return number[:2] if number else None
+
+
+def grade_true_false(flashcard, answer):
+    expected = _truth(flashcard["answer"])
+    given = _truth(answer, _GIVEN_TRUE, _GIVEN_FALSE)
+    if expected is None or given is None:
+        return None
+    return given == expected
+
+
+def _option_index(text, options):
+    text = normalize_answer(text)
+    normalized_options = [normalize_answer(str(option)) for option in options]
+    if text in normalized_options:
+        return normalized_options.index(text)
+    match = _CHOICE.match(text)
+    if match:
+        index = ord(match.group(1)) - ord("a")
+        if index < len(options) and (not match.group(2) or match.group(2) == normalized_options[index]):
+            return index
+    return None
+
+
+def grade_multiple_choice(flashcard, answer):
+    options = flashcard.get("options") or flashcard.get("choices")
+    if not isinstance(options, list) or not options:
+        return None
+    expected = _option_index(flashcard["answer"], options)
+    given = _option_index(answer, options)
+    if expected is None or given is None:
+        return None
+    return given == expected
+
+
+def grade_numeric(flashcard, answer):
+    """
+    Accept-only: True when the numbers agree once the less precise one's rounding
+    is allowed for ("3.14159" for "3.14", "0.33" for "1/3", "6.02e23" for
+    "6.022e23"). Anything else may still be right in a form this can't compare,
+    so it is left to the LLM.
+    """
+    expected = _parse_number(flashcard["answer"])
+    given = _parse_number(answer)
+    if expected is None or given is None:
+        return None
+    # Only like-for-like is compared: "10,000,000" for "10 million" or "6.2832" for "2 pi" is for the LLM
+    if expected[1] != given[1]:
+        return None
+    if math.isclose(expected[0], given[0], rel_tol=GRADER_NUMERIC_TOLERANCE, abs_tol=GRADER_NUMERIC_TOLERANCE):
+        return True
+    coarser, finer = (expected, given) if expected[3] >= given[3] else (given, expected)
+    if coarser[3] == -math.inf or coarser[2] < min(GRADER_NUMERIC_MIN_DIGITS, finer[2]):
+        return None
+    # Within half a unit in the coarser number's last digit (with slack for float error)
+    half_unit = 0.5 * 10.0 ** coarser[3]
+    return True if abs(expected[0] - given[0]) <= half_unit * (1 + 1e-9) else None
+
+
+def grade_exact_term(flashcard, answer):
+    expected = normalize_answer(flashcard["answer"])
+    if len(expected.split()) > GRADER_TERM_MAX_WORDS:
+        return None
+    # A match is certainly right; a mismatch may be a synonym, so it is left to later tiers
+    return True if normalize_answer(answer) == expected else None
+
+
+def _negated_words(text):
+    words = set(normalize_answer(text).replace(",", " ").split())
+    # "irreversible" for "reversible": a word that is another one with a negating prefix
+    prefixed = {
+        word[len(prefix):] for word in words for prefix in _NEGATING_PREFIXES
+        if word.startswith(prefix) and len(word) - len(prefix) > 3
+    }
+    return words & _NEGATIONS, prefixed
+
+
+def differs_by_negation(expected, given):
+    """True when one answer negates something the other doesn't ("is a prokaryote" vs "is not a prokaryote")."""
+    expected_negations, expected_prefixed = _negated_words(expected)
+    given_negations, given_prefixed = _negated_words(given)
+    if expected_negations != given_negations:
+        return True
+    expected_words = set(normalize_answer(expected).split())
+    given_words = set(normalize_answer(given).split())
+    return bool(expected_prefixed & (given_words - expected_words) or given_prefixed & (expected_words - given_words))
+
+
+def grade_similarity(flashcard, answer):
+    # Accept-only: a low similarity may still be a valid paraphrase, so rejections are left to the LLM
+    if not GRADER_SIMILARITY:
+        return None
+    # Embeddings don't compare quantities reliably; numeric answers the numeric tier couldn't settle go to the LLM
+    if parse_number(flashcard["answer"]) is not None:
+        return None
+    # Negations barely move an embedding, so an answer that flips one is never accepted here
+    if differs_by_negation(flashcard["answer"], answer):
+        return None
+    expected, given = get_embeddings([str(flashcard["answer"]), answer])
+    expected, given = np.asarray(expected, dtype=np.float32), np.asarray(given, dtype=np.float32)
+    denominator = float(np.linalg.norm(expected) * np.linalg.norm(given))
+    if denominator == 0:
+        return None
+    similarity = float(expected @ given) / denominator
+    return True if similarity >= GRADER_ACCEPT_SIMILARITY else None
+
+
+# Cheapest and most certain first; each returns True/False, or None when it can't decide
+GRADERS = [
+    ("multiple_choice", grade_multiple_choice),
+    ("true_false", grade_true_false),
+    ("numeric", grade_numeric),
+    ("exact_term", grade_exact_term),
+    ("similarity", grade_similarity),
+]
+
+
+class LocalGrader:
+    """
+    Tiered grading against a flashcard's stored answer, in front of the LLM.
+
+    grade() runs GRADERS in order and returns the first confident verdict, in
+    the same {"correct", "correct_answer"} shape as the LLM grader, or None
+    when the flashcard has no stored answer or no tier is sure.
+    """
+
+    def __init__(self, graders=GRADERS, enabled=LOCAL_GRADING):
+        self.graders = graders
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.counts = {name: 0 for name, _ in graders}
+        self.fallbacks = 0
+
+    def grade(self, flashcard, answer):
+        if not self.enabled or not flashcard or not str(flashcard.get("answer") or "").strip() or not answer.strip():
+            return self._fall_back()
+        flashcard = {**flashcard, "answer": str(flashcard["answer"]).strip()}
+
+        for name, grader in self.graders:
+            correct = grader(flashcard, answer)
+            if correct is not None:
+                with self._lock:
+                    self.counts[name] += 1
+                return {
+                    "correct": correct,
+                    "correct_answer": "Good job!" if correct else f"The correct answer is: {flashcard['answer']}",
+                }
+        return self._fall_back()
+
+    def _fall_back(self):
+        with self._lock:
+            self.fallbacks += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            local = sum(self.counts.values())
+            total = local + self.fallbacks
+            return {
+                "graded_locally": dict(self.counts),
+                "llm_fallbacks": self.fallbacks,
+                "local_rate": local / total if total else 0.0,
+            }
+
+
+# Shared grader for the process
+local_grader = LocalGrader()
+
+__all__ = ['LocalGrader', 'local_grader', 'GRADERS', 'parse_number', 'differs_by_negation']
@@ -0,0 +1,180 @@
+import json
+import random
+
+from bson.objectid import ObjectId
+
+from utils.metrics import span
+
+# Request parsing and response shaping shared by the Flask routes (app.py) and
+# the async routes (asgi.py), so the two serving modes can't drift apart. Forms
+# and file maps are werkzeug/Quart MultiDicts; errors and responses are
+# (body dict, status code) tuples for the caller to jsonify.
+
+
+def missing_field(form, *names):
+    """The 400 response for the first required form field that is empty, or None."""
+    for name in names:
+        if not form.get(name, None):
+            return {"error": f"Missing {name}."}, 400
+    return None
+
+
+def answer_ids_error(form):
+    """The 400 response for an /answer without a usable user_id and flashcard_id, or None."""
+    error = missing_field(form, "user_id", "flashcard_id")
+    if error:
+        return error
+    if not ObjectId.is_valid(form["user_id"]):
+        return {"error": "Invalid user_id."}, 400
+    return None
+
+
+def study_prompt(extracted_text, user_request):
+    """
+    The user message for /question/study.
+
+    Returns:
+        tuple: (prompt content, None), or (None, 400 response) when there is neither text nor a request.
+    """
+    if not extracted_text.strip() and not user_request:
+        return None, ({"error": "No PDFs provided and no user request specified."}, 400)
+    prompt_content = extracted_text if extracted_text.strip() else ""
+    if user_request:
+        prompt_content += f"\n\nUser Request: {user_request}"
+    return prompt_content, None
+
+
+def question_uploads(files):
+    """
+    The uploaded files /question requires under "pdfs".
+
+    Returns:
+        tuple: (files, None), or (None, 400 response) when none were sent.
+    """
+    if "pdfs" not in files:
+        return None, ({"error": "No PDFs uploaded. Include files with key 'pdfs'."}, 400)
+    uploads = files.getlist("pdfs")
+    if not uploads:
+        return None, ({"error": "No PDF files found."}, 400)
+    return uploads, None
+
+
+def no_text_error(extracted_text):
+    if not extracted_text.strip():
+        return {"error": "No text could be extracted from the uploaded PDFs."}, 400
+    return None
+
+
+def question_prompt(extracted_text, user_request):
+    # The user message for /question: the PDF text plus the optional request
+    if user_request:
+        return f"{extracted_text}\n\nUser request: {user_request}"
+    return extracted_text
+
+
+def generation_error(e):
+    return {"error": "Could not generate flashcards from the uploaded PDFs.", "exception": str(e)}, 500
+
+
+def parse_error(assistant_reply, e, message="Could not parse JSON flashcards from GPT response."):
+    return {"error": message, "raw_reply": assistant_reply, "exception": str(e)}, 500
+
+
+def parse_flashcard_list(assistant_reply):
+    """Parse a generation reply into its list of flashcards; raises ValueError (or JSONDecodeError)."""
+    with span("json_parse"):
+        flashcards = json.loads(assistant_reply)
+    if not isinstance(flashcards, list):
+        raise ValueError("Expected a JSON array of flashcards.")
+    return flashcards
+
+
+def parse_review_flashcard(assistant_reply):
+    """The first flashcard of a /question/review reply; raises ValueError (or JSONDecodeError)."""
+    new_flashcard = parse_flashcard_list(assistant_reply)[0]
+    if not isinstance(new_flashcard, dict) or "question" not in new_flashcard:
+        raise ValueError("Invalid flashcard format received.")
+    return new_flashcard
+
+
+def recommended_topic(recommended_flashcards):
+    # Topic of the top recommendation; None when the user has none yet (or the lookup failed)
+    if isinstance(recommended_flashcards, list) and recommended_flashcards:
+        return recommended_flashcards[0].get("topic")
+    return None
+
+
+def review_response(recommended_flashcards, new_flashcard, added):
+    """
+    Parameters:
+        added (tuple): The (response, status) from adding new_flashcard.
+    """
+    resp, status_code = added
+    if status_code != 201:
+        return {"error": "Failed to save the new flashcard."}, 500
+    new_flashcard["id"] = resp["flashcard_ids"][0]
+    return {
+        "recommended_flashcards": recommended_flashcards,
+        "selected_flashcard": new_flashcard,
+    }, 200
+
+
+def study_flashcard_id(resp, flashcard_id):
+    # The "id" /question/study attaches to each flashcard
+    return {"message": resp["message"], "flashcard_id": flashcard_id}
+
+
+def study_response(flashcards, added, recommended_flashcards):
+    """
+    Parameters:
+        added (tuple): The (response, status) from adding the flashcards.
+    """
+    resp, status_code = added
+    if status_code != 201:
+        return {"error": "Failed to save the generated flashcards."}, 500
+    for fc, flashcard_id in zip(flashcards, resp["flashcard_ids"]):
+        fc['id'] = study_flashcard_id(resp, flashcard_id)
+    if not flashcards:
+        return {"error": "No flashcard generated."}, 500
+    return {
+        "flashcards": flashcards,
+        "selected_flashcard": random.choice(flashcards),
+        "response": recommended_topic(recommended_flashcards)
+    }, 200
+
+
+def question_response(flashcards, added, recommended_flashcards):
+    resp, status_code = added
+    flashcard_ids = resp["flashcard_ids"] if status_code == 201 else []
+    return {
+        "flashcards_added": len(flashcard_ids),
+        "flashcards": flashcards,
+        "recommended_flashcard": recommended_flashcards  # Includes flashcard ID
+    }, 200
+
+
+def unknown_chat_error():
+    return {"error": "Invalid chat_id. No previous conversation found."}, 400
+
+
+def answer_message(question_text, user_answer):
+    return {"role": "user", "content": f"Question: {question_text}\nUser Answer: {user_answer}"}
+
+
+def parse_verdict(assistant_reply):
+    """Parse the grading LLM's reply; raises ValueError (or JSONDecodeError) without a "correct" key."""
+    with span("json_parse"):
+        answer_feedback = json.loads(assistant_reply)
+    if "correct" not in answer_feedback:
+        raise ValueError("Invalid JSON response from GPT.")
+    return answer_feedback
+
+
+def verdict_action(answer_feedback):
+    return "correct" if answer_feedback["correct"] else "incorrect"
+
+
+__all__ = ['missing_field', 'answer_ids_error', 'study_prompt', 'question_uploads', 'no_text_error', 'question_prompt', 'generation_error',
+           'parse_error', 'parse_flashcard_list', 'parse_review_flashcard', 'recommended_topic', 'review_response',
+           'study_flashcard_id', 'study_response', 'question_response', 'unknown_chat_error', 'answer_message',
+           'parse_verdict', 'verdict_action']
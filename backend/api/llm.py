@@ -0,0 +1,400 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from utils.metrics import timed
+
+load_dotenv()
+
+# LLM gateway settings (override via .env)
+#   LLM_BACKEND: "openai" or "fake" (deterministic canned replies for tests and benchmarks)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", str(LLM_MAX_CONCURRENCY)))
+
+
+class LLMError(Exception):
+    """An LLM call failed after retries; status_code is the HTTP status to return."""
+
+    status_code = 502
+
+
+class LLMTimeoutError(LLMError):
+    """The call's deadline passed, either waiting for a slot or waiting on the API."""
+
+    status_code = 504
+
+
+class OpenAIBackend:
+    """One pooled OpenAI client per process; keep-alive connections are reused across requests."""
+
+    def __init__(self, api_key=None):
+        import httpx
+        from openai import OpenAI
+
+        self._api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self._async_client = None
+        self.client = OpenAI(
+            api_key=self._api_key,
+            max_retries=0,  # retries are handled by the gateway, with jitter and a deadline
+            http_client=httpx.Client(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                timeout=LLM_TIMEOUT_SECONDS,
+            ),
+        )
+
+    @property
+    def async_client(self):
+        # Created on first use, from inside the serving event loop
+        if self._async_client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            self._async_client = AsyncOpenAI(
+                api_key=self._api_key,
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                    timeout=LLM_TIMEOUT_SECONDS,
+                ),
+            )
+        return self._async_client
+
+    @staticmethod
+    def _usage(usage):
+        return {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        }
+
+    @classmethod
+    def _unpack(cls, response):
+        return response.choices[0].message.content, cls._usage(response.usage)
+
+    def create(self, model, messages, timeout, **kwargs):
+        return self._unpack(self.client.chat.completions.create(model=model, messages=messages, timeout=timeout, **kwargs))
+
+    def stream(self, model, messages, timeout, **kwargs):
+        """Yield (text_delta, usage) pairs; usage is None except on the final chunk."""
+        response = self.client.chat.completions.create(
+            model=model, messages=messages, timeout=timeout, stream=True,
+            stream_options={"include_usage": True}, **kwargs
+        )
+        with response:
+            for chunk in response:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                yield delta or "", self._usage(chunk.usage) if chunk.usage else None
+
+    async def acreate(self, model, messages, timeout, **kwargs):
+        response = await self.async_client.chat.completions.create(model=model, messages=messages, timeout=timeout, **kwargs)
+        return self._unpack(response)
+
+    @staticmethod
+    def is_retryable(error):
+        import openai
+
+        if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+    @staticmethod
+    def retry_after(error):
+        response = getattr(error, "response", None)
+        value = response.headers.get("retry-after") if response is not None else None
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+
+class FakeLLM:
+    """
+    Deterministic stand-in for the OpenAI backend.
+
+    Parameters:
+        replies: A string, a list of strings (cycled), or a callable taking the
+                 messages and returning a string.
+        latency (float): Seconds to sleep per call, to simulate the network.
+        stream_chunk_chars (int): Size of the pieces stream() yields; the latency
+                 is spread evenly across them.
+    """
+
+    def __init__(self, replies="[]", latency=0.0, stream_chunk_chars=16):
+        self.replies = replies
+        self.latency = latency
+        self.stream_chunk_chars = stream_chunk_chars
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, timeout, **kwargs):
+        if self.latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Fake LLM call timed out.")
+        if self.latency:
+            time.sleep(self.latency)
+        return self._reply(messages)
+
+    async def acreate(self, model, messages, timeout, **kwargs):
+        if self.latency > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError("Fake LLM call timed out.")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._reply(messages)
+
+    def stream(self, model, messages, timeout, **kwargs):
+        if self.latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Fake LLM call timed out.")
+        content, usage = self._reply(messages)
+        pieces = [content[i:i + self.stream_chunk_chars] for i in range(0, len(content), self.stream_chunk_chars)]
+        for i, piece in enumerate(pieces):
+            if self.latency:
+                time.sleep(self.latency / len(pieces))
+            yield piece, usage if i == len(pieces) - 1 else None
+
+    def _reply(self, messages):
+        with self._lock:
+            self.calls.append(messages)
+            call_number = len(self.calls) - 1
+        if callable(self.replies):
+            content = self.replies(messages)
+        elif isinstance(self.replies, str):
+            content = self.replies
+        else:
+            content = self.replies[call_number % len(self.replies)]
+        prompt_tokens = sum(len(m["content"].split()) for m in messages)
+        return content, {"prompt_tokens": prompt_tokens, "completion_tokens": len(content.split())}
+
+    @staticmethod
+    def is_retryable(error):
+        return isinstance(error, TimeoutError)
+
+    @staticmethod
+    def retry_after(error):
+        return None
+
+
+class LLMMetrics:
+    """Call counters, token totals and a window of recent latencies."""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.in_flight = 0
+        self._latencies = deque(maxlen=window)
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def record(self, seconds, usage=None, error=False):
+        with self._lock:
+            self.calls += 1
+            self.errors += int(error)
+            self._latencies.append(seconds)
+            if usage:
+                self.prompt_tokens += usage["prompt_tokens"]
+                self.completion_tokens += usage["completion_tokens"]
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        percentile = lambda p: latencies[min(int(p * len(latencies)), len(latencies) - 1)] if latencies else None
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency_p50_seconds": percentile(0.5),
+            "latency_p99_seconds": percentile(0.99),
+        }
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+metrics = LLMMetrics()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = FakeLLM() if LLM_BACKEND == "fake" else OpenAIBackend()
+        return _backend
+
+
+def set_backend(backend):
+    """Swap the process-wide backend (e.g. a FakeLLM in tests); returns the previous one."""
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
+
+
+def _backoff(attempt, retry_after=None):
+    if retry_after is not None:
+        return min(retry_after, LLM_BACKOFF_MAX_SECONDS)
+    # Full jitter keeps retries from many workers from arriving in lockstep
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def _retry_delay(backend, error, attempt, max_retries, deadline, timeout):
+    """Seconds to wait before retrying error, or raise if it can't be retried in time."""
+    if attempt >= max_retries or not backend.is_retryable(error):
+        raise LLMError(f"LLM call failed: {error}") from error
+    delay = _backoff(attempt, backend.retry_after(error))
+    if time.monotonic() + delay >= deadline:
+        raise LLMTimeoutError(f"LLM call exceeded its {timeout:g}s deadline: {error}") from error
+    metrics.retried()
+    return delay
+
+
+@timed("llm")
+def complete(messages, model=LLM_MODEL, timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES, **kwargs):
+    """
+    Run a chat completion through the shared client and return the reply text.
+
+    At most LLM_MAX_CONCURRENCY calls are in flight per process. Rate limits,
+    5xx and connection errors are retried with jittered exponential backoff
+    (honouring Retry-After), all within one deadline of timeout seconds that
+    also covers waiting for a free slot.
+
+    Raises:
+        LLMTimeoutError: if the deadline passes.
+        LLMError: if the call fails and can't be retried.
+    """
+    backend = get_backend()
+    deadline = time.monotonic() + timeout
+
+    if not _slots.acquire(timeout=timeout):
+        raise LLMTimeoutError(f"No LLM slot became free within {timeout:g}s.")
+    metrics.started()
+    try:
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError(f"LLM call exceeded its {timeout:g}s deadline.")
+            start = time.perf_counter()
+            try:
+                content, usage = backend.create(model, messages, remaining, **kwargs)
+            except Exception as e:
+                metrics.record(time.perf_counter() - start, error=True)
+                time.sleep(_retry_delay(backend, e, attempt, max_retries, deadline, timeout))
+                attempt += 1
+                continue
+            metrics.record(time.perf_counter() - start, usage)
+            return content
+    finally:
+        metrics.finished()
+        _slots.release()
+
+
+def stream_complete(messages, model=LLM_MODEL, timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES, **kwargs):
+    """
+    Streaming counterpart of complete(): a generator of reply text pieces as they arrive.
+
+    The slot is held until the generator is exhausted or closed. Errors are
+    retried like complete() only until the first piece has been yielded;
+    after that the caller already holds part of the reply, so they are
+    raised as LLMError.
+    """
+    backend = get_backend()
+    deadline = time.monotonic() + timeout
+
+    if not _slots.acquire(timeout=timeout):
+        raise LLMTimeoutError(f"No LLM slot became free within {timeout:g}s.")
+    metrics.started()
+    try:
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError(f"LLM call exceeded its {timeout:g}s deadline.")
+            start = time.perf_counter()
+            received, usage = False, None
+            try:
+                for delta, chunk_usage in backend.stream(model, messages, remaining, **kwargs):
+                    usage = chunk_usage or usage
+                    if delta:
+                        received = True
+                        yield delta
+            except Exception as e:
+                metrics.record(time.perf_counter() - start, error=True)
+                if received:
+                    raise LLMError(f"LLM stream failed: {e}") from e
+                time.sleep(_retry_delay(backend, e, attempt, max_retries, deadline, timeout))
+                attempt += 1
+                continue
+            metrics.record(time.perf_counter() - start, usage)
+            return
+    finally:
+        metrics.finished()
+        _slots.release()
+
+
+# asyncio semaphores are bound to the loop that first uses them, so keep one per loop
+_async_slots = {}
+
+
+@timed("llm")
+async def acomplete(messages, model=LLM_MODEL, timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES, **kwargs):
+    """Async counterpart of complete() for the ASGI app; same limits, retries and deadline."""
+    backend = get_backend()
+    deadline = time.monotonic() + timeout
+    loop = asyncio.get_running_loop()
+    slots = _async_slots.setdefault(loop, asyncio.Semaphore(LLM_MAX_CONCURRENCY))
+
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout)
+    except asyncio.TimeoutError:
+        raise LLMTimeoutError(f"No LLM slot became free within {timeout:g}s.")
+    metrics.started()
+    try:
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError(f"LLM call exceeded its {timeout:g}s deadline.")
+            start = time.perf_counter()
+            try:
+                content, usage = await backend.acreate(model, messages, remaining, **kwargs)
+            except Exception as e:
+                metrics.record(time.perf_counter() - start, error=True)
+                await asyncio.sleep(_retry_delay(backend, e, attempt, max_retries, deadline, timeout))
+                attempt += 1
+                continue
+            metrics.record(time.perf_counter() - start, usage)
+            return content
+    finally:
+        metrics.finished()
+        slots.release()
+
+
+__all__ = ['complete', 'acomplete', 'stream_complete', 'get_backend', 'set_backend', 'metrics', 'FakeLLM', 'OpenAIBackend', 'LLMError', 'LLMTimeoutError']
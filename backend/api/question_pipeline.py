@@ -0,0 +1,69 @@
+import json
+
+from api.llm import complete
+from api.flashcard_generation import generate_flashcards_chunked, needs_chunking
+from api.handlers import question_prompt, generation_error, parse_error, parse_flashcard_list, question_response
+from api.prompts import QUESTION_SYSTEM_PROMPT, chunked_stand_in
+from controllers.flashcards_controller import add_flashcards_func
+from controllers.performance_controller import get_recommended_flashcards
+from utils.conversation_store import conversation_store
+
+
+def _no_progress(fraction, stage=None):
+    pass
+
+
+def generate_question_flashcards(chat_id, user_id, extracted_text, user_request="", chats=conversation_store, progress=None):
+    """
+    The /question pipeline once the PDF text is extracted: generate flashcards
+    with the LLM, store them, and pick recommended flashcards for the user.
+    Shared by the /question route and the background job worker.
+
+    Parameters:
+        chat_id (str): Conversation to generate in.
+        user_id (str): User to recommend flashcards for.
+        extracted_text (str): Text of the uploaded PDFs.
+        user_request (str): Optional instructions from the user.
+        chats: The conversation store holding the history (see utils/conversation_store.py).
+        progress (callable): Optional progress(fraction, stage) hook, called between stages.
+
+    Returns:
+        tuple: (response body dict, HTTP status code)
+    """
+    progress = progress or _no_progress
+    chats.ensure(chat_id, QUESTION_SYSTEM_PROMPT)
+
+    # Combine PDF text with user request
+    user_content = question_prompt(extracted_text, user_request)
+
+    # Call ChatGPT (large documents are generated chunk by chunk, concurrently)
+    progress(0.2, "generating")
+    if needs_chunking(extracted_text):
+        try:
+            assistant_reply = json.dumps(generate_flashcards_chunked(chats.system_prompt(chat_id), extracted_text, user_request))
+        except ValueError as e:
+            return generation_error(e)
+        # Keep a short stand-in for the document in the history rather than the full text
+        user_content = chunked_stand_in(extracted_text, user_request)
+        chats.append(chat_id, {"role": "user", "content": user_content})
+    else:
+        chats.append(chat_id, {"role": "user", "content": user_content})
+        assistant_reply = complete(chats.messages(chat_id))
+    chats.append(chat_id, {"role": "assistant", "content": assistant_reply})
+
+    # Parse JSON flashcards
+    progress(0.7, "saving")
+    try:
+        flashcards = parse_flashcard_list(assistant_reply)
+    except (json.JSONDecodeError, ValueError) as e:
+        return parse_error(assistant_reply, e)
+
+    # Embed and insert all flashcards in one batch
+    added = add_flashcards_func(flashcards, owner_id=user_id)
+
+    # Get recommended flashcards for the user
+    progress(0.9, "recommending")
+    return question_response(flashcards, added, get_recommended_flashcards(user_id))
+
+
+__all__ = ['generate_question_flashcards']
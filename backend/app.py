@@ -1,29 +1,50 @@
 import os
-from flask import Flask, request, jsonify
-import io
-from PyPDF2 import PdfReader
+from flask import Flask, Response, request, jsonify, stream_with_context
 import json
 from dotenv import load_dotenv
 from controllers.user_controller import register_user, login_user, save_rl_data, get_rl_data
-from controllers.flashcards_controller import get_flashcards, get_flashcard, add_flashcard, update_flashcard, delete_flashcard, find_similar_flashcards, add_flashcard_func
-from controllers.performance_controller import get_performance, add_update_performance, delete_performance, get_q_table, log_user_performance, get_recommended_flashcards, update_q_table, get_top_failed_flashcard
+from controllers.flashcards_controller import get_flashcards, get_flashcard, add_flashcard, update_flashcard, delete_flashcard, find_similar_flashcards, add_flashcard_func, add_flashcards_func, get_flashcard_for_grading
+from controllers.performance_controller import get_performance, add_update_performance, delete_performance, get_q_table, log_user_performance, get_recommended_flashcards, update_q_table, get_top_failed_flashcard, get_similar_flashcards
 from controllers.class_controller import add_class, delete_class, get_all_classes, get_single_class
+from controllers.metrics_controller import metrics, instrument_app
+from controllers.jobs_controller import submit_question_job, get_job, get_job_result, cancel_job, start_job_workers
 from utils.db import db
+from utils.indexes import ensure_indexes_in_background, ENSURE_INDEXES_ON_STARTUP
+from utils.embedding_model import warm_up
+from utils.pdf_extraction import extract_uploads, PdfExtractionError
+from utils.conversation_store import conversation_store
+from utils.streaming import format_event, STREAM_MIMETYPES
+from utils.grading_cache import grading_cache, grading_key
 from api.gpt import question
+from api.llm import complete, LLMError
+from api.flashcard_generation import generate_flashcards_chunked, needs_chunking, stream_flashcards, strip_code_fences
+from api.grading import local_grader
+from api.question_pipeline import generate_question_flashcards
+from api.handlers import (missing_field, answer_ids_error, study_prompt, question_uploads, no_text_error, generation_error, parse_error,
+                          parse_flashcard_list, parse_review_flashcard, recommended_topic, review_response,
+                          study_flashcard_id, study_response, unknown_chat_error, answer_message, parse_verdict,
+                          verdict_action)
+from api.prompts import REVIEW_SYSTEM_PROMPT, STUDY_SYSTEM_PROMPT, VERIFICATION_PROMPT, format_recommendations, chunked_stand_in
 from flask_cors import CORS
 import random
-from openai import OpenAI
 from bson.objectid import ObjectId
 
 
 app = Flask(__name__)
 CORS(app)
+# Request timing for /metrics and opt-in per-request profiling (see controllers/metrics_controller.py)
+instrument_app(app)
 
-chats = {}
+@app.errorhandler(LLMError)
+def handle_llm_error(e):
+    # LLM failures that survived the gateway's retries become a clean JSON error
+    return jsonify({"error": str(e)}), e.status_code
+
+# Bounded, evicting conversation history (in-memory or shared through Mongo; see utils/conversation_store.py)
+chats = conversation_store
 
 # Load environment variables
 load_dotenv()
-openai_api_key = os.getenv('OPENAI_API_KEY')
 
 def question_review():
     """
@@ -35,103 +56,41 @@ def question_review():
       - The generated flashcards, recommended flashcards used, and the ID of the newly generated flashcard.
     """
 
-    chat_id = request.form.get("chat_id", None)
-    user_id = request.form.get("user_id", None)
-
-    if not chat_id:
-        return jsonify({"error": "Missing chat_id."}), 400
-    if not user_id:
-        return jsonify({"error": "Missing user_id."}), 400
+    error = missing_field(request.form, "chat_id", "user_id")
+    if error:
+        return jsonify(error[0]), error[1]
+    chat_id = request.form["chat_id"]
+    user_id = request.form["user_id"]
 
     # 1. Fetch Recommended Flashcards
     recommended_flashcards = get_recommended_flashcards(user_id)
-    print(recommended_flashcards)
     if not recommended_flashcards:
         return jsonify({"error": "No recommended flashcards found for this user."}), 400
 
     # 2. Format Data for GPT
-    formatted_recommendations = "\n".join([
-        f"- Q: {fc['question']} A: {fc.get('answer', 'N/A')}" for fc in recommended_flashcards
-    ])
-
-    # 3. Prepare ChatGPT prompt
-    system_prompt = (
-        "You are an AI that generates a new, unique flashcard based on previous flashcards. "
-        "Use the given recommended flashcards to generate a new, challenging question. "
-        "Your output must be a valid JSON array containing one or more flashcard objects. Each flashcard object "
-        "must have exactly the following keys: 'question', 'topic', and 'difficulty'. "
-        "Output ONLY valid JSON that can be decoded using json.loads() and do NOT include any Markdown formatting (e.g., no triple backticks). "
-        "Do not include any additional keys or text. Here is an example format:\n"
-        "[\n"
-        "  {\n"
-        "    \"question\": \"What is the significance of backpropagation in neural networks?\",\n"
-        "    \"topic\": \"Machine Learning\",\n"
-        "    \"difficulty\": \"Medium\"\n"
-        "  }\n"
-        "]"
-    )
-
-    user_prompt = f"Here are previous flashcards:\n{formatted_recommendations}\nGenerate a new flashcard."
+    user_prompt = format_recommendations(recommended_flashcards)
 
-    # Maintain chat history
-    if chat_id not in chats:
-        chats[chat_id] = [{"role": "system", "content": system_prompt}]
-    chats[chat_id].append({"role": "user", "content": user_prompt})
+    # 3. Maintain chat history
+    chats.ensure(chat_id, REVIEW_SYSTEM_PROMPT)
+    chats.append(chat_id, {"role": "user", "content": user_prompt})
 
     # 4. Call ChatGPT
-    client = OpenAI(api_key=openai_api_key)
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=chats[chat_id],
-    )
-    assistant_reply = response.choices[0].message.content
-
-    # Debug Print
-    print("\n============ GPT Reply ============")
-    print(f"""\"\"\"{assistant_reply}\"\"\"""")
-    print("===================================\n")
+    assistant_reply = complete(chats.messages(chat_id))
 
     # Remove Markdown formatting if present
-    assistant_reply = assistant_reply.strip()
-    if assistant_reply.startswith("```"):
-        lines = assistant_reply.splitlines()
-        if lines[0].startswith("```"):
-            lines = lines[1:]
-        if lines and lines[-1].startswith("```"):
-            lines = lines[:-1]
-        assistant_reply = "\n".join(lines).strip()
+    assistant_reply = strip_code_fences(assistant_reply)
 
     # 5. Parse JSON flashcard
     try:
-        new_flashcards = json.loads(assistant_reply)
-        if not isinstance(new_flashcards, list):
-            raise ValueError("Expected a JSON array of flashcards.")
-        new_flashcard = new_flashcards[0]
-        if not isinstance(new_flashcard, dict) or "question" not in new_flashcard:
-            raise ValueError("Invalid flashcard format received.")
-
-        # 6. Insert the new flashcard into the database
-        resp, status_code = add_flashcard_func(new_flashcard)
-        if status_code != 201:
-            return jsonify({"error": "Failed to save the new flashcard."}), 500
-
-        # Extract the flashcard ID from the response
-        flashcard_id = resp.get("flashcard_id")
-
-        new_flashcard["id"] = flashcard_id
-
-        # 7. Return all original data plus the selected flashcard ID.
-        return jsonify({
-            "recommended_flashcards": recommended_flashcards,
-            "selected_flashcard": new_flashcard,
-        }), 200
-
+        new_flashcard = parse_review_flashcard(assistant_reply)
     except (json.JSONDecodeError, ValueError) as e:
-        return jsonify({
-            "error": "Could not parse the generated flashcard JSON.",
-            "raw_reply": assistant_reply,
-            "exception": str(e)
-        }), 500
+        body, status_code = parse_error(assistant_reply, e, "Could not parse the generated flashcard JSON.")
+        return jsonify(body), status_code
+
+    # 6. Insert the new flashcard and return it with the recommendations it was based on
+    body, status_code = review_response(recommended_flashcards, new_flashcard,
+                                        add_flashcards_func([new_flashcard], owner_id=user_id))
+    return jsonify(body), status_code
 
 
 def question_study():
@@ -143,117 +102,146 @@ def question_study():
           - A "user_id" for personalized recommendations
           - A "user_request" to specify type of flashcards (e.g., multiple choice, word problems, specific topic)
     Generates flashcards via ChatGPT in JSON format, parses them, and
-    stores each one in MongoDB using add_flashcard_func.
+    stores them in MongoDB in one batch using add_flashcards_func.
     Returns all generated flashcards, along with the complete data of one randomly selected flashcard and its ID.
     """
-    
-    chat_id = request.form.get("chat_id", None)
-    user_id = request.form.get("user_id", None)
-    user_request = request.form.get("user_request", "").strip()
 
-    if not chat_id:
-        return jsonify({"error": "Missing chat_id."}), 400
-    if not user_id:
-        return jsonify({"error": "Missing user_id."}), 400
+    error = missing_field(request.form, "chat_id", "user_id")
+    if error:
+        return jsonify(error[0]), error[1]
+    chat_id = request.form["chat_id"]
+    user_id = request.form["user_id"]
+    user_request = request.form.get("user_request", "").strip()
 
     # 1. Extract PDFs (if provided)
     extracted_text = ""
     if "pdfs" in request.files:
-        files = request.files.getlist("pdfs")
-        for file in files:
-            if file.filename.lower().endswith(".pdf"):
-                try:
-                    file_bytes = file.read()
-                    reader = PdfReader(io.BytesIO(file_bytes))
-                    for page in reader.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            extracted_text += page_text + "\n"
-                except Exception as e:
-                    return jsonify({"error": f"Error processing {file.filename}: {str(e)}"}), 500
-            else:
-                return jsonify({"error": f"File {file.filename} is not a PDF."}), 400
-
-    if not extracted_text.strip() and not user_request:
-        return jsonify({"error": "No PDFs provided and no user request specified."}), 400
+        try:
+            extracted_text = extract_uploads(request.files.getlist("pdfs"))
+        except PdfExtractionError as e:
+            return jsonify({"error": str(e)}), e.status_code
 
     # 2. Construct GPT prompt with updated system prompt
-    system_prompt = (
-        "You are a helpful AI that generates flashcards. Based on the provided content and user request, create 10 flashcards in JSON format. "
-        "Each flashcard must contain exactly the following keys: 'question', 'topic', and 'difficulty'. "
-        "Ensure the flashcard questions are varied, unique, and effective for student practice, covering as much of the provided PDF content as possible. "
-        "IMPORTANT: Your output must be exactly a valid JSON array that can be decoded using json.loads(). DO NOT include any Markdown formatting, "
-        "such as triple backticks (```), language specifiers, or any extra text. "
-        "The output should look exactly like this (with 10 flashcard objects in the array):\n"
-        "[\n"
-        "  {\n"
-        "    \"question\": \"What is the significance of backpropagation in neural networks?\",\n"
-        "    \"topic\": \"Machine Learning\",\n"
-        "    \"difficulty\": \"Medium\"\n"
-        "  }\n"
-        "]\n"
-        "Output only the JSON array and nothing else."
-    )
-
+    system_prompt = STUDY_SYSTEM_PROMPT
+    prompt_content, error = study_prompt(extracted_text, user_request)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    chats.ensure(chat_id, system_prompt)
+
+    # 3. Call ChatGPT (large documents are generated chunk by chunk, concurrently)
+    if needs_chunking(extracted_text):
+        try:
+            assistant_reply = json.dumps(generate_flashcards_chunked(system_prompt, extracted_text, user_request))
+        except ValueError as e:
+            body, status_code = generation_error(e)
+            return jsonify(body), status_code
+        # Keep a short stand-in for the document in the history rather than the full text
+        prompt_content = chunked_stand_in(extracted_text, user_request, "User Request")
+        chats.append(chat_id, {"role": "user", "content": prompt_content})
+    else:
+        chats.append(chat_id, {"role": "user", "content": prompt_content})
+        assistant_reply = complete(chats.messages(chat_id))
+    chats.append(chat_id, {"role": "assistant", "content": assistant_reply})
 
-    prompt_content = extracted_text if extracted_text.strip() else ""
-    if user_request:
-        prompt_content += f"\n\nUser Request: {user_request}"
-
-    if chat_id not in chats:
-        chats[chat_id] = [{"role": "system", "content": system_prompt}]
-    chats[chat_id].append({"role": "user", "content": prompt_content})
-
-    # 3. Call ChatGPT
-    client = OpenAI(api_key=openai_api_key)
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=chats[chat_id],
-    )
-    assistant_reply = response.choices[0].message.content
-    chats[chat_id].append({"role": "assistant", "content": assistant_reply})
+    # 4. Parse JSON flashcards
+    try:
+        flashcards = parse_flashcard_list(assistant_reply)
+    except (json.JSONDecodeError, ValueError) as e:
+        body, status_code = parse_error(assistant_reply, e)
+        return jsonify(body), status_code
 
-    print("\n============ GPT Reply ============")
-    print(f"""\"\"\"{assistant_reply}\"\"\"""")
-    print("===================================\n")
+    # 5. Embed and insert all flashcards in one batch, then pick one at random to show
+    added = add_flashcards_func(flashcards, owner_id=user_id)
+    body, status_code = study_response(flashcards, added, get_recommended_flashcards(user_id) if flashcards else None)
+    return jsonify(body), status_code
 
-    
 
-    # 4. Parse JSON flashcards
-    try:
-        flashcards = json.loads(assistant_reply)
-        if not isinstance(flashcards, list):
-            raise ValueError("Expected a JSON array of flashcards.")
-
-        # 5. Insert each flashcard into the DB using add_flashcard_func
-        for fc in flashcards:
-            resp, status_code = add_flashcard_func(fc)
-            fc['id'] = resp
-            if status_code != 201:
-                # Optionally log failures here.
-                pass
-
-        # 6. Randomly select one flashcard from the generated list
-        selected_flashcard = random.choice(flashcards) if flashcards else None
-        if not selected_flashcard:
-            return jsonify({"error": "No flashcard generated."}), 500
-
-        resp = get_recommended_flashcards(user_id)
-        print(resp[0])
-
-        return jsonify({
-            "flashcards": flashcards,
-            "selected_flashcard": selected_flashcard,
-            "response": resp[0]["topic"]
-        }), 200
+def question_study_stream():
+    """
+    Streaming variant of /question/study.
+    Expects:
+      - The same multipart/form-data fields as /question/study.
+      - Optional "format": "sse" (default, Server-Sent Events) or "ndjson".
+    The GPT reply is streamed and parsed incrementally; each flashcard is
+    embedded, inserted and sent as soon as its JSON object is complete.
+    Events:
+      - "flashcard": the flashcard, with "id" as in /question/study.
+      - "done": {"selected_flashcard", "response", "flashcards_added"}
+      - "error": {"error", ...}; ends the stream.
+    """
+    error = missing_field(request.form, "chat_id", "user_id")
+    if error:
+        return jsonify(error[0]), error[1]
+    chat_id = request.form["chat_id"]
+    user_id = request.form["user_id"]
+    user_request = request.form.get("user_request", "").strip()
+    fmt = request.form.get("format", "sse")
 
-    except (json.JSONDecodeError, ValueError) as e:
-        return jsonify({
-            "error": "Could not parse JSON flashcards from GPT response.",
-            "raw_reply": assistant_reply,
-            "exception": str(e)
-        }), 500
+    if fmt not in STREAM_MIMETYPES:
+        return jsonify({"error": f"Unknown format: {fmt}. Use 'sse' or 'ndjson'."}), 400
 
+    # 1. Extract PDFs (if provided)
+    extracted_text = ""
+    if "pdfs" in request.files:
+        try:
+            extracted_text = extract_uploads(request.files.getlist("pdfs"))
+        except PdfExtractionError as e:
+            return jsonify({"error": str(e)}), e.status_code
+
+    prompt_content, error = study_prompt(extracted_text, user_request)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    chats.ensure(chat_id, STUDY_SYSTEM_PROMPT)
+
+    def events():
+        flashcards, reply_parts = [], []
+        try:
+            # 2. Generate; large documents go through map-reduce and are sent once merged
+            if needs_chunking(extracted_text):
+                chats.append(chat_id, {"role": "user", "content": chunked_stand_in(extracted_text, user_request, "User Request")})
+                generated = generate_flashcards_chunked(STUDY_SYSTEM_PROMPT, extracted_text, user_request)
+                reply_parts.append(json.dumps(generated))
+            else:
+                chats.append(chat_id, {"role": "user", "content": prompt_content})
+                generated = stream_flashcards(chats.messages(chat_id), reply_parts)
+
+            # 3. Embed, insert and send each flashcard as it arrives
+            for fc in generated:
+                resp, status_code = add_flashcard_func(fc, owner_id=user_id)
+                if status_code != 201:
+                    yield format_event("error", {"error": "Failed to save the generated flashcards."}, fmt)
+                    return
+                fc['id'] = study_flashcard_id(resp, resp["flashcard_id"])
+                flashcards.append(fc)
+                yield format_event("flashcard", fc, fmt)
+        except LLMError as e:
+            yield format_event("error", {"error": str(e)}, fmt)
+            return
+        except (json.JSONDecodeError, ValueError) as e:
+            yield format_event("error", parse_error("".join(reply_parts), e)[0], fmt)
+            return
+        finally:
+            if reply_parts:
+                chats.append(chat_id, {"role": "assistant", "content": "".join(reply_parts)})
+
+        if not flashcards:
+            yield format_event("error", {"error": "No flashcard generated.", "raw_reply": "".join(reply_parts)}, fmt)
+            return
+
+        # 4. Finish with the same summary fields /question/study returns
+        yield format_event("done", {
+            "selected_flashcard": random.choice(flashcards),
+            "response": recommended_topic(get_recommended_flashcards(user_id)),
+            "flashcards_added": len(flashcards)
+        }, fmt)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype=STREAM_MIMETYPES[fmt],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
  
@@ -266,113 +254,33 @@ def question():
           - A "user_id" for personalized recommendations
           - Optional "user_request" field
     Generates flashcards via ChatGPT in JSON format, parses them, and
-    stores each one in MongoDB using add_flashcard_func.
+    stores them in MongoDB in one batch using add_flashcards_func.
     Also recommends a flashcard using Q-learning.
     """
-    chat_id = request.form.get("chat_id", None)
-    user_id = request.form.get("user_id", None)
- 
-    if not chat_id:
-        return jsonify({"error": "Missing chat_id."}), 400
-    if not user_id:
-        return jsonify({"error": "Missing user_id."}), 400
-
-    # 1. Initialize conversation if needed
-    if chat_id not in chats:
-        chats[chat_id] = [
-            {
-                "role": "system",
-                "content": (
-                    "You are a helpful assistant that processes PDF documents and extracts information. "
-                    "Generate 10 flashcards in valid JSON format, with each flashcard containing "
-                    "the keys: question, answer, topic, difficulty. Return ONLY VALID JSON, WHICH CAN BE USED WITH json.loads() e.g.:\n"
-                    "without any Markdown code block formatting. Do NOT include ```json or ```."
-                    "[\n  {\n    \"question\": \"...\",\n   \"topic\": \"...\",\n    \"difficulty\": \"...\"\n  },\n  ...\n]"
-                )
-            }
-        ]
-
+    error = missing_field(request.form, "chat_id", "user_id")
+    if error:
+        return jsonify(error[0]), error[1]
+    chat_id = request.form["chat_id"]
+    user_id = request.form["user_id"]
     user_request = request.form.get("user_request", "").strip()
 
-    # 2. Extract PDFs
-    if "pdfs" not in request.files:
-        return jsonify({"error": "No PDFs uploaded. Include files with key 'pdfs'."}), 400
-
-    files = request.files.getlist("pdfs")
-    if not files:
-        return jsonify({"error": "No PDF files found."}), 400
-
-    extracted_text = "" 
-    for file in files:
-        if file.filename.lower().endswith(".pdf"):
-            try:
-                file_bytes = file.read()
-                reader = PdfReader(io.BytesIO(file_bytes))
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        extracted_text += page_text + "\n"
-            except Exception as e:
-                return jsonify({"error": f"Error processing {file.filename}: {str(e)}"}), 500
-        else:
-            return jsonify({"error": f"File {file.filename} is not a PDF."}), 400
-
-    if not extracted_text.strip():
-        return jsonify({"error": "No text could be extracted from the uploaded PDFs."}), 400
-
-    # Combine PDF text with user request
-    user_content = extracted_text
-    if user_request:
-        user_content += f"\n\nUser request: {user_request}"
-
-    chats[chat_id].append({"role": "user", "content": user_content})
-
-    # 3. Call ChatGPT
-    client = OpenAI(api_key=openai_api_key)
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=chats[chat_id],
-    )
-    assistant_reply = response.choices[0].message.content
-    chats[chat_id].append({"role": "assistant", "content": assistant_reply})
-    
-    # Debug print
-    print("\n============ GPT Reply ============")
-    print(f"""\"\"\"{assistant_reply}\"\"\"""")
-    print("===================================\n")
+    # 1. Extract PDFs
+    files, error = question_uploads(request.files)
+    if error:
+        return jsonify(error[0]), error[1]
 
-    # 4. Parse JSON flashcards
     try:
-        flashcards = json.loads(assistant_reply)
-        if not isinstance(flashcards, list):
-            raise ValueError("Expected a JSON array of flashcards.")
-
-        # 5. Insert each flashcard into the DB using the new function
-        flashcards_added = 0
-        flashcard_ids = []  # Store flashcard IDs
-        for fc in flashcards:
-            resp, status_code = add_flashcard_func(fc)
-            if status_code == 201:
-                flashcards_added += 1
-                flashcard_ids.append(resp["flashcard_id"])  # Store ID
-
-        # 6. Get a recommended flashcard for the user
-        print('here')
-        recommended_flashcard = get_recommended_flashcards(user_id)
-        print(recommended_flashcard)
-
-        return jsonify({
-            "flashcards_added": flashcards_added,
-            "flashcards": flashcards,
-            "recommended_flashcard": recommended_flashcard  # Includes flashcard ID
-        }), 200
+        extracted_text = extract_uploads(files)
+    except PdfExtractionError as e:
+        return jsonify({"error": str(e)}), e.status_code
 
-    except (json.JSONDecodeError, ValueError) as e:
-        return jsonify({
-            "error": "Could not parse JSON flashcards from GPT response.",
-            "raw_reply": assistant_reply,
-            "exception": str(e)
-        }), 500
+    error = no_text_error(extracted_text)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    # 2. Generate, store and recommend (shared with the background job in controllers/jobs_controller.py)
+    body, status_code = generate_question_flashcards(chat_id, user_id, extracted_text, user_request, chats=chats)
+    return jsonify(body), status_code
 
 def answer():
     """
@@ -384,6 +292,7 @@ def answer():
       - 'answer' provided by the user.
 
     GPT will determine if the answer is correct (no need for a separate correct answer input).
+    Cached verdicts and cards the local grader can decide (api/grading.py) skip the GPT call.
     Updates Q-learning table with:
       - "correct" or "incorrect" as action.
       - A fixed reward of 10.
@@ -391,6 +300,7 @@ def answer():
     Returns JSON:
       - If correct: {"correct": true, "correct_answer": "Good job!"}
       - If incorrect: {"correct": false, "correct_answer": "... explanation ..."}
+      - 400 when user_id or flashcard_id is missing (or user_id isn't an ObjectId)
     """
 
     chat_id = request.form.get("chat_id", None)
@@ -399,91 +309,67 @@ def answer():
     question_text = request.form.get("question", "").strip()
     user_answer = request.form.get("answer", "").strip()
 
-    print("CHAT_ID", chat_id)
-    print("USER_ID", user_id)
-    print("FLASHCARD_ID", flashcard_id)
-    print("QUESTION_TEXT", question_text)
-    print("CHAT_ID", user_answer)
-
-
-    # if not chat_id:
-    #     return jsonify({"error": "Missing chat_id."}), 400
-    # if not user_id:
-    #     return jsonify({"error": "Missing user_id."}), 400
-    # if not flashcard_id:
-    #     return jsonify({"error": "Missing flashcard_id."}), 400
+    # The Q-table update needs both ids; check them before grading, not after
+    error = answer_ids_error(request.form)
+    if error:
+        body, status_code = error
+        return jsonify(body), status_code
     # if not question_text:
     #     return jsonify({"error": "Missing question."}), 400
     # if not user_answer:
     #     return jsonify({"error": "Missing answer."}), 400
 
     # Ensure chat context exists
-    print(chats)
-    if chat_id not in chats:
-        return jsonify({"error": "Invalid chat_id. No previous conversation found."}), 400
-
-    # GPT Validation Prompt
-    verification_prompt = {
-        "role": "system",
-        "content": (
-            "You are an AI assistant that checks whether a given answer is correct for a given question."
-            "Analyze the provided answer based on the context of the question."
-            "Return JSON ONLY with:"
-            " - 'correct': true or false"
-            " - 'correct_answer': If incorrect, provide an explanation. If correct, say 'Good job!'"
-            "Do NOT include any markdown formatting or extra text."
-            "VALID JSON USABLE WITH json.loads()"
-        )
-    }
-
-    chats[chat_id].append({
-        "role": "user",
-        "content": f"Question: {question_text}\nUser Answer: {user_answer}"
-    })
-
-    # Call ChatGPT to verify the answer
-    client = OpenAI(api_key=openai_api_key)
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[verification_prompt] + chats[chat_id],
-    )
-
-    assistant_reply = response.choices[0].message.content
-    chats[chat_id].append({"role": "assistant", "content": assistant_reply})
-
-    # Debug print
-    print("\n============ Answer Check ============")
-    print(f"""\"\"\"{assistant_reply}\"\"\"""")
-    print("===================================\n")
+    if not chats.exists(chat_id):
+        body, status_code = unknown_chat_error()
+        return jsonify(body), status_code
+
+    chats.append(chat_id, answer_message(question_text, user_answer))
+
+    # Reuse the verdict if this answer to this flashcard has been graded before
+    key = grading_key(flashcard_id, question_text, user_answer)
+    answer_feedback = grading_cache.get(key)
+    if answer_feedback is None:
+        # Objective cards and clear-cut free-text answers are graded locally, without the LLM
+        answer_feedback = local_grader.grade(get_flashcard_for_grading(flashcard_id), user_answer)
+        if answer_feedback is not None:
+            grading_cache.put(key, answer_feedback)
+
+    if answer_feedback is not None:
+        assistant_reply = json.dumps(answer_feedback)
+    else:
+        # Call ChatGPT to verify the answer
+        assistant_reply = complete([VERIFICATION_PROMPT] + chats.messages(chat_id))
+    chats.append(chat_id, {"role": "assistant", "content": assistant_reply})
 
     # Parse GPT response
-    try:
-        answer_feedback = json.loads(assistant_reply)
+    if answer_feedback is None:
+        try:
+            answer_feedback = parse_verdict(assistant_reply)
+        except (json.JSONDecodeError, ValueError) as e:
+            body, status_code = parse_error(assistant_reply, e, "Could not parse the answer validation response.")
+            return jsonify(body), status_code
+        grading_cache.put(key, answer_feedback)
 
-        if "correct" not in answer_feedback:
-            raise ValueError("Invalid JSON response from GPT.")
+    # Determine Q-learning action (runs on cache hits too) and update the Q-table with reward = 10
+    update_q_table(user_id, flashcard_id, verdict_action(answer_feedback), reward=10)
 
-        # Determine Q-learning action
-        action = "correct" if answer_feedback["correct"] else "incorrect"
+    return jsonify(answer_feedback), 200
 
-        # Update Q-table with reward = 10
-        update_q_table(user_id, flashcard_id, action, reward=10)
 
-        return jsonify(answer_feedback), 200
+# Apply the declared indexes without holding up startup (see utils/indexes.py)
+if ENSURE_INDEXES_ON_STARTUP:
+    ensure_indexes_in_background(db)
 
-    except (json.JSONDecodeError, ValueError) as e:
-        return jsonify({
-            "error": "Could not parse the answer validation response.",
-            "raw_reply": assistant_reply,
-            "exception": str(e)
-        }), 500
+# The embedding model loads lazily on first use; set EMBEDDING_WARMUP=1 to load it at startup instead
+if os.getenv("EMBEDDING_WARMUP", "0") == "1":
+    warm_up()
 
+# In-process workers for /jobs, only with JOB_WORKERS_IN_APP=1 (otherwise run worker.py)
+start_job_workers()
 
-try:
-    db.command('ping')
-    print("Successfully connected to the database")
-except Exception as e:
-    print("Failed to connect to the database:", e)
+# Prometheus metrics
+app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
 
 # Register routes from user_controller
 app.add_url_rule('/users/register', 'register_user', register_user, methods=['POST'])
@@ -502,15 +388,24 @@ app.add_url_rule('/flashcards/similar', 'find_similar_flashcards', find_similar_
 
 app.add_url_rule('/question/review', 'question_review', question_review, methods=['POST'])
 app.add_url_rule('/question/study', 'question_study', question_study, methods=['POST'])
+app.add_url_rule('/question/study/stream', 'question_study_stream', question_study_stream, methods=['POST'])
 app.add_url_rule('/question', 'question', question, methods=['POST'])
 app.add_url_rule('/answer', 'answer', answer, methods=['POST'])
 
+# Register routes from jobs_controller
+app.add_url_rule('/jobs/question', 'submit_question_job', submit_question_job, methods=['POST'])
+app.add_url_rule('/jobs/<job_id>', 'get_job', get_job, methods=['GET'])
+app.add_url_rule('/jobs/<job_id>/result', 'get_job_result', get_job_result, methods=['GET'])
+app.add_url_rule('/jobs/<job_id>/cancel', 'cancel_job', cancel_job, methods=['POST'])
+app.add_url_rule('/jobs/<job_id>', 'cancel_job_delete', cancel_job, methods=['DELETE'])
+
 # Register routes from performance_controller
 app.add_url_rule('/performance/<user_id>', 'get_performance', get_performance, methods=['GET'])
 app.add_url_rule('/performance/<user_id>', 'add_update_performance', add_update_performance, methods=['POST', 'PUT'])
 app.add_url_rule('/performance/<user_id>', 'delete_performance', delete_performance, methods=['DELETE'])
 app.add_url_rule('/performance/<user_id>/q_table', 'get_q_table', get_q_table, methods=['GET'])
 app.add_url_rule('/performance/<user_id>/log', 'log_user_performance', log_user_performance, methods=['GET'])
+app.add_url_rule('/performance/<user_id>/similar', 'get_similar_flashcards', get_similar_flashcards, methods=['GET'])
 # app.add_url_rule('/performance/<user_id>/recommendations', 'get_recommended_flashcards', get_recommended_flashcards, methods=['GET'])
 
 # Register routes from class_controller
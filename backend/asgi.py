@@ -0,0 +1,315 @@
+"""
+Async serving mode for the LLM-bound endpoints.
+
+/question, /question/study, /question/review and /answer spend nearly all of
+their time waiting on GPT. Here they are served by a Quart app whose handlers
+await the LLM (api.llm.acomplete), Mongo (motor) and the executor that runs PDF
+parsing and embeddings, so one worker holds many generations in flight instead
+of one per sync worker. Every other route is passed through to the Flask app
+unchanged.
+
+Run with:
+    hypercorn asgi:application --bind 0.0.0.0:5000
+"""
+
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from bson.objectid import ObjectId
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart import Quart, request, jsonify
+
+from app import app as flask_app, chats
+from api.llm import acomplete, LLMError
+from api.flashcard_generation import agenerate_flashcards_chunked, needs_chunking, strip_code_fences
+from api.grading import local_grader
+from api.handlers import (missing_field, answer_ids_error, study_prompt, question_uploads, no_text_error, question_prompt, generation_error,
+                          parse_error, parse_flashcard_list, parse_review_flashcard, review_response, study_response,
+                          question_response, unknown_chat_error, answer_message, parse_verdict, verdict_action)
+from api.prompts import REVIEW_SYSTEM_PROMPT, STUDY_SYSTEM_PROMPT, QUESTION_SYSTEM_PROMPT, VERIFICATION_PROMPT, format_recommendations, chunked_stand_in
+from controllers.flashcards_controller import prepare_flashcard_docs, flashcards_added_response, GRADING_PROJECTION
+from controllers.performance_controller import (q_update_pipeline, answer_event, parse_reward, RECOMMENDATION_COUNT,
+                                                RECORD_ANSWER_HISTORY)
+from utils.async_db import get_async_collection, close_async_db
+from utils.grading_cache import grading_cache, grading_key
+from utils.pdf_extraction import extract_uploads, PdfExtractionError, MAX_PDF_BYTES
+from utils.recommendation_cache import recommendation_cache
+from utils.vector_search import index_flashcards
+
+# Threads for blocking work (PDF parsing, embeddings, the conversation store) awaited by the handlers
+ASGI_EXECUTOR_WORKERS = int(os.getenv("ASGI_EXECUTOR_WORKERS", "32"))
+
+quart_app = Quart(__name__)
+# Same cap as the Flask fallthrough (max_body_size below), so uploads are never buffered past MAX_PDF_BYTES
+quart_app.config["MAX_CONTENT_LENGTH"] = MAX_PDF_BYTES
+
+
+@quart_app.before_serving
+async def start_executor():
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=ASGI_EXECUTOR_WORKERS))
+
+
+@quart_app.after_serving
+async def close_connections():
+    close_async_db()
+
+
+@quart_app.after_request
+async def add_cors_headers(response):
+    # Same policy flask_cors applies to the Flask routes
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
+@quart_app.errorhandler(LLMError)
+async def handle_llm_error(e):
+    return jsonify({"error": str(e)}), e.status_code
+
+
+async def run_sync(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args, **kwargs))
+
+
+# Async counterparts of the Mongo helpers used by the Flask handlers
+async def get_recommended_flashcards(user_id):
+    cached, epoch = recommendation_cache.get(user_id)
+    if cached is not None:
+        return cached
+    try:
+        ranked = get_async_collection("card_performance").find(
+            {"user_id": ObjectId(user_id)}, {"flashcard_id": 1}
+        ).sort("score", 1).limit(RECOMMENDATION_COUNT)
+        valid_ids = [ObjectId(doc["flashcard_id"]) async for doc in ranked if ObjectId.is_valid(doc["flashcard_id"])]
+
+        cursor = get_async_collection("flashcards").find({"_id": {"$in": valid_ids}}, {"_id": 1, "question": 1, "topic": 1})
+        results = await cursor.to_list(length=None)
+        for result in results:
+            result['_id'] = str(result['_id'])
+        recommendation_cache.put(user_id, results, epoch)
+        return results
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async def update_q_table(user_id, flashcard_id, action, reward):
+    if not flashcard_id:
+        raise ValueError("Missing flashcard_id.")
+    reward = parse_reward(reward)
+    await get_async_collection("card_performance").update_one(
+        {"user_id": ObjectId(user_id), "flashcard_id": str(flashcard_id)}, q_update_pipeline(action, reward), upsert=True
+    )
+    recommendation_cache.invalidate(user_id)
+    if RECORD_ANSWER_HISTORY:
+        await get_async_collection("answer_history").insert_one(answer_event(user_id, flashcard_id, action, reward))
+
+
+async def add_flashcards(flashcards, owner_id=None):
+    # Embeddings run on the executor; the insert is awaited on motor
+    if not flashcards:
+        return {"message": "No flashcards to add", "flashcard_ids": []}, 201
+    docs, embeddings = await run_sync(prepare_flashcard_docs, flashcards, owner_id=owner_id)
+    result = await get_async_collection("flashcards").insert_many(docs, ordered=True)
+    await run_sync(index_flashcards, result.inserted_ids, embeddings)
+    return flashcards_added_response(result.inserted_ids), 201
+
+
+async def generate_flashcards(chat_id, system_prompt, extracted_text, user_content, user_request, label="User request"):
+    """Call GPT for a flashcard set, chunk by chunk for large documents, and record the turn in the chat."""
+    if needs_chunking(extracted_text):
+        assistant_reply = json.dumps(await agenerate_flashcards_chunked(system_prompt, extracted_text, user_request))
+        await run_sync(chats.append, chat_id, {"role": "user", "content": chunked_stand_in(extracted_text, user_request, label)})
+    else:
+        await run_sync(chats.append, chat_id, {"role": "user", "content": user_content})
+        assistant_reply = await acomplete(await run_sync(chats.messages, chat_id))
+    await run_sync(chats.append, chat_id, {"role": "assistant", "content": assistant_reply})
+    return assistant_reply
+
+
+@quart_app.route('/question/review', methods=['POST'])
+async def question_review():
+    """Async /question/review; same request and response as app.question_review."""
+    form = await request.form
+    error = missing_field(form, "chat_id", "user_id")
+    if error:
+        return jsonify(error[0]), error[1]
+    chat_id, user_id = form["chat_id"], form["user_id"]
+
+    recommended_flashcards = await get_recommended_flashcards(user_id)
+    if not recommended_flashcards:
+        return jsonify({"error": "No recommended flashcards found for this user."}), 400
+
+    await run_sync(chats.ensure, chat_id, REVIEW_SYSTEM_PROMPT)
+    await run_sync(chats.append, chat_id, {"role": "user", "content": format_recommendations(recommended_flashcards)})
+
+    assistant_reply = strip_code_fences(await acomplete(await run_sync(chats.messages, chat_id)))
+
+    try:
+        new_flashcard = parse_review_flashcard(assistant_reply)
+    except (json.JSONDecodeError, ValueError) as e:
+        body, status_code = parse_error(assistant_reply, e, "Could not parse the generated flashcard JSON.")
+        return jsonify(body), status_code
+
+    body, status_code = review_response(recommended_flashcards, new_flashcard,
+                                        await add_flashcards([new_flashcard], owner_id=user_id))
+    return jsonify(body), status_code
+
+
+@quart_app.route('/question/study', methods=['POST'])
+async def question_study():
+    """Async /question/study; same request and response as app.question_study."""
+    form = await request.form
+    files = await request.files
+    error = missing_field(form, "chat_id", "user_id")
+    if error:
+        return jsonify(error[0]), error[1]
+    chat_id, user_id = form["chat_id"], form["user_id"]
+    user_request = form.get("user_request", "").strip()
+
+    extracted_text = ""
+    if "pdfs" in files:
+        try:
+            extracted_text = await run_sync(extract_uploads, files.getlist("pdfs"))
+        except PdfExtractionError as e:
+            return jsonify({"error": str(e)}), e.status_code
+
+    prompt_content, error = study_prompt(extracted_text, user_request)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    await run_sync(chats.ensure, chat_id, STUDY_SYSTEM_PROMPT)
+    try:
+        assistant_reply = await generate_flashcards(chat_id, STUDY_SYSTEM_PROMPT, extracted_text, prompt_content, user_request, "User Request")
+    except ValueError as e:
+        body, status_code = generation_error(e)
+        return jsonify(body), status_code
+
+    try:
+        flashcards = parse_flashcard_list(assistant_reply)
+    except (json.JSONDecodeError, ValueError) as e:
+        body, status_code = parse_error(assistant_reply, e)
+        return jsonify(body), status_code
+
+    added = await add_flashcards(flashcards, owner_id=user_id)
+    recommended_flashcards = await get_recommended_flashcards(user_id) if flashcards else None
+    body, status_code = study_response(flashcards, added, recommended_flashcards)
+    return jsonify(body), status_code
+
+
+@quart_app.route('/question', methods=['POST'])
+async def question():
+    """Async /question; same request and response as app.question."""
+    form = await request.form
+    files = await request.files
+    error = missing_field(form, "chat_id", "user_id")
+    if error:
+        return jsonify(error[0]), error[1]
+    chat_id, user_id = form["chat_id"], form["user_id"]
+    user_request = form.get("user_request", "").strip()
+
+    uploads, error = question_uploads(files)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    try:
+        extracted_text = await run_sync(extract_uploads, uploads)
+    except PdfExtractionError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+    error = no_text_error(extracted_text)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    await run_sync(chats.ensure, chat_id, QUESTION_SYSTEM_PROMPT)
+    system_prompt = await run_sync(chats.system_prompt, chat_id)
+    user_content = question_prompt(extracted_text, user_request)
+    try:
+        assistant_reply = await generate_flashcards(chat_id, system_prompt, extracted_text, user_content, user_request)
+    except ValueError as e:
+        body, status_code = generation_error(e)
+        return jsonify(body), status_code
+
+    try:
+        flashcards = parse_flashcard_list(assistant_reply)
+    except (json.JSONDecodeError, ValueError) as e:
+        body, status_code = parse_error(assistant_reply, e)
+        return jsonify(body), status_code
+
+    added = await add_flashcards(flashcards, owner_id=user_id)
+    body, status_code = question_response(flashcards, added, await get_recommended_flashcards(user_id))
+    return jsonify(body), status_code
+
+
+@quart_app.route('/answer', methods=['POST'])
+async def answer():
+    """Async /answer; same request and response as app.answer."""
+    form = await request.form
+    chat_id = form.get("chat_id", None)
+    user_id = form.get("user_id", None)
+    flashcard_id = form.get("flashcard_id", None)
+    question_text = form.get("question", "").strip()
+    user_answer = form.get("answer", "").strip()
+
+    error = answer_ids_error(form)
+    if error:
+        body, status_code = error
+        return jsonify(body), status_code
+
+    if not await run_sync(chats.exists, chat_id):
+        body, status_code = unknown_chat_error()
+        return jsonify(body), status_code
+
+    await run_sync(chats.append, chat_id, answer_message(question_text, user_answer))
+
+    key = grading_key(flashcard_id, question_text, user_answer)
+    answer_feedback = await run_sync(grading_cache.get, key)
+    if answer_feedback is None:
+        flashcard = None
+        if flashcard_id and ObjectId.is_valid(flashcard_id):
+            flashcard = await get_async_collection("flashcards").find_one({"_id": ObjectId(flashcard_id)}, GRADING_PROJECTION)
+        answer_feedback = await run_sync(local_grader.grade, flashcard, user_answer)
+        if answer_feedback is not None:
+            await run_sync(grading_cache.put, key, answer_feedback)
+
+    if answer_feedback is not None:
+        assistant_reply = json.dumps(answer_feedback)
+    else:
+        assistant_reply = await acomplete([VERIFICATION_PROMPT] + await run_sync(chats.messages, chat_id))
+    await run_sync(chats.append, chat_id, {"role": "assistant", "content": assistant_reply})
+
+    if answer_feedback is None:
+        try:
+            answer_feedback = parse_verdict(assistant_reply)
+        except (json.JSONDecodeError, ValueError) as e:
+            body, status_code = parse_error(assistant_reply, e, "Could not parse the answer validation response.")
+            return jsonify(body), status_code
+        await run_sync(grading_cache.put, key, answer_feedback)
+
+    await update_q_table(user_id, flashcard_id, verdict_action(answer_feedback), reward=10)
+
+    return jsonify(answer_feedback), 200
+
+
+# Requests the async app serves; everything else (including CORS preflights) goes to Flask
+ASYNC_ROUTES = {
+    ("POST", "/question"),
+    ("POST", "/question/study"),
+    ("POST", "/question/review"),
+    ("POST", "/answer"),
+}
+
+flask_asgi = AsyncioWSGIMiddleware(flask_app, max_body_size=MAX_PDF_BYTES)
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan" or (
+        scope["type"] == "http" and (scope["method"], scope["path"].rstrip("/") or "/") in ASYNC_ROUTES
+    ):
+        await quart_app(scope, receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
+
+
+__all__ = ['application', 'quart_app']
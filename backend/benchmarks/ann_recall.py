@@ -0,0 +1,99 @@
+"""
+Recall-vs-exact benchmark for the IVF flashcard index.
+
+Builds an IVFIndex and an exact FlatIndex over the same vectors, runs the same
+queries through both and reports recall@k and latency for every
+(nlist, num_candidates) combination, so parameters can be picked from data.
+
+Usage (from the backend directory):
+    python -m benchmarks.ann_recall --size 200000
+    python -m benchmarks.ann_recall --from-db --nlist 256 1024 --num-candidates 100 400 1600
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from utils.ann_index import FlatIndex, IVFIndex
+
+
+def synthetic_vectors(size, dimensions, clusters, seed):
+    # Clustered data behaves like real embeddings; uniform noise is a pessimistic worst case
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions))
+    labels = rng.integers(0, clusters, size)
+    return (centers[labels] + 0.5 * rng.normal(size=(size, dimensions))).astype(np.float32)
+
+
+def db_vectors():
+    from utils.vector_search import to_float32
+    from utils.db import flashcard_collection
+    from utils.quantization import full_precision_field
+
+    field = full_precision_field()
+    vectors = [
+        to_float32(doc[field])
+        for doc in flashcard_collection.find({field: {"$exists": True}}, {field: 1})
+    ]
+    return np.vstack(vectors)
+
+
+def timed_search(index, queries, top_k, num_candidates=None):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ids, _ = index.search(query, top_k, num_candidates)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(set(ids))
+    return results, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100_000, help="number of synthetic vectors")
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=500, help="clusters in the synthetic data")
+    parser.add_argument("--from-db", action="store_true", help="use the flashcard embeddings in MongoDB")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, nargs="+", default=[0], help="IVF cells (0 = 4 * sqrt(n))")
+    parser.add_argument("--num-candidates", type=int, nargs="+", default=[50, 100, 200, 400, 800, 1600])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.from_db:
+        vectors = db_vectors()
+    else:
+        vectors = synthetic_vectors(args.size, args.dimensions, args.clusters, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    # Held-out style queries: perturbed copies of random corpus vectors
+    queries = vectors[rng.choice(len(vectors), args.queries)] + 0.1 * rng.normal(size=(args.queries, vectors.shape[1]))
+    ids = list(range(len(vectors)))
+
+    exact = FlatIndex(vectors.shape[1], capacity=len(vectors))
+    exact.add(ids, vectors)
+    truth, exact_ms = timed_search(exact, queries, args.top_k)
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {args.queries} queries, top_k={args.top_k}")
+    print(f"exact scan: mean {exact_ms.mean():.2f} ms, p99 {np.percentile(exact_ms, 99):.2f} ms\n")
+
+    print(f"{'nlist':>7} {'num_cand':>9} {'nprobe':>7} {'recall':>7} {'mean ms':>8} {'p99 ms':>8} {'speedup':>8}")
+    for nlist in args.nlist:
+        ivf = IVFIndex(vectors.shape[1], nlist=nlist or None, capacity=len(vectors))
+        ivf.add(ids, vectors)
+        start = time.perf_counter()
+        ivf.train()
+        build_seconds = time.perf_counter() - start
+        for num_candidates in args.num_candidates:
+            found, ivf_ms = timed_search(ivf, queries, args.top_k, num_candidates)
+            recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth) if t])
+            print(
+                f"{len(ivf.centroids):>7} {num_candidates:>9} {ivf.nprobe_for(num_candidates):>7} "
+                f"{recall:>7.3f} {ivf_ms.mean():>8.2f} {np.percentile(ivf_ms, 99):>8.2f} "
+                f"{exact_ms.mean() / ivf_ms.mean():>7.1f}x"
+            )
+        print(f"{'':>7} (trained in {build_seconds:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""
+End-to-end latency benchmark for the Flask routes, with local stand-ins for
+OpenAI and MongoDB.
+
+Runs the app in-process through Flask's test client, against:
+  - a deterministic FakeLLM (api/llm.py) with configurable latency, replying
+    with canned flashcard JSON or a canned verdict for /answer,
+  - mongomock (default) or a local mongod given with --mongo-uri,
+  - a hash-based stand-in for the embedding model (or the real model with
+    --real-embeddings),
+and reports p50/p99 latency, throughput and peak RSS for every route at each
+(corpus size, Q-table size) combination. With --baseline, routes whose p50/p99
+got slower (or throughput lower) than the tolerance allows are flagged and the
+exit status is 1, so it can gate CI.
+
+Usage (from the backend directory):
+    python -m benchmarks.e2e
+    python -m benchmarks.e2e --corpus-sizes 1000 10000 --qtable-sizes 100 1000 --save-baseline
+    python -m benchmarks.e2e --baseline benchmarks/e2e_baseline.json --tolerance 0.25
+    python -m benchmarks.e2e --mongo-uri mongodb://localhost:27017 --routes answer flashcards_similar
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+from bson.objectid import ObjectId
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), "e2e_baseline.json")
+BENCH_USER_ID = "65f000000000000000000001"
+ANSWER_CHAT_ID = "bench-answer"
+CARDS_PER_REPLY = 10
+
+VERDICT_REPLY = json.dumps({"correct": False, "correct_answer": "Benchmark verdict."})
+
+
+def make_pdf(lines):
+    """A minimal one-page PDF with the given lines of text, so /question runs the real PyPDF2 extraction."""
+    def escape(text):
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    content = "BT /F1 10 Tf 40 760 Td 12 TL " + " ".join(f"({escape(line)}) Tj T*" for line in lines) + " ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content.encode("latin-1")),
+    ]
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+class HashEmbedder:
+    """Stand-in for the SentenceTransformer: unit vectors seeded from a hash of the text."""
+
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+
+    def encode(self, texts, precision="float32", batch_size=32, **kwargs):
+        single = isinstance(texts, str)
+        vectors = []
+        for text in [texts] if single else texts:
+            seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dimensions).astype(np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return vectors[0] if single else np.vstack(vectors)
+
+
+class CannedReplies:
+    """FakeLLM reply function: a verdict for grading prompts, otherwise a JSON array of fresh flashcards."""
+
+    def __init__(self, cards_per_reply=CARDS_PER_REPLY):
+        self.cards_per_reply = cards_per_reply
+        self.count = 0
+
+    def __call__(self, messages):
+        from api.prompts import VERIFICATION_PROMPT
+
+        if messages and messages[0]["content"] == VERIFICATION_PROMPT["content"]:
+            return VERDICT_REPLY
+        self.count += 1
+        return json.dumps([
+            {
+                "question": f"Benchmark question {self.count}-{i}: what does term {i} mean?",
+                "answer": f"Definition number {i} from reply {self.count}",
+                "topic": f"Topic {i % 7}",
+                "difficulty": ("Easy", "Medium", "Hard")[i % 3],
+            }
+            for i in range(self.cards_per_reply)
+        ])
+
+
+def configure_environment(args, workdir):
+    """Environment for the stand-ins; must run before any app module is imported."""
+    os.environ["VECTOR_SEARCH_BACKEND"] = args.vector_backend
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.sqlite3")
+    os.environ["PDF_CACHE_PATH"] = os.path.join(workdir, "pdf_cache.sqlite3")
+    os.environ["VECTOR_INDEX_PATH"] = os.path.join(workdir, "flashcard_ivf_index.npz")
+    os.environ["JOB_QUEUE_PATH"] = os.path.join(workdir, "jobs.sqlite3")
+    os.environ["JOB_WORKERS_IN_APP"] = "0"
+    os.environ["CONVERSATION_STORE"] = "memory"
+    os.environ["EMBEDDING_WARMUP"] = "0"
+
+    if args.mongo_uri:
+        host = urlparse(args.mongo_uri).hostname
+        if host not in ("localhost", "127.0.0.1", "::1") and not args.allow_remote_mongo:
+            sys.exit(f"Refusing to benchmark against {host}: the benchmark drops and reseeds collections. "
+                     "Use a local mongod, or pass --allow-remote-mongo for a disposable cluster.")
+        os.environ["MONGO_URI"] = args.mongo_uri
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("mongomock is required without --mongo-uri (pip install mongomock).")
+        import pymongo
+
+        # utils/db.py builds its client from pymongo.MongoClient at import
+        pymongo.MongoClient = mongomock.MongoClient
+
+
+def seed(corpus_size, qtable_size, rng):
+    """Replace the benchmark data with corpus_size flashcards and a qtable_size-card Q-table for the bench user."""
+    from controllers.flashcards_controller import build_flashcard_doc, get_embeddings, flashcard_text
+    from controllers.performance_controller import card_performance_doc
+    from utils.db import (flashcard_collection, card_performance_collection, performance_collection,
+                          answer_history_collection)
+    from utils.vector_search import get_vector_search
+    from utils.recommendation_cache import recommendation_cache
+    from utils.grading_cache import grading_cache
+    from utils.conversation_store import conversation_store
+    from api.prompts import STUDY_SYSTEM_PROMPT
+
+    for collection in (flashcard_collection, card_performance_collection, performance_collection, answer_history_collection):
+        collection.delete_many({})
+
+    flashcards = [
+        {
+            "question": f"Seed question {i} about concept {i % 97}?",
+            "answer": f"Seed answer {i}",
+            "topic": f"Topic {i % 23}",
+            "difficulty": ("Easy", "Medium", "Hard")[i % 3],
+        }
+        for i in range(corpus_size)
+    ]
+    ids = []
+    for start in range(0, corpus_size, 1000):
+        batch = flashcards[start:start + 1000]
+        embeddings = get_embeddings([flashcard_text(card) for card in batch])
+        result = flashcard_collection.insert_many([build_flashcard_doc(card, e) for card, e in zip(batch, embeddings)])
+        ids.extend(str(i) for i in result.inserted_ids)
+
+    q_ids = rng.choice(len(ids), size=min(qtable_size, len(ids)), replace=False) if ids else []
+    docs = [
+        card_performance_doc(BENCH_USER_ID, ids[i], {"correct": float(rng.normal()), "incorrect": float(rng.normal())})
+        for i in q_ids
+    ]
+    if docs:
+        card_performance_collection.insert_many(docs)
+    performance_collection.insert_one({"user_id": ObjectId(BENCH_USER_ID), "performance": {"score": 0, "attempts": 0}})
+
+    index = get_vector_search()
+    if hasattr(index, "load"):
+        index.load()
+    recommendation_cache.clear()
+    grading_cache.clear()
+    # /answer only grades within an existing study conversation
+    conversation_store.ensure(ANSWER_CHAT_ID, STUDY_SYSTEM_PROMPT)
+    return ids
+
+
+def route_requests(pdf_bytes, flashcard_ids, rng):
+    """Route name -> callable(client, i) issuing one request; each returns the response."""
+    import io
+
+    def pick_flashcard():
+        return flashcard_ids[int(rng.integers(len(flashcard_ids)))]
+
+    def question(client, i):
+        return client.post("/question", data={
+            "chat_id": f"bench-question-{i}", "user_id": BENCH_USER_ID,
+            "pdfs": (io.BytesIO(pdf_bytes), "bench.pdf"),
+        }, content_type="multipart/form-data")
+
+    def question_study(client, i):
+        return client.post("/question/study", data={
+            "chat_id": f"bench-study-{i}", "user_id": BENCH_USER_ID, "user_request": "multiple choice on topic 3",
+        })
+
+    def question_review(client, i):
+        return client.post("/question/review", data={"chat_id": f"bench-review-{i}", "user_id": BENCH_USER_ID})
+
+    def answer(client, i):
+        # A fresh answer each time, so the grading cache doesn't turn this into a dictionary lookup
+        return client.post("/answer", data={
+            "chat_id": ANSWER_CHAT_ID, "user_id": BENCH_USER_ID, "flashcard_id": pick_flashcard(),
+            "question": "Benchmark question?", "answer": f"benchmark answer {i}",
+        })
+
+    def flashcards_similar(client, i):
+        return client.get("/flashcards/similar", json={"query": f"concept {i % 97}", "top_k": 5})
+
+    def flashcards_list(client, i):
+        return client.get("/flashcards", query_string={"limit": 100, "topic": f"Topic {i % 23}"})
+
+    def performance_get(client, i):
+        return client.get(f"/performance/{BENCH_USER_ID}")
+
+    def performance_q_table(client, i):
+        return client.get(f"/performance/{BENCH_USER_ID}/q_table")
+
+    def performance_log(client, i):
+        return client.get(f"/performance/{BENCH_USER_ID}/log", json={
+            "flashcard_id": pick_flashcard(), "action": ("correct", "incorrect")[i % 2], "reward": (10, -10)[i % 2],
+        })
+
+    def performance_similar(client, i):
+        return client.get(f"/performance/{BENCH_USER_ID}/similar")
+
+    return {
+        "question": question,
+        "question_study": question_study,
+        "question_review": question_review,
+        "answer": answer,
+        "flashcards_similar": flashcards_similar,
+        "flashcards_list": flashcards_list,
+        "performance_get": performance_get,
+        "performance_q_table": performance_q_table,
+        "performance_log": performance_log,
+        "performance_similar": performance_similar,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_route(client, send, requests, warmup):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(warmup):
+            send(client, -1 - i)
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        for i in range(requests):
+            request_start = time.perf_counter()
+            response = send(client, i)
+            latencies.append((time.perf_counter() - request_start) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+        elapsed = time.perf_counter() - start
+    latencies = np.array(latencies)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "throughput_rps": requests / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against the baseline as readable strings; missing entries are skipped."""
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{key} {metric}: {previous[metric]:.2f} -> {result[metric]:.2f}")
+        if result["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{key} throughput_rps: {previous['throughput_rps']:.1f} -> {result['throughput_rps']:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[1000, 10000], help="flashcards in the collection")
+    parser.add_argument("--qtable-sizes", type=int, nargs="+", default=[100, 1000], help="cards in the bench user's Q-table")
+    parser.add_argument("--routes", nargs="+", help="only run these routes (default: all)")
+    parser.add_argument("--requests", type=int, default=50, help="timed requests per route and size")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--vector-backend", default="local", help="VECTOR_SEARCH_BACKEND (atlas needs a real cluster)")
+    parser.add_argument("--mongo-uri", help="local mongod to use instead of mongomock")
+    parser.add_argument("--allow-remote-mongo", action="store_true")
+    parser.add_argument("--real-embeddings", action="store_true", help="load the real embedding model")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", nargs="?", const=DEFAULT_BASELINE_PATH, help="compare against this baseline")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE_PATH, help="store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before flagging")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="e2e-bench-")
+    configure_environment(args, workdir)
+
+    import utils.embedding_model as embedding_model
+    from utils.vector_search import EMBEDDING_DIMENSIONS
+    from api.llm import FakeLLM, set_backend
+
+    if not args.real_embeddings:
+        # get_model() returns the already-loaded model
+        embedding_model._model = HashEmbedder(EMBEDDING_DIMENSIONS)
+    set_backend(FakeLLM(CannedReplies(), latency=args.llm_latency))
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        from app import app
+    # Failing routes are counted in "errors"; their tracebacks would drown the report
+    app.logger.setLevel(logging.CRITICAL)
+    client = app.test_client()
+
+    rng = np.random.default_rng(args.seed)
+    pdf_bytes = make_pdf([f"Line {i}: the mitochondria is the powerhouse of the cell, fact {i}." for i in range(40)])
+    results = {}
+    for corpus_size in args.corpus_sizes:
+        for qtable_size in args.qtable_sizes:
+            flashcard_ids = seed(corpus_size, qtable_size, rng)
+            routes = route_requests(pdf_bytes, flashcard_ids, rng)
+            for name in args.routes or routes:
+                if name not in routes:
+                    sys.exit(f"Unknown route: {name} (choose from {', '.join(routes)})")
+                key = f"{name}@corpus={corpus_size},qtable={qtable_size}"
+                results[key] = run_route(client, routes[name], args.requests, args.warmup)
+                r = results[key]
+                print(f"{key:<55} p50 {r['p50_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms  "
+                      f"{r['throughput_rps']:8.1f} req/s  rss {r['peak_rss_mb']:7.1f} MB  errors {r['errors']}")
+
+    report = {"llm_latency": args.llm_latency, "mongo": "local" if args.mongo_uri else "mongomock", "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("llm_latency") != args.llm_latency or baseline.get("mongo") != report["mongo"]:
+            print("Warning: baseline was recorded with a different LLM latency or Mongo backend")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,105 @@
+import json
 from bson.objectid import ObjectId
-from flask import jsonify, request
-from sentence_transformers import SentenceTransformer
+from flask import Response, jsonify, request, stream_with_context
 from pymongo.operations import SearchIndexModel
 from bson.binary import Binary, BinaryVectorDtype
 from utils.db import flashcard_collection
-from openai import OpenAI
+from utils.embedding_model import get_model, EMBEDDING_MODEL_NAME
+from utils.embedding_cache import embedding_cache, cache_key
+from utils.vector_search import get_vector_search, index_flashcards, unindex_flashcards
+from utils.quantization import embedding_fields, EMBEDDING_FIELDS
+from utils.recommendation_cache import recommendation_cache
+from utils.metrics import span, timed
 import os
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Page size for GET /flashcards (override via .env)
+FLASHCARDS_PAGE_SIZE = int(os.getenv("FLASHCARDS_PAGE_SIZE", "100"))
+FLASHCARDS_MAX_PAGE_SIZE = int(os.getenv("FLASHCARDS_MAX_PAGE_SIZE", "1000"))
+# Fields returned when the request doesn't pick its own; embeddings only when asked for
+DEFAULT_FLASHCARD_FIELDS = ("question", "answer", "topic", "difficulty", "owner_id")
+FLASHCARD_FIELDS = set(DEFAULT_FLASHCARD_FIELDS) | {"options", "choices"} | set(EMBEDDING_FIELDS.values())
+# Query parameter -> document field for GET /flashcards filters
+FLASHCARD_FILTERS = {"topic": "topic", "difficulty": "difficulty", "owner": "owner_id"}
 
-# Get all flashcards
+def serialize_flashcard(doc):
+    # JSON-safe copy: string ids, and stored BSON vectors as plain lists
+    doc = dict(doc)
+    doc["_id"] = str(doc["_id"])
+    for field in EMBEDDING_FIELDS.values():
+        if isinstance(doc.get(field), Binary):
+            doc[field] = list(doc[field].as_vector().data)
+    return doc
+
+def flashcards_query():
+    """
+    Parse the GET /flashcards query parameters.
+
+    Returns:
+        tuple: (filter, projection, limit, error); error is a message for a 400, or None.
+    """
+    query = {}
+    for param, field in FLASHCARD_FILTERS.items():
+        value = request.args.get(param)
+        if value is not None:
+            query[field] = value
+
+    after = request.args.get("after")
+    if after:
+        if not ObjectId.is_valid(after):
+            return None, None, None, "Invalid cursor in 'after'."
+        query["_id"] = {"$gt": ObjectId(after)}
+
+    fields = request.args.get("fields")
+    fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else DEFAULT_FLASHCARD_FIELDS
+    unknown = [f for f in fields if f not in FLASHCARD_FIELDS]
+    if unknown:
+        return None, None, None, f"Unknown fields: {', '.join(unknown)}."
+    projection = {field: 1 for field in fields}
+
+    limit = request.args.get("limit", type=int)
+    if limit is not None and limit < 1:
+        return None, None, None, "'limit' must be positive."
+    return query, projection, limit, None
+
+# List flashcards, one keyset-paginated page at a time, or all of them as NDJSON
 def get_flashcards():
-    flashcards = list(flashcard_collection.find({}, {"_id": 0}))
-    return jsonify(flashcards)
+    """
+    Query parameters:
+      - topic, difficulty, owner: exact-match filters
+      - fields: comma-separated fields to return (default question, answer, topic,
+        difficulty, owner_id; embedding fields only when listed)
+      - limit: page size (default FLASHCARDS_PAGE_SIZE, at most FLASHCARDS_MAX_PAGE_SIZE)
+      - after: the next_cursor of the previous page
+      - format=ndjson: stream every matching card, one JSON object per line
+        (limit is optional here and not capped), for exports
+
+    Returns:
+      {"flashcards": [...], "next_cursor": <_id of the last card, or null on the last page>}
+    """
+    query, projection, limit, error = flashcards_query()
+    if error:
+        return jsonify({"error": error}), 400
+
+    # Pages follow _id order, so each page is an index range scan starting after the cursor
+    cursor = flashcard_collection.find(query, projection).sort("_id", 1)
+
+    if request.args.get("format") == "ndjson":
+        if limit:
+            cursor = cursor.limit(limit)
+
+        def lines():
+            for doc in cursor.batch_size(FLASHCARDS_PAGE_SIZE):
+                yield json.dumps(serialize_flashcard(doc), default=str) + "\n"
+
+        return Response(stream_with_context(lines()), mimetype="application/x-ndjson",
+                        headers={"Content-Disposition": "attachment; filename=flashcards.ndjson"})
+
+    limit = min(limit or FLASHCARDS_PAGE_SIZE, FLASHCARDS_MAX_PAGE_SIZE)
+    # One extra card tells us whether there is a next page
+    docs = list(cursor.limit(limit + 1))
+    flashcards = [serialize_flashcard(doc) for doc in docs[:limit]]
+    next_cursor = flashcards[-1]["_id"] if len(docs) > limit else None
+    return jsonify({"flashcards": flashcards, "next_cursor": next_cursor}), 200
 
 # Get a single flashcard by ID
 def get_flashcard(flashcard_id):
@@ -22,11 +109,48 @@ def get_flashcard(flashcard_id):
         return jsonify(flashcard)
     return jsonify({"error": "Flashcard not found"}), 404
 
-model = SentenceTransformer("nomic-ai/nomic-embed-text-v1", trust_remote_code=True)
+# Number of texts encoded per forward pass when embedding flashcards in bulk
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
 
 # Embedding generation functions
 def get_embedding(data, precision="float32"):
-    return model.encode(data, precision=precision)
+    if isinstance(data, str):
+        return get_embeddings([data], precision)[0]
+    with span("embedding"):
+        return get_model().encode(data, precision=precision)
+
+@timed("embedding")
+def get_embeddings(texts, precision="float32", batch_size=EMBEDDING_BATCH_SIZE):
+    """
+    Embed a list of texts, returning one vector per text in input order.
+
+    Vectors are looked up in the embedding cache first (keyed by normalized
+    text and precision); only the misses go through model.encode, in one call.
+    """
+    keys = [cache_key(text, precision, EMBEDDING_MODEL_NAME) for text in texts]
+    vectors = [embedding_cache.get(key) for key in keys]
+
+    # Encode each distinct missing text once
+    missing = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(keys[i], texts[i])
+
+    if missing:
+        encoded = get_model().encode(list(missing.values()), precision=precision, batch_size=batch_size)
+        fresh = dict(zip(missing, embedding_cache.put_many(list(zip(missing, encoded)))))
+        vectors = [fresh[keys[i]] if vector is None else vector for i, vector in enumerate(vectors)]
+
+    return vectors
+
+# Fields the local grader needs (see api/grading.py)
+GRADING_PROJECTION = {"question": 1, "answer": 1, "options": 1, "choices": 1}
+
+def get_flashcard_for_grading(flashcard_id):
+    # None for a missing or malformed ID, so grading falls back to the LLM
+    if not flashcard_id or not ObjectId.is_valid(flashcard_id):
+        return None
+    return flashcard_collection.find_one({"_id": ObjectId(flashcard_id)}, GRADING_PROJECTION)
 
 def generate_bson_vector(vector, vector_dtype):
     return Binary.from_vector(vector, vector_dtype)
@@ -36,54 +160,33 @@ def add_flashcard():
     data = request.get_json()
     text = f"{data.get('question')} {data.get('answer')}"
 
-    # Generate embeddings
+    # Generate embeddings (float32 and/or quantized, per EMBEDDING_STORAGE)
     float32_embedding = get_embedding(text, "float32")
-    bson_float32_embedding = generate_bson_vector(float32_embedding, BinaryVectorDtype.FLOAT32)
-
-    flashcard_data = {
-        "question": data.get("question"),
-        "answer": data.get("answer"),
-        "embedding": bson_float32_embedding,
-        "topic": data.get("topic"),
-        "difficulty": data.get("difficulty")
-    }
 
-    flashcard_collection.insert_one(flashcard_data)
+    flashcard_data = build_flashcard_doc(data, float32_embedding, data.get("owner_id"))
+
+    result = flashcard_collection.insert_one(flashcard_data)
+    index_flashcards([result.inserted_id], [float32_embedding])
     return jsonify({"message": "Flashcard added with BSON vector embedding"}), 201
 
-# Define the find_similar_flashcards API call using vector search
-def find_similar_flashcards():
-    data = request.get_json()
-    query_text = data.get("query")
-    top_k = data.get("top_k", 5)
+def flashcard_text(flashcard_data):
+    # Text that gets embedded for a flashcard (e.g., "Question Answer")
+    return f"{flashcard_data.get('question', '')} {flashcard_data.get('answer', '')}"
 
-    # Generate embedding for the query
-    query_embedding = get_embedding(query_text, "float32")
+def build_flashcard_doc(flashcard_data, embedding, owner_id=None):
+    doc = {
+        "question": flashcard_data.get("question"),
+        "answer": flashcard_data.get("answer"),
+        **embedding_fields(embedding),
+        "topic": flashcard_data.get("topic"),
+        "difficulty": flashcard_data.get("difficulty")
+    }
+    # The user the card was generated for, so GET /flashcards can filter by owner
+    if owner_id:
+        doc["owner_id"] = str(owner_id)
+    return doc
 
-    # Run the vector search query
-    pipeline = [
-        {
-            "$vectorSearch": {
-                "index": "vector_index",
-                "queryVector": query_embedding,
-                "path": "embedding",
-                "limit": top_k,
-                "numCandidates": 100
-            }
-        },
-        {
-            "$project": {
-                "question": 1,
-                "answer": 1,
-                "score": {"$meta": "vectorSearchScore"}
-            }
-        }
-    ]
-
-    results = list(flashcard_collection.aggregate(pipeline))
-    return jsonify(results), 200
-
-def add_flashcard_func(flashcard_data):
+def add_flashcard_func(flashcard_data, owner_id=None):
     """
     Refactored: Now a regular function that accepts a Python dictionary.
     
@@ -92,30 +195,22 @@ def add_flashcard_func(flashcard_data):
       - "answer" (str)
       - "topic" (optional, str)
       - "difficulty" (optional, str)
+    owner_id is the user the card belongs to, if any.
 
     Returns:
       A tuple: (response_json, status_code)
         Where response_json is a Python dictionary, typically passed to jsonify() by the caller.
         status_code is an HTTP-like status code (e.g., 201).
     """
-    # 1. Build text to embed (e.g., "Question Answer")
-    text = f"{flashcard_data.get('question', '')} {flashcard_data.get('answer', '')}"
+    # 1. Build text to embed and generate embedding
+    float32_embedding = get_embedding(flashcard_text(flashcard_data), "float32")
 
-    # 2. Generate embedding
-    float32_embedding = get_embedding(text, "float32")
-    bson_float32_embedding = generate_bson_vector(float32_embedding, BinaryVectorDtype.FLOAT32)
+    # 2. Build document for MongoDB
+    doc = build_flashcard_doc(flashcard_data, float32_embedding, owner_id)
 
-    # 3. Build document for MongoDB
-    doc = {
-        "question": flashcard_data.get("question"),
-        "answer": flashcard_data.get("answer"),
-        "embedding": bson_float32_embedding,
-        "topic": flashcard_data.get("topic"),
-        "difficulty": flashcard_data.get("difficulty")
-    }
-
-    # 4. Insert into the collection
+    # 3. Insert into the collection
     result = flashcard_collection.insert_one(doc)
+    index_flashcards([result.inserted_id], [float32_embedding])
 
     return (
         {
@@ -125,11 +220,70 @@ def add_flashcard_func(flashcard_data):
         201
     )
 
+def add_flashcards_func(flashcards, batch_size=EMBEDDING_BATCH_SIZE, owner_id=None):
+    """
+    Batch version of add_flashcard_func for bulk generation.
+
+    All flashcards are embedded with a single model.encode call (split into
+    forward passes of batch_size texts) and written with one insert_many.
+
+    Parameters:
+        flashcards (list): List of flashcard dicts, same keys as add_flashcard_func.
+        batch_size (int): Number of texts encoded per forward pass.
+        owner_id (str): The user the cards belong to, if any.
+
+    Returns:
+      A tuple: (response_json, status_code)
+        response_json["flashcard_ids"] holds the inserted IDs as strings,
+        in the same order as the input list.
+    """
+    if not flashcards:
+        return {"message": "No flashcards to add", "flashcard_ids": []}, 201
+
+    # 1. Embed every flashcard in one call and build the documents
+    docs, embeddings = prepare_flashcard_docs(flashcards, batch_size, owner_id)
+
+    # 2. Insert them in one round-trip (ordered keeps IDs aligned)
+    result = flashcard_collection.insert_many(docs, ordered=True)
+    index_flashcards(result.inserted_ids, embeddings)
+
+    return flashcards_added_response(result.inserted_ids), 201
+
+def prepare_flashcard_docs(flashcards, batch_size=EMBEDDING_BATCH_SIZE, owner_id=None):
+    """
+    Embed flashcards in one call and build their MongoDB documents.
+
+    Returns:
+      A tuple: (docs, embeddings), both in the same order as flashcards.
+    """
+    embeddings = get_embeddings([flashcard_text(fc) for fc in flashcards], "float32", batch_size)
+    docs = [build_flashcard_doc(fc, emb, owner_id) for fc, emb in zip(flashcards, embeddings)]
+    return docs, embeddings
+
+def flashcards_added_response(inserted_ids):
+    return {
+        "message": f"{len(inserted_ids)} flashcards added with BSON vector embeddings",
+        "flashcard_ids": [str(i) for i in inserted_ids]
+    }
+
 # Update a flashcard by ID
 def update_flashcard(flashcard_id):
     data = request.get_json()
+    embedding = None
+
+    # Re-embed when the embedded text changes so search doesn't serve a stale vector
+    if "question" in data or "answer" in data:
+        current = flashcard_collection.find_one({"_id": ObjectId(flashcard_id)}, {"question": 1, "answer": 1})
+        if not current:
+            return jsonify({"error": "Flashcard not found"}), 404
+        embedding = get_embedding(flashcard_text({**current, **data}), "float32")
+        data.update(embedding_fields(embedding))
+
     result = flashcard_collection.update_one({"_id": ObjectId(flashcard_id)}, {"$set": data})
     if result.matched_count:
+        if embedding is not None:
+            index_flashcards([flashcard_id], [embedding])
+        recommendation_cache.invalidate_flashcard(flashcard_id)
         return jsonify({"message": "Flashcard updated successfully"}), 200
     return jsonify({"error": "Flashcard not found"}), 404
 
@@ -137,6 +291,8 @@ def update_flashcard(flashcard_id):
 def delete_flashcard(flashcard_id):
     result = flashcard_collection.delete_one({"_id": ObjectId(flashcard_id)})
     if result.deleted_count:
+        unindex_flashcards([flashcard_id])
+        recommendation_cache.invalidate_flashcard(flashcard_id)
         return jsonify({"message": "Flashcard deleted successfully"}), 200
     return jsonify({"error": "Flashcard not found"}), 404
 
@@ -145,36 +301,16 @@ def find_similar_flashcards():
     data = request.get_json()
     query_text = data.get("query")
     top_k = data.get("top_k", 5)
+    num_candidates = data.get("num_candidates", 100)
 
     # Generate embedding for the query
-    query_embedding = get_embedding(query_text, "float32").tolist()  # Convert to list for MongoDB
+    query_embedding = get_embedding(query_text, "float32")
 
-    # Run the vector search query
+    # Run the search on the configured backend (Atlas $vectorSearch or the local index)
     try:
-        pipeline = [
-            {
-                "$vectorSearch": {
-                    "index": "flashcard_index",
-                    "queryVector": query_embedding,
-                    "path": "embedding",
-                    "limit": top_k,
-                    "numCandidates": 100,
-                    "numDimensions": 768  # Match the indexed dimension size
-
-                }
-            },
-            {
-                "$project": {
-                    "_id": 0,  # Exclude ObjectId from the output
-                    "question": 1,
-                    "answer": 1,
-                    "score": {"$meta": "vectorSearchScore"}
-                }
-            }
-        ]
-
-        results = list(flashcard_collection.aggregate(pipeline))
+        with span("vector_search"):
+            results = get_vector_search().search(query_embedding, top_k=top_k, num_candidates=num_candidates)
         return jsonify(results), 200
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
\ No newline at end of file
+        return jsonify({"error": str(e)}), 400
@@ -0,0 +1,140 @@
+import os
+from flask import jsonify, request
+from api.question_pipeline import generate_question_flashcards
+from utils.pdf_extraction import read_uploads, extract_files, PdfExtractionError
+from utils.job_queue import job_store, JobWorkerPool, QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED
+
+# Run job workers inside the web process too (worker.py is the supported runner; set to 1 for a
+# single-process dev setup, never with several web processes or workers that import the app)
+JOB_WORKERS_IN_APP = os.getenv("JOB_WORKERS_IN_APP", "0") == "1"
+
+
+def job_status(job):
+    # Public view of a job, without its params or result
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "stage": job["stage"],
+        "error": job["error"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+def run_question_job(params, files, context):
+    """
+    Job handler for "question" jobs: the /question pipeline on stored uploads.
+
+    Returns:
+        dict: The same body /question responds with.
+
+    Raises:
+        RuntimeError: when the pipeline fails; the message becomes the job's error.
+    """
+    context.progress(0.05, "extracting")
+    extracted_text = extract_files(files)
+    if not extracted_text.strip():
+        raise RuntimeError("No text could be extracted from the uploaded PDFs.")
+
+    body, status_code = generate_question_flashcards(
+        params["chat_id"], params["user_id"], extracted_text, params.get("user_request", ""), progress=context.progress
+    )
+    if status_code >= 400:
+        raise RuntimeError(body.get("error", "Flashcard generation failed."))
+    return body
+
+
+# Job kind -> handler(params, files, context)
+JOB_HANDLERS = {
+    "question": run_question_job,
+}
+
+job_workers = JobWorkerPool(job_store, JOB_HANDLERS)
+
+
+def submit_question_job():
+    """
+    Same form as /question (pdfs, chat_id, user_id, optional user_request), but
+    returns a job id at once; the generation runs on the job workers and keeps
+    going if the client disconnects.
+
+    Returns:
+        202 with {"job_id", "status", "status_url", "result_url"}
+    """
+    chat_id = request.form.get("chat_id", None)
+    user_id = request.form.get("user_id", None)
+
+    if not chat_id:
+        return jsonify({"error": "Missing chat_id."}), 400
+    if not user_id:
+        return jsonify({"error": "Missing user_id."}), 400
+
+    files = request.files.getlist("pdfs")
+    if not files:
+        return jsonify({"error": "No PDFs uploaded. Include files with key 'pdfs'."}), 400
+
+    # Read the uploads now: the request stream is gone once we respond
+    try:
+        uploads = read_uploads(files)
+    except PdfExtractionError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+    params = {
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "user_request": request.form.get("user_request", "").strip(),
+    }
+    job_id = job_store.create("question", params, uploads)
+    job_workers.notify()
+    return jsonify({
+        "job_id": job_id,
+        "status": QUEUED,
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result",
+    }), 202
+
+
+def get_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_status(job)), 200
+
+
+def get_job_result(job_id):
+    """
+    Returns:
+        200 with the job's result once it succeeded, 500 with the error if it failed,
+        409 while it is still queued or running (or was cancelled).
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == SUCCEEDED:
+        return jsonify(job["result"]), 200
+    if job["status"] == FAILED:
+        return jsonify({"error": job["error"], "job_id": job_id}), 500
+    return jsonify({**job_status(job), "error": f"Job is {job['status']}."}), 409
+
+
+def cancel_job(job_id):
+    """
+    Queued jobs are cancelled immediately; running jobs stop at their next
+    progress checkpoint (between pipeline stages).
+    """
+    status = job_store.cancel(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    if status == RUNNING:
+        return jsonify({"message": "Cancellation requested", "job_id": job_id, "status": RUNNING}), 202
+    if status == CANCELLED:
+        return jsonify({"message": "Job cancelled", "job_id": job_id, "status": CANCELLED}), 200
+    return jsonify({"error": f"Job already {status}.", "job_id": job_id, "status": status}), 409
+
+
+def start_job_workers():
+    if JOB_WORKERS_IN_APP:
+        job_workers.start()
@@ -0,0 +1,133 @@
+import cProfile
+import os
+import time
+from flask import Response, g, request
+from api.llm import metrics as llm_metrics
+from api.grading import local_grader
+from utils.metrics import registry, start_profile, stop_profile
+from utils.embedding_cache import embedding_cache
+from utils.grading_cache import grading_cache
+from utils.pdf_cache import pdf_cache
+from utils.recommendation_cache import recommendation_cache
+
+# Per-request profiling (override via .env). Off by default: when on, a request
+# opts in with the X-Profile header or ?profile= query parameter:
+#   "1"        adds a Server-Timing header with the time spent in each stage
+#   "cprofile" also runs cProfile over the request and writes the stats to PROFILE_DIR
+REQUEST_PROFILING = os.getenv("REQUEST_PROFILING", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+request_seconds = registry.histogram(
+    "flashcards_http_request_duration_seconds", "Time to build each response.", ("method", "route", "status"))
+
+CACHES = {
+    "embedding": embedding_cache,
+    "grading": grading_cache,
+    "pdf": pdf_cache,
+    "recommendation": recommendation_cache,
+}
+
+# Cache stats() keys that count what a cache holds in memory, however each cache names it
+CACHE_SIZE_STATS = ("entries", "memory_entries", "memory_documents")
+
+
+@registry.collector
+def collect_stats():
+    # Read at scrape time from the counters the caches, LLM gateway and local grader already keep
+    llm = llm_metrics.snapshot()
+    grading = local_grader.stats()
+    hits, misses, invalidations, entries, memory_bytes = [], [], [], [], []
+    for name, cache in CACHES.items():
+        for stat, value in cache.stats().items():
+            if stat.endswith("_hits"):
+                hits.append(({"cache": name, "tier": stat[:-len("_hits")]}, value))
+            elif stat == "hits":
+                # Single-tier caches only hold entries in memory
+                hits.append(({"cache": name, "tier": "memory"}, value))
+            elif stat == "misses":
+                misses.append(({"cache": name}, value))
+            elif stat == "invalidations":
+                invalidations.append(({"cache": name}, value))
+            elif stat in CACHE_SIZE_STATS:
+                entries.append(({"cache": name}, value))
+            elif stat == "memory_bytes":
+                memory_bytes.append(({"cache": name}, value))
+    return [
+        ("flashcards_llm_calls_total", "counter", "LLM attempts, including retried ones.", [({}, llm["calls"])]),
+        ("flashcards_llm_errors_total", "counter", "LLM attempts that failed.", [({}, llm["errors"])]),
+        ("flashcards_llm_retries_total", "counter", "LLM attempts that were retried.", [({}, llm["retries"])]),
+        ("flashcards_llm_tokens_total", "counter", "LLM tokens used.",
+         [({"kind": "prompt"}, llm["prompt_tokens"]), ({"kind": "completion"}, llm["completion_tokens"])]),
+        ("flashcards_llm_in_flight", "gauge", "LLM calls currently in flight.", [({}, llm["in_flight"])]),
+        ("flashcards_local_grades_total", "counter", "Answers graded without the LLM, per grader.",
+         [({"grader": grader}, count) for grader, count in grading["graded_locally"].items()]),
+        ("flashcards_grading_llm_fallbacks_total", "counter", "Answers the local grader passed to the LLM.",
+         [({}, grading["llm_fallbacks"])]),
+        ("flashcards_cache_hits_total", "counter", "Cache lookups answered, per cache and tier.", hits),
+        ("flashcards_cache_misses_total", "counter", "Cache lookups that missed every tier.", misses),
+        ("flashcards_cache_invalidations_total", "counter", "Cache entries dropped by invalidation.", invalidations),
+        ("flashcards_cache_entries", "gauge", "Entries held in memory by each cache.", entries),
+        ("flashcards_cache_memory_bytes", "gauge", "Bytes held in memory by each cache.", memory_bytes),
+    ]
+
+
+def metrics():
+    """Prometheus scrape endpoint (text exposition format)."""
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _profile_mode():
+    if not REQUEST_PROFILING:
+        return None
+    mode = request.headers.get("X-Profile") or request.args.get("profile")
+    return mode if mode in ("1", "cprofile") else None
+
+
+def before_request():
+    g.request_start = time.perf_counter()
+    mode = _profile_mode()
+    if mode:
+        g.profile_token = start_profile()
+    if mode == "cprofile":
+        g.profiler = cProfile.Profile()
+        try:
+            g.profiler.enable()
+        except ValueError:
+            # Another profiler is already running on this interpreter
+            g.profiler = None
+
+
+def after_request(response):
+    elapsed = time.perf_counter() - g.request_start
+    # Streamed responses are timed up to the first byte; their generators run after this
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    request_seconds.observe(elapsed, method=request.method, route=route, status=response.status_code)
+
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{time.time_ns()}-{request.endpoint or 'unmatched'}.prof")
+        profiler.dump_stats(path)
+        response.headers["X-Profile-File"] = path
+    token = g.pop("profile_token", None)
+    if token is not None:
+        response.headers["Server-Timing"] = stop_profile(token).server_timing(elapsed)
+    return response
+
+
+def teardown_request(error=None):
+    # Requests that failed before after_request still leave profiling
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+    token = g.pop("profile_token", None)
+    if token is not None:
+        stop_profile(token)
+
+
+def instrument_app(app):
+    """Time every request and enable opt-in profiling on a Flask app."""
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
@@ -2,20 +2,34 @@
 
 from bson.objectid import ObjectId, InvalidId
 from flask import jsonify, request
+from pymongo import ReplaceOne
 from utils.db import performance_collection  # New collection for performance data
-from utils.db import flashcard_collection, performance_collection
+from utils.db import flashcard_collection, performance_collection, card_performance_collection, answer_history_collection
 from controllers.flashcards_controller import get_flashcard
+from utils.vector_search import get_vector_search, to_float32
+from utils.ann_index import normalize
+from utils.quantization import full_precision_field
 import numpy as np
 import openai
+import math
+import os
 from collections import defaultdict
-ALPHA = 0.1  # Learning rate
-GAMMA = 0.9  # Discount factor
+from datetime import datetime, timezone
+from utils.q_table import QTable, ALPHA, GAMMA, Q_ACTIONS
+from utils.recommendation_cache import recommendation_cache
+from utils.metrics import span, timed
+RECOMMENDATION_COUNT = 5
+# Log every graded answer to answer_history so Q-tables can be rebuilt by replaying it
+RECORD_ANSWER_HISTORY = os.getenv("RECORD_ANSWER_HISTORY", "1") == "1"
 
 
-# Get performance data for a user
+# Get performance data for a user; the Q-table comes from the per-card documents, not the legacy q_table field
 def get_performance(user_id):
-    data = performance_collection.find_one({"user_id": ObjectId(user_id)})
+    data = performance_collection.find_one({"user_id": ObjectId(user_id)}, {"q_table": 0})
     if data:
+        data["_id"] = str(data["_id"])
+        data["user_id"] = str(data["user_id"])
+        data["q_table"] = get_q_table(user_id)
         return jsonify(data), 200
     return jsonify({"error": "No performance data found"}), 404
 
@@ -24,12 +38,12 @@ def add_update_performance(user_id):
     data = request.get_json()
     result = performance_collection.update_one(
         {"user_id": ObjectId(user_id)},
-        {"$set": {
-            "performance": data.get("performance"),
-            "q_table": data.get("q_table")
-        }},
+        {"$set": {"performance": data.get("performance")}},
         upsert=True
     )
+    # A posted q_table goes to card_performance only
+    if data.get("q_table") is not None:
+        save_q_table(user_id, data["q_table"])
     if result.matched_count or result.upserted_id:
         return jsonify({"message": "Performance data updated successfully"}), 200
     return jsonify({"error": "Failed to update performance data"}), 400
@@ -37,44 +51,134 @@ def add_update_performance(user_id):
 # Delete performance data for a user
 def delete_performance(user_id):
     result = performance_collection.delete_one({"user_id": ObjectId(user_id)})
-    if result.deleted_count:
+    cards = card_performance_collection.delete_many({"user_id": ObjectId(user_id)})
+    recommendation_cache.invalidate(user_id)
+    if result.deleted_count or cards.deleted_count:
         return jsonify({"message": "Performance data deleted successfully"}), 200
     return jsonify({"error": "No performance data found"}), 404
 
-# Retrieve Q-table for a user
+# Retrieve Q-table for a user (rebuilt from the per-card documents)
 def get_q_table(user_id):
-    user_data = performance_collection.find_one({"user_id": ObjectId(user_id)})
-    if user_data and "q_table" in user_data:
-        return defaultdict(lambda: defaultdict(float), user_data["q_table"])
-    return defaultdict(lambda: defaultdict(float))
-
-# Save Q-table for a user
-def save_q_table(user_id, q_table):
-    performance_collection.update_one(
-        {"user_id": ObjectId(user_id)},
-        {"$set": {"q_table": dict(q_table)}},
-        upsert=True
-    )
+    q_table = defaultdict(lambda: defaultdict(float))
+    for doc in card_performance_collection.find({"user_id": ObjectId(user_id)}, {"flashcard_id": 1, **{a: 1 for a in Q_ACTIONS}}):
+        q_table[doc["flashcard_id"]] = {a: doc.get(a, 0.0) for a in Q_ACTIONS}
+    return q_table
+
+def card_performance_doc(user_id, flashcard_id, q_values):
+    # One (user, flashcard) Q-learning state; score is what recommendations sort on
+    values = {a: float(q_values.get(a, 0.0)) for a in Q_ACTIONS}
+    return {"user_id": ObjectId(user_id), "flashcard_id": str(flashcard_id), **values, "score": min(values.values())}
+
+# Save Q-table for a user (a dict or a QTable). With replace, the user's cards missing from q_table are
+# removed; otherwise only the given cards are written. Cards are upserted one by one and only then are the
+# others removed, so an update_q_table upsert landing in between never collides with the unique index.
+def save_q_table(user_id, q_table, replace=True):
+    if isinstance(q_table, QTable):
+        q_table = q_table.to_dict()
+    docs = [card_performance_doc(user_id, fid, values) for fid, values in dict(q_table).items() if isinstance(values, dict)]
+    if docs:
+        card_performance_collection.bulk_write([
+            ReplaceOne({"user_id": doc["user_id"], "flashcard_id": doc["flashcard_id"]}, doc, upsert=True)
+            for doc in docs
+        ], ordered=False)
+    if replace:
+        card_performance_collection.delete_many(
+            {"user_id": ObjectId(user_id), "flashcard_id": {"$nin": [doc["flashcard_id"] for doc in docs]}}
+        )
+    recommendation_cache.invalidate(user_id)
+
+def parse_reward(reward):
+    # Rewards go into an aggregation pipeline: only finite numbers, never strings or operator documents
+    if isinstance(reward, bool) or not isinstance(reward, (int, float)) or not math.isfinite(reward):
+        raise ValueError("reward must be a finite number.")
+    return float(reward)
 
 # Update Q-values based on user performance
 def update_q_table(user_id, flashcard_id, action, reward):
-    q_table = get_q_table(user_id)
-    if flashcard_id not in q_table:
-        q_table[flashcard_id] = {"correct": 0.0, "incorrect": 0.0}
-    
-    old_value = q_table[flashcard_id][action]
-    next_max = max(q_table[flashcard_id].values(), default=0)
-    q_table[flashcard_id][action] = old_value + ALPHA * (reward + GAMMA * next_max - old_value)
-    save_q_table(user_id, q_table)
+    # One atomic server-side update of one small document; concurrent answers can't overwrite each other
+    if not flashcard_id:
+        raise ValueError("Missing flashcard_id.")
+    reward = parse_reward(reward)
+    card_performance_collection.update_one(
+        {"user_id": ObjectId(user_id), "flashcard_id": str(flashcard_id)},
+        q_update_pipeline(action, reward),
+        upsert=True
+    )
+    recommendation_cache.invalidate(user_id)
+    if RECORD_ANSWER_HISTORY:
+        answer_history_collection.insert_one(answer_event(user_id, flashcard_id, action, reward))
+
+def answer_event(user_id, flashcard_id, action, reward):
+    return {
+        "user_id": ObjectId(user_id),
+        "flashcard_id": str(flashcard_id),
+        "action": action,
+        "reward": reward,
+        "at": datetime.now(timezone.utc)
+    }
+
+def rebuild_q_table(user_id, save=True):
+    """
+    Rebuild a user's Q-table by replaying their answer history in one
+    vectorized pass (QTable.replay), optionally saving the result.
+
+    Only cards that appear in the history are rewritten. History starts with
+    RECORD_ANSWER_HISTORY, so cards without any (e.g. Q-values carried over by
+    migrations/migrate_q_tables.py) keep their stored values.
+
+    Returns:
+        QTable: The rebuilt table.
+    """
+    events = answer_history_collection.find(
+        {"user_id": ObjectId(user_id)}, {"flashcard_id": 1, "action": 1, "reward": 1}
+    ).sort("_id", 1)
+    q_table = QTable.replay((e["flashcard_id"], e["action"], e["reward"]) for e in events)
+    if save and len(q_table):
+        save_q_table(user_id, q_table, replace=False)
+    return q_table
+
+def q_update_pipeline(action, reward):
+    """
+    Build the update pipeline for one Q-learning step on a card_performance document:
+
+        Q[action] <- Q[action] + ALPHA * (reward + GAMMA * max(Q) - Q[action])
+
+    Missing values start at 0.0 for both actions, and score is kept equal to
+    min(Q) for the (user_id, score) index. Shared by the sync handlers and the
+    async (motor) handlers in asgi.py.
+    """
+    if action not in Q_ACTIONS:
+        raise ValueError(f"Unknown action: {action}")
+    # $literal so the value is never evaluated as a field path or expression
+    reward = {"$literal": parse_reward(reward)}
+
+    values = {a: {"$ifNull": [f"${a}", 0.0]} for a in Q_ACTIONS}
+    old_value = values[action]
+    next_max = {"$max": list(values.values())}
+    new_value = {"$add": [old_value, {"$multiply": [ALPHA, {"$subtract": [
+        {"$add": [reward, {"$multiply": [GAMMA, next_max]}]}, old_value
+    ]}]}]}
+    return [
+        {"$set": {**values, action: new_value}},
+        {"$set": {"score": {"$min": [f"${a}" for a in Q_ACTIONS]}}},
+    ]
+
+# Weakest flashcards first (lowest min Q-value), read straight off the (user_id, score) index:
+# an index range scan of k entries, with no per-user sort
+def worst_flashcards(user_id, k=RECOMMENDATION_COUNT):
+    projection = {"flashcard_id": 1, "score": 1, **{a: 1 for a in Q_ACTIONS}}
+    return list(card_performance_collection.find({"user_id": ObjectId(user_id)}, projection).sort("score", 1).limit(k))
 
 # Recommend questions using Q-learning
-def recommend_questions(user_id):
-    q_table = get_q_table(user_id)
-    sorted_questions = sorted(q_table.items(), key=lambda x: min(x[1].values()))
-    print(sorted_questions)
-    return [item[0] for item in sorted_questions[:5]]
+def recommend_questions(user_id, k=RECOMMENDATION_COUNT):
+    return [doc["flashcard_id"] for doc in worst_flashcards(user_id, k)]
 
+@timed("recommendation")
 def get_recommended_flashcards(user_id):
+    # Served from the per-user cache until the user's Q-table or one of the cards changes
+    cached, epoch = recommendation_cache.get(user_id)
+    if cached is not None:
+        return cached
     try:
         recommended_ids = recommend_questions(user_id)
         valid_ids = []
@@ -90,27 +194,65 @@ def get_recommended_flashcards(user_id):
         for result in results:
             result['_id'] = str(result['_id'])
 
+        recommendation_cache.put(user_id, results, epoch)
         return results  # Return data directly, not jsonify
     except Exception as e:
         return {"error": str(e)}
 
+def get_similar_to_recommended(user_id, top_k=5, num_candidates=100):
+    """
+    Find flashcards that are semantically close to the user's weakest flashcards.
+
+    The embeddings of the recommended flashcards are averaged into one query
+    vector and run through the configured vector search backend (Atlas, the
+    exact local index or the IVF index). The recommended cards themselves are
+    left out of the results.
+    """
+    recommended_ids = [ObjectId(i) for i in recommend_questions(user_id) if ObjectId.is_valid(i)]
+    field = full_precision_field()
+    vectors = [
+        to_float32(doc[field])
+        for doc in flashcard_collection.find({"_id": {"$in": recommended_ids}}, {field: 1})
+        if field in doc
+    ]
+    if not vectors:
+        return []
+
+    query_vector = normalize(np.vstack(vectors)).mean(axis=0)
+    with span("vector_search"):
+        results = get_vector_search().search(query_vector, top_k=top_k + len(recommended_ids), num_candidates=num_candidates)
+    excluded = {str(i) for i in recommended_ids}
+    return [result for result in results if result["_id"] not in excluded][:top_k]
+
+# Get flashcards similar to the user's recommended flashcards
+def get_similar_flashcards(user_id):
+    top_k = request.args.get("top_k", 5, type=int)
+    num_candidates = request.args.get("num_candidates", 100, type=int)
+    try:
+        return jsonify(get_similar_to_recommended(user_id, top_k, num_candidates)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 # Log user performance and update Q-table
 def log_user_performance(user_id):
     data = request.get_json()
     flashcard_id = data.get("flashcard_id")
     action = data.get("action")
-    reward = data.get("reward", 0)
-    update_q_table(user_id, flashcard_id, action, reward)
+    try:
+        reward = parse_reward(data.get("reward", 0))
+        update_q_table(user_id, flashcard_id, action, reward)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify({"message": "Performance logged successfully"}), 200
 
 
 def get_top_failed_flashcard(user_id, threshold):
     """
     Determine the flashcard that the user has struggled with the most,
-    using the same vector search approach as recommend_questions.
+    using the same ranking as recommend_questions.
 
-    For each flashcard, we assume the Q-table stores an action dictionary.
-    We rank flashcards by the minimum value in this dictionary (i.e., the worst performance).
+    Flashcards are ranked by their score, the minimum Q-value across actions
+    (i.e., the worst performance).
     If the worst score is below the specified threshold, the flashcard is considered failed,
     and its topic is returned.
 
@@ -125,26 +267,17 @@ def get_top_failed_flashcard(user_id, threshold):
         Otherwise, a message indicating no flashcards have crossed the failure threshold or
         that no performance data is available.
     """
-    q_table = get_q_table(user_id)  # This returns a defaultdict, even if empty.
-    
-    # Use the same vector search ranking as in recommend_questions.
-    # We also handle the case where an action dictionary might be empty.
-    sorted_questions = sorted(
-        q_table.items(), 
-        key=lambda x: min(x[1].values()) if x[1] else float('inf')
-    )
-    
-    # If sorted_questions is empty or contains only empty dictionaries, no performance data exists.
-    if not sorted_questions or (sorted_questions and not sorted_questions[0][1]):
-        print('no performance data')
+    # The worst flashcard is the first entry of the (user_id, score) index
+    worst = worst_flashcards(user_id, k=1)
+    if not worst:
         return jsonify({"message": "No flashcard performance data available."}), 200
 
-    top_failed_id, top_failed_actions = sorted_questions[0]
-    worst_score = min(top_failed_actions.values())
-    
+    top_failed_id = worst[0]["flashcard_id"]
+    worst_score = worst[0]["score"]
+
     # Check if the worst score is below the threshold.
     if worst_score < threshold:
-        flashcard = flashcard_collection.find_one({"_id": ObjectId(top_failed_id)})
+        flashcard = flashcard_collection.find_one({"_id": ObjectId(top_failed_id)}, {"topic": 1})
         # If flashcard is returned as a tuple, extract the dictionary.
         if isinstance(flashcard, tuple):
             flashcard = flashcard[0]
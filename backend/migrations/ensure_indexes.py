@@ -0,0 +1,52 @@
+"""
+Apply the indexes declared in utils/indexes.py and report on the ones in the database.
+
+Creating is idempotent: indexes that already exist are left alone, so this can
+run on every deploy. The report lists declared indexes that are missing, indexes
+present but not declared, and indexes with no operations since the server
+started ($indexStats; usage counters reset on restart, so judge "unused" on a
+server that has been up for a while).
+
+Usage (from the backend directory):
+    python -m migrations.ensure_indexes --dry-run
+    python -m migrations.ensure_indexes
+    python -m migrations.ensure_indexes --vector      # also create/update the Atlas vector index
+    python -m migrations.ensure_indexes --report
+"""
+
+import argparse
+
+from utils.db import db, flashcard_collection
+from utils.indexes import ensure_indexes, ensure_vector_index, index_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Show what would be created without writing.")
+    parser.add_argument("--vector", action="store_true", help="Also create or update the Atlas vector index.")
+    parser.add_argument("--report", action="store_true", help="Only report missing, extra and unused indexes.")
+    args = parser.parse_args()
+
+    if args.report:
+        for collection, result in index_report(db).items():
+            usage = result["usage"]
+            print(f"{collection}: missing {result['missing'] or '-'}, extra {result['extra'] or '-'}, "
+                  f"unused {result['unused'] or '-'}" + ("" if usage is not None else " (no $indexStats)"))
+        return
+
+    prefix = "[dry run] " if args.dry_run else ""
+    failed = False
+    for collection, result in ensure_indexes(db, dry_run=args.dry_run).items():
+        created = result["missing"] if args.dry_run else result["created"]
+        print(f"{prefix}{collection}: {len(result['existing'])} present, {'would create' if args.dry_run else 'created'} {created or '-'}")
+        for name, error in result["failed"].items():
+            failed = True
+            print(f"  FAILED {name}: {error}")
+    if args.vector:
+        print(f"{prefix}vector index: {ensure_vector_index(flashcard_collection, dry_run=args.dry_run)}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
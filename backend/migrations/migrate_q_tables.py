@@ -0,0 +1,79 @@
+"""
+Move Q-tables from performance_data.q_table into per-card card_performance documents.
+
+Each { flashcard_id: {"correct": x, "incorrect": y} } entry of a user's q_table
+becomes one card_performance document. Existing card_performance documents are
+never overwritten, since they were written after the switch and are newer than the
+legacy table, so the migration can be re-run safely (and while the app is
+serving).
+
+Usage (from the backend directory):
+    python -m migrations.migrate_q_tables --dry-run
+    python -m migrations.migrate_q_tables
+    python -m migrations.migrate_q_tables --drop-legacy   # also $unset the old q_table fields
+"""
+
+import argparse
+
+from pymongo import UpdateOne
+
+from controllers.performance_controller import card_performance_doc
+from utils.db import performance_collection, card_performance_collection
+
+
+def legacy_operations(user_id, q_table):
+    for flashcard_id, q_values in q_table.items():
+        if not isinstance(q_values, dict):
+            continue
+        doc = card_performance_doc(user_id, flashcard_id, q_values)
+        yield UpdateOne(
+            {"user_id": doc["user_id"], "flashcard_id": doc["flashcard_id"]},
+            {"$setOnInsert": doc},
+            upsert=True,
+        )
+
+
+def migrate(batch_size=1000, dry_run=False, drop_legacy=False):
+    """
+    Returns:
+        dict: Counts of users and entries seen, and of documents inserted.
+    """
+    counts = {"users": 0, "entries": 0, "inserted": 0}
+    batch = []
+
+    def flush():
+        if batch and not dry_run:
+            counts["inserted"] += card_performance_collection.bulk_write(batch, ordered=False).upserted_count
+        batch.clear()
+
+    cursor = performance_collection.find({"q_table": {"$type": "object"}}, {"user_id": 1, "q_table": 1})
+    for user_data in cursor:
+        if user_data.get("user_id") is None:
+            continue
+        counts["users"] += 1
+        for operation in legacy_operations(user_data["user_id"], user_data["q_table"]):
+            counts["entries"] += 1
+            batch.append(operation)
+            if len(batch) >= batch_size:
+                flush()
+    flush()
+
+    if drop_legacy and not dry_run:
+        performance_collection.update_many({"q_table": {"$exists": True}}, {"$unset": {"q_table": ""}})
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be migrated without writing.")
+    parser.add_argument("--drop-legacy", action="store_true", help="Remove performance_data.q_table afterwards.")
+    args = parser.parse_args()
+
+    counts = migrate(args.batch_size, args.dry_run, args.drop_legacy)
+    prefix = "[dry run] " if args.dry_run else ""
+    print(f"{prefix}{counts['users']} users, {counts['entries']} Q-table entries, {counts['inserted']} documents inserted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Rebuild Q-tables by replaying answer_history with the vectorized QTable engine.
+
+Use this after changing ALPHA/GAMMA or the reward scheme, or to repair
+card_performance from the answer log. Only cards with recorded answers are
+rewritten; other cards, and users without answer history, are left untouched.
+
+Usage (from the backend directory):
+    python -m migrations.rebuild_q_tables --dry-run
+    python -m migrations.rebuild_q_tables --user 64f0c2...
+"""
+
+import argparse
+
+from controllers.performance_controller import rebuild_q_table
+from utils.db import answer_history_collection
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", action="append", help="Only rebuild this user (repeatable).")
+    parser.add_argument("--dry-run", action="store_true", help="Replay and report without writing.")
+    args = parser.parse_args()
+
+    user_ids = args.user or [str(u) for u in answer_history_collection.distinct("user_id")]
+    cards = 0
+    for user_id in user_ids:
+        q_table = rebuild_q_table(user_id, save=not args.dry_run)
+        cards += len(q_table)
+        print(f"{user_id}: {len(q_table)} cards, {q_table.values.nbytes} bytes")
+
+    prefix = "[dry run] " if args.dry_run else ""
+    print(f"{prefix}Rebuilt {len(user_ids)} users, {cards} cards")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Same local stand-ins as benchmarks/e2e.py; set before any app module is imported
+_workdir = tempfile.mkdtemp(prefix="flashcards-tests-")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("PDF_CACHE_PATH", os.path.join(_workdir, "pdf_cache.sqlite3"))
+os.environ.setdefault("VECTOR_INDEX_PATH", os.path.join(_workdir, "flashcard_ivf_index.npz"))
+os.environ.setdefault("JOB_QUEUE_PATH", os.path.join(_workdir, "jobs.sqlite3"))
+os.environ.setdefault("JOB_WORKERS_IN_APP", "0")
+os.environ.setdefault("ENSURE_INDEXES_ON_STARTUP", "0")
+os.environ.setdefault("CONVERSATION_STORE", "memory")
+os.environ.setdefault("EMBEDDING_WARMUP", "0")
+
+import mongomock
+import pymongo
+
+# utils/db.py builds its client from pymongo.MongoClient at import
+pymongo.MongoClient = mongomock.MongoClient
+
+
+def _ignore_sort(add):
+    # pymongo >= 4.11 passes sort= to bulk builders; mongomock's don't take it (and it is None for our operations)
+    def wrapper(*args, sort=None, **kwargs):
+        return add(*args, **kwargs)
+    return wrapper
+
+
+for _name in ("add_update", "add_replace"):
+    setattr(mongomock.collection.BulkOperationBuilder, _name,
+            _ignore_sort(getattr(mongomock.collection.BulkOperationBuilder, _name)))
+
+
+@pytest.fixture
+def mongo_db():
+    """A fresh mongomock database."""
+    return mongomock.MongoClient().get_database("flashcards_test")
+
+
+@pytest.fixture
+def hash_embedder(monkeypatch):
+    """Deterministic stand-in for the SentenceTransformer, as in the benchmark."""
+    from benchmarks.e2e import HashEmbedder
+    from utils import embedding_model
+    from utils.embedding_cache import embedding_cache
+
+    monkeypatch.setattr(embedding_model, "_model", HashEmbedder(768))
+    embedding_cache.clear()
+    yield
+    embedding_cache.clear()
@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+
+from utils import data_dir
+from utils.embedding_cache import EmbeddingCache, cache_key
+
+
+def test_cache_key_normalizes_whitespace_but_keeps_case():
+    assert cache_key("a  b\n", "float32") == cache_key("a b", "float32")
+    assert cache_key("A b", "float32") != cache_key("a b", "float32")
+    assert cache_key("a b", "float32") != cache_key("a b", "int8")
+
+
+def test_relative_paths_resolve_under_the_data_dir_and_open_lazily(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_dir, "DATA_DIR", str(tmp_path))
+    cache = EmbeddingCache(path="cache.sqlite3")
+    assert cache.path == os.path.join(str(tmp_path), "cache.sqlite3")
+    assert not os.path.exists(cache.path)
+    cache.get("missing")
+    assert os.path.exists(cache.path)
+
+
+def test_put_many_round_trips_through_disk(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    vectors = [np.arange(4, dtype=np.float32), np.ones(4, dtype=np.int8)]
+    stored = EmbeddingCache(path=path).put_many([("a", vectors[0]), ("b", vectors[1])])
+    assert not stored[0].flags.writeable
+
+    other_process = EmbeddingCache(path=path)
+    assert np.array_equal(other_process.get("a"), vectors[0])
+    assert other_process.get("b").dtype == np.int8
+    assert other_process.stats()["disk_hits"] == 2
+
+
+def test_put_many_commits_once(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"))
+    cache.get("open")
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+    cache.put_many([(str(i), np.zeros(2, dtype=np.float32)) for i in range(50)])
+    assert sum(statement.strip().upper() == "COMMIT" for statement in statements) == 1
+
+
+def test_memory_tier_is_an_lru():
+    cache = EmbeddingCache(max_entries=2, path="")
+    cache.put_many([("a", [1.0]), ("b", [2.0])])
+    cache.get("a")
+    cache.put("c", [3.0])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
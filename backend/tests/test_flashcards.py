@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from bson.binary import Binary, BinaryVectorDtype
+
+import controllers.flashcards_controller as flashcards_controller
+
+
+@pytest.fixture
+def cards(mongo_db, monkeypatch):
+    collection = mongo_db.flashcards
+    monkeypatch.setattr(flashcards_controller, "flashcard_collection", collection)
+    collection.insert_many([
+        {"question": f"Q{i}", "answer": f"A{i}", "topic": "math" if i % 2 else "bio",
+         "embedding": Binary.from_vector([float(i)] * 4, BinaryVectorDtype.FLOAT32)}
+        for i in range(7)
+    ])
+    return collection
+
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
+
+
+def pages(client, query):
+    seen, after = [], None
+    while True:
+        url = f"/flashcards?{query}" + (f"&after={after}" if after else "")
+        body = client.get(url).get_json()
+        seen.append([card["question"] for card in body["flashcards"]])
+        after = body["next_cursor"]
+        if after is None:
+            return seen
+
+
+def test_pages_walk_every_card_once_in_id_order(cards, client):
+    assert pages(client, "limit=3") == [["Q0", "Q1", "Q2"], ["Q3", "Q4", "Q5"], ["Q6"]]
+    # An exact multiple of the page size ends without an empty page
+    assert pages(client, "limit=7") == [[f"Q{i}" for i in range(7)]]
+
+
+def test_filters_and_fields(cards, client):
+    assert pages(client, "topic=math&limit=2") == [["Q1", "Q3"], ["Q5"]]
+
+    card = client.get("/flashcards?fields=question&limit=1").get_json()["flashcards"][0]
+    assert set(card) == {"_id", "question"}
+    card = client.get("/flashcards?fields=question,embedding&limit=1&after=" + card["_id"]).get_json()["flashcards"][0]
+    assert card["embedding"] == [1.0] * 4
+
+
+@pytest.mark.parametrize("query", ["after=nope", "limit=0", "fields=password"])
+def test_bad_parameters(cards, client, query):
+    response = client.get(f"/flashcards?{query}")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_page_size_is_capped(cards, client, monkeypatch):
+    monkeypatch.setattr(flashcards_controller, "FLASHCARDS_MAX_PAGE_SIZE", 4)
+    body = client.get("/flashcards?limit=100").get_json()
+    assert len(body["flashcards"]) == 4 and body["next_cursor"]
+
+
+def test_ndjson_export_streams_every_match(cards, client):
+    response = client.get("/flashcards?format=ndjson&topic=bio")
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [card["question"] for card in lines] == ["Q0", "Q2", "Q4", "Q6"]
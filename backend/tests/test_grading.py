@@ -0,0 +1,124 @@
+import pytest
+
+from api import grading
+from api.grading import (LocalGrader, differs_by_negation, grade_exact_term, grade_multiple_choice, grade_numeric,
+                         grade_similarity, grade_true_false, parse_number)
+
+
+def card(answer, **fields):
+    return {"question": "Q?", "answer": answer, **fields}
+
+
+@pytest.mark.parametrize("expected, given, verdict", [
+    ("True", "t", True),
+    ("True", "yes", True),
+    ("False", "True", False),
+    ("No", "n", True),
+    ("Yes.", "No!", False),
+])
+def test_true_false_single_tokens(expected, given, verdict):
+    assert grade_true_false(card(expected), given) is verdict
+
+
+@pytest.mark.parametrize("expected, given", [
+    ("Right ventricle", "Right atrium"),
+    ("N", "no"),
+    ("T", "true"),
+    ("True", "True, because the membrane is permeable"),
+    ("No, it is diploid", "no"),
+])
+def test_true_false_leaves_everything_else_to_later_tiers(expected, given):
+    assert grade_true_false(card(expected), given) is None
+
+
+def test_parse_number():
+    assert parse_number("1,000") == (1000.0, "")
+    assert parse_number("3/4") == (0.75, "")
+    assert parse_number("12 kg") == (12.0, "kg")
+    assert parse_number("50%") == (50.0, "%")
+    assert parse_number("1/0") is None
+    assert parse_number("mitochondria") is None
+
+
+@pytest.mark.parametrize("expected, given, verdict", [
+    ("42", "42.0", True),
+    ("1,000", "1000", True),
+    ("12 kg", "12 kg", True),
+    ("12 kg", "13 kg", None),
+    ("3/4", "0.75", True),
+    ("3.14", "3.14159", True),
+    ("9.8", "9.81", True),
+    ("1/3", "0.33", True),
+    ("6.022e23", "6.02e23", True),
+    ("3.14", "3.15", None),
+    ("9.8", "9.9", None),
+    ("1/3", "0.3", None),
+    ("3.14159", "3", None),
+    ("42", "42.3", None),
+    ("10 million", "10,000,000", None),
+    ("2 pi", "6.2832", None),
+    ("12 kg", "12", None),
+    ("12 kg", "12 lb", None),
+])
+def test_numeric_accepts_rounded_matches_of_like_units_only(expected, given, verdict):
+    assert grade_numeric(card(expected), given) is verdict
+
+
+def test_multiple_choice_by_letter_or_text():
+    flashcard = card("B", options=["Paris", "Berlin", "Rome"])
+    assert grade_multiple_choice(flashcard, "b)") is True
+    assert grade_multiple_choice(flashcard, "berlin") is True
+    assert grade_multiple_choice(flashcard, "(a) Paris") is False
+    assert grade_multiple_choice(flashcard, "(a) Berlin") is None
+    assert grade_multiple_choice(card("B"), "b") is None
+
+
+@pytest.mark.parametrize("expected, given, verdict", [
+    ("Mitochondria", "mitochondria.", True),
+    ("C++", "C", None),
+    ("C#", "C", None),
+    ("C", "C++", None),
+    ("Powerhouse of the cell", "the cell's powerhouse", None),
+])
+def test_exact_term(expected, given, verdict):
+    assert grade_exact_term(card(expected), given) is verdict
+
+
+def test_differs_by_negation():
+    assert differs_by_negation("E. coli is a prokaryote", "E. coli is not a prokaryote")
+    assert differs_by_negation("The reaction is reversible", "The reaction is irreversible")
+    assert not differs_by_negation("It stores genetic information", "It holds the genetic information")
+
+
+def test_similarity_is_off_by_default(hash_embedder):
+    assert grade_similarity(card("Stores genetic information"), "Stores genetic information") is None
+
+
+def test_similarity_only_accepts(hash_embedder, monkeypatch):
+    monkeypatch.setattr(grading, "GRADER_SIMILARITY", True)
+    assert grade_similarity(card("Stores genetic information"), "Stores genetic information") is True
+    # Unrelated text (cosine ~0 under the hash embedder) is not rejected locally
+    assert grade_similarity(card("Stores genetic information"), "A completely different answer") is None
+    # Identical apart from a negation is never accepted
+    monkeypatch.setattr(grading, "GRADER_ACCEPT_SIMILARITY", -1.0)
+    assert grade_similarity(card("X is a prokaryote"), "X is not a prokaryote") is None
+    assert grade_similarity(card("42"), "42") is None
+
+
+def test_local_grader_verdicts_and_fallbacks():
+    grader = LocalGrader(graders=grading.GRADERS)
+    assert grader.grade(card("Mitochondria"), "mitochondria") == {"correct": True, "correct_answer": "Good job!"}
+    assert grader.grade(card("12 kg"), "12.0 kg") == {"correct": True, "correct_answer": "Good job!"}
+    assert grader.grade(card("12 kg"), "13 kg") is None
+    assert grader.grade(card("True"), "f") == {"correct": False, "correct_answer": "The correct answer is: True"}
+    assert grader.grade(card("Right ventricle"), "Right atrium") is None
+    assert grader.grade(card(""), "anything") is None
+    stats = grader.stats()
+    assert stats["graded_locally"]["exact_term"] == 1
+    assert stats["graded_locally"]["numeric"] == 1
+    assert stats["graded_locally"]["true_false"] == 1
+    assert stats["llm_fallbacks"] == 3
+
+
+def test_local_grader_can_be_disabled():
+    assert LocalGrader(enabled=False).grade(card("True"), "true") is None
@@ -0,0 +1,39 @@
+from utils.grading_cache import GradingCache, grading_key, normalize_answer
+
+
+def test_normalize_answer_ignores_case_spacing_and_sentence_end():
+    assert normalize_answer("  The   Mitochondria. ") == "the mitochondria"
+    assert normalize_answer("Yes!") == "yes"
+    assert normalize_answer("Paris?") == "paris"
+    assert normalize_answer(None) == ""
+
+
+def test_normalize_answer_keeps_meaningful_trailing_characters():
+    assert len({normalize_answer("C++"), normalize_answer("C#"), normalize_answer("C")}) == 3
+    assert normalize_answer("x'") != normalize_answer("x")
+    assert normalize_answer("5%") != normalize_answer("5")
+
+
+def test_grading_key_merges_only_equivalent_answers():
+    assert grading_key("id", "Q?", "Paris.") == grading_key("id", "q?", " paris ")
+    assert grading_key("id", "Q?", "C++") != grading_key("id", "Q?", "C")
+    assert grading_key("id", "Q?", "Paris") != grading_key("other", "Q?", "Paris")
+
+
+def test_cache_round_trip_and_lru_eviction():
+    cache = GradingCache(max_entries=2)
+    cache.put("a", {"correct": True})
+    cache.put("b", {"correct": False})
+    assert cache.get("a") == {"correct": True}
+    cache.put("c", {"correct": True})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"correct": True}
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_shares_verdicts_through_the_collection(mongo_db):
+    collection = mongo_db.get_collection("grading_cache")
+    GradingCache(collection=collection).put("k", {"correct": True})
+    other_worker = GradingCache(collection=collection)
+    assert other_worker.get("k") == {"correct": True}
+    assert other_worker.stats()["persistent_hits"] == 1
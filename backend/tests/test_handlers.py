@@ -0,0 +1,109 @@
+import asyncio
+import io
+import json
+
+import pytest
+from werkzeug.datastructures import FileStorage, MultiDict
+
+from api.handlers import (missing_field, parse_flashcard_list, parse_review_flashcard, parse_verdict, question_prompt,
+                          question_response, recommended_topic, review_response, study_prompt, study_response)
+
+
+def test_missing_field_reports_the_first_empty_one():
+    assert missing_field(MultiDict({"user_id": "u"}), "chat_id", "user_id") == ({"error": "Missing chat_id."}, 400)
+    assert missing_field(MultiDict({"chat_id": "c", "user_id": ""}), "chat_id", "user_id")[0]["error"] == "Missing user_id."
+    assert missing_field(MultiDict({"chat_id": "c", "user_id": "u"}), "chat_id", "user_id") is None
+
+
+def test_prompts():
+    assert study_prompt("", "") == (None, ({"error": "No PDFs provided and no user request specified."}, 400))
+    assert study_prompt("  ", "quiz me") == ("\n\nUser Request: quiz me", None)
+    assert study_prompt("Text", "") == ("Text", None)
+    assert question_prompt("Text", "harder") == "Text\n\nUser request: harder"
+    assert question_prompt("Text", "") == "Text"
+
+
+def test_parsing():
+    assert parse_flashcard_list('[{"question": "Q"}]') == [{"question": "Q"}]
+    with pytest.raises(ValueError):
+        parse_flashcard_list('{"question": "Q"}')
+    with pytest.raises(json.JSONDecodeError):
+        parse_flashcard_list("not json")
+    with pytest.raises(ValueError):
+        parse_review_flashcard('[{"answer": "A"}]')
+    assert parse_verdict('{"correct": true}') == {"correct": True}
+    with pytest.raises(ValueError):
+        parse_verdict('{"verdict": true}')
+
+
+def test_recommended_topic_tolerates_missing_recommendations():
+    assert recommended_topic([{"topic": "Cells"}, {"topic": "DNA"}]) == "Cells"
+    assert recommended_topic([]) is None
+    assert recommended_topic({"error": "boom"}) is None
+
+
+def test_response_shapes():
+    added = ({"message": "2 flashcards added", "flashcard_ids": ["a", "b"]}, 201)
+    flashcards = [{"question": "Q1"}, {"question": "Q2"}]
+    body, status = study_response(flashcards, added, [])
+    assert status == 200
+    assert flashcards[0]["id"] == {"message": "2 flashcards added", "flashcard_id": "a"}
+    assert body["selected_flashcard"] in flashcards
+    assert body["response"] is None
+
+    assert study_response([], ({"message": "none", "flashcard_ids": []}, 201), None) == (
+        {"error": "No flashcard generated."}, 500)
+    assert question_response(flashcards, ({}, 500), ["rec"])[0]["flashcards_added"] == 0
+
+    body, status = review_response(["rec"], {"question": "Q"}, ({"flashcard_ids": ["x"]}, 201))
+    assert body == {"recommended_flashcards": ["rec"], "selected_flashcard": {"question": "Q", "id": "x"}}
+
+
+@pytest.fixture
+def apps():
+    from asgi import quart_app
+    from app import app
+    return app.test_client(), quart_app.test_client()
+
+
+def quart_post(client, path, form=None, files=None):
+    async def post():
+        response = await client.post(path, form=form, files=files)
+        return response.status_code, await response.get_json()
+    return asyncio.run(post())
+
+
+@pytest.mark.parametrize("path", ["/question", "/question/study", "/question/review"])
+def test_both_apps_reject_missing_ids_alike(apps, path):
+    flask_client, quart_client = apps
+    flask_response = flask_client.post(path, data={"user_id": "u"})
+    assert quart_post(quart_client, path, form={"user_id": "u"}) == (flask_response.status_code, flask_response.get_json())
+
+
+@pytest.mark.parametrize("form, error", [
+    ({"chat_id": "c", "user_id": "5f1d7f3e9b1e8a3c4d2b1a00", "question": "Q", "answer": "A"}, "Missing flashcard_id."),
+    ({"chat_id": "c", "flashcard_id": "f", "question": "Q", "answer": "A"}, "Missing user_id."),
+    ({"chat_id": "c", "user_id": "u", "flashcard_id": "f", "question": "Q", "answer": "A"}, "Invalid user_id."),
+])
+def test_both_apps_reject_answers_without_usable_ids(apps, form, error):
+    flask_client, quart_client = apps
+    flask_response = flask_client.post("/answer", data=form)
+    assert (flask_response.status_code, flask_response.get_json()) == (400, {"error": error})
+    assert quart_post(quart_client, "/answer", form=form) == (400, {"error": error})
+
+
+def test_both_apps_reject_unknown_chats_alike(apps):
+    flask_client, quart_client = apps
+    form = {"chat_id": "no-such-chat", "user_id": "5f1d7f3e9b1e8a3c4d2b1a00", "flashcard_id": "f",
+            "question": "Q", "answer": "A"}
+    flask_response = flask_client.post("/answer", data=form)
+    assert flask_response.status_code == 400
+    assert quart_post(quart_client, "/answer", form=form) == (400, flask_response.get_json())
+
+
+def test_async_app_caps_the_request_body(apps, monkeypatch):
+    from asgi import quart_app
+    monkeypatch.setitem(quart_app.config, "MAX_CONTENT_LENGTH", 1024)
+    pdfs = {"pdfs": FileStorage(io.BytesIO(b"%PDF" + b"x" * 4096), filename="big.pdf")}
+    status, _ = quart_post(apps[1], "/question", form={"chat_id": "c", "user_id": "u"}, files=pdfs)
+    assert status == 413
@@ -0,0 +1,28 @@
+from utils.conversation_store import MongoConversationStore, CHAT_TTL_SECONDS
+from utils.grading_cache import GradingCache
+from utils.indexes import INDEXES, ensure_indexes, index_report
+from utils.job_queue import JOB_RETENTION_SECONDS
+
+
+def test_ensure_indexes_creates_every_declared_index(mongo_db):
+    report = ensure_indexes(mongo_db)
+    for name, models in INDEXES.items():
+        assert sorted(report[name]["created"]) == sorted(model.document["name"] for model in models)
+        assert report[name]["failed"] == {}
+
+    assert ensure_indexes(mongo_db)["jobs"]["created"] == []
+    assert all(not result["missing"] for result in index_report(mongo_db).values())
+
+
+def test_ttl_indexes(mongo_db):
+    ensure_indexes(mongo_db)
+    assert mongo_db.conversations.index_information()["updated_at_1"]["expireAfterSeconds"] == CHAT_TTL_SECONDS
+    assert mongo_db.jobs.index_information()["finished_at_1"]["expireAfterSeconds"] == JOB_RETENTION_SECONDS
+    assert "expireAfterSeconds" in mongo_db.grading_cache.index_information()["created_at_1"]
+
+
+def test_mongo_backends_create_no_indexes(mongo_db):
+    MongoConversationStore(mongo_db.conversations)
+    GradingCache(collection=mongo_db.grading_cache)
+    for name in ("conversations", "grading_cache"):
+        assert set(mongo_db.get_collection(name).index_information()) <= {"_id_"}
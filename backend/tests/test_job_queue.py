@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+
+import pytest
+
+from utils.job_queue import (
+    SQLiteJobStore, JobWorkerPool, JobContext, JobCancelled, JobLeaseLost,
+    QUEUED, RUNNING, SUCCEEDED, CANCELLED, FAILED,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def age(store, job_id, seconds):
+    # Backdate a job's last heartbeat
+    store._connection().execute("UPDATE jobs SET updated_at = updated_at - ? WHERE id = ?", (seconds, job_id))
+
+
+def test_claim_takes_oldest_queued_job_once(store):
+    first = store.create("question", {"n": 1}, [("a.pdf", b"%PDF")])
+    second = store.create("question", {"n": 2})
+
+    job = store.claim()
+    assert job["id"] == first
+    assert job["status"] == RUNNING and job["attempts"] == 1 and job["lease"]
+    assert store.files(first) == [("a.pdf", b"%PDF")]
+    assert store.claim()["id"] == second
+    assert store.claim() is None
+
+
+def test_requeue_stale_requeues_then_fails(store):
+    job_id = store.create("question", {})
+    store.claim()
+    store.requeue_stale(stale_seconds=60, max_attempts=2)
+    assert store.get(job_id)["status"] == RUNNING
+
+    age(store, job_id, 120)
+    store.requeue_stale(stale_seconds=60, max_attempts=2)
+    job = store.get(job_id)
+    assert job["status"] == QUEUED and job["lease"] is None
+
+    store.claim()
+    age(store, job_id, 120)
+    store.requeue_stale(stale_seconds=60, max_attempts=2)
+    assert store.get(job_id)["status"] == FAILED
+
+
+def test_requeued_job_fences_off_the_old_worker(store):
+    job_id = store.create("question", {})
+    stale = store.claim()
+    age(store, job_id, 120)
+    store.requeue_stale(stale_seconds=60)
+    fresh = store.claim()
+    assert fresh["lease"] != stale["lease"]
+
+    with pytest.raises(JobLeaseLost):
+        store.report(job_id, stale["lease"], 0.5, "saving")
+    assert store.finish(job_id, SUCCEEDED, result={"old": True}, lease=stale["lease"]) is False
+    assert store.get(job_id)["status"] == RUNNING
+
+    assert store.finish(job_id, SUCCEEDED, result={"new": True}, lease=fresh["lease"]) is True
+    job = store.get(job_id)
+    assert job["status"] == SUCCEEDED and job["result"] == {"new": True}
+
+
+def test_report_returns_cancel_request(store):
+    job_id = store.create("question", {})
+    job = store.claim()
+    assert store.report(job_id, job["lease"], 0.1) is False
+    assert store.cancel(job_id) == RUNNING
+    with pytest.raises(JobCancelled):
+        JobContext(store, job).progress(0.2)
+
+
+def test_cancel_queued_job(store):
+    job_id = store.create("question", {}, [("a.pdf", b"%PDF")])
+    assert store.cancel(job_id) == CANCELLED
+    assert store.files(job_id) == []
+    assert store.claim() is None
+
+
+def test_heartbeat_keeps_slow_job_alive(store):
+    job_id = store.create("question", {})
+    job = store.claim()
+    with JobContext(store, job, heartbeat_seconds=0.01):
+        age(store, job_id, 120)
+        time.sleep(0.1)
+        store.requeue_stale(stale_seconds=60)
+    assert store.get(job_id)["status"] == RUNNING
+
+
+def test_worker_drops_outcome_after_losing_lease(store):
+    job_id = store.create("question", {})
+    claimed = threading.Event()
+    release = threading.Event()
+    saved = []
+
+    def handler(params, files, context):
+        claimed.set()
+        release.wait(5)
+        context.progress(0.9, "saving")
+        saved.append(params)
+        return {"saved": True}
+
+    pool = JobWorkerPool(store, {"question": handler})
+    job = store.claim()
+    runner = threading.Thread(target=pool.run_job, args=(job,))
+    runner.start()
+    claimed.wait(5)
+    age(store, job_id, 120)
+    store.requeue_stale(stale_seconds=60)
+    release.set()
+    runner.join(5)
+
+    assert saved == []
+    job = store.get(job_id)
+    assert job["status"] == QUEUED and job["result"] is None
+
+
+def test_existing_queue_file_gains_lease_column(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    SQLiteJobStore(path)._connection().execute("ALTER TABLE jobs DROP COLUMN lease")
+    store = SQLiteJobStore(path)
+    store.create("question", {})
+    assert store.claim()["lease"]
+
+
+def test_relative_queue_path_resolves_under_the_data_dir_and_opens_lazily(tmp_path, monkeypatch):
+    from utils import data_dir
+
+    monkeypatch.setattr(data_dir, "DATA_DIR", str(tmp_path))
+    store = SQLiteJobStore("jobs.sqlite3")
+    assert store.path == os.path.join(str(tmp_path), "jobs.sqlite3")
+    assert not os.path.exists(store.path)
+    job_id = store.create("question", {})
+    # A worker started from another directory opens the same file
+    monkeypatch.chdir(tmp_path.parent)
+    assert SQLiteJobStore("jobs.sqlite3").claim()["id"] == job_id
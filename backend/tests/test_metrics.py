@@ -0,0 +1,37 @@
+from controllers.metrics_controller import collect_stats
+from utils.metrics import registry
+from utils.recommendation_cache import recommendation_cache
+
+
+def families():
+    return {name: (metric_type, samples) for name, metric_type, help, samples in collect_stats()}
+
+
+def test_cache_hits_and_misses_are_counters():
+    stats = families()
+    assert "flashcards_cache" not in stats
+    assert stats["flashcards_cache_hits_total"][0] == "counter"
+    assert stats["flashcards_cache_misses_total"][0] == "counter"
+    assert stats["flashcards_cache_entries"][0] == "gauge"
+
+    tiers = {(labels["cache"], labels["tier"]) for labels, value in stats["flashcards_cache_hits_total"][1]}
+    assert {("embedding", "memory"), ("embedding", "disk"), ("grading", "persistent"),
+            ("recommendation", "memory")} <= tiers
+    caches = {labels["cache"] for labels, value in stats["flashcards_cache_misses_total"][1]}
+    assert caches == {"embedding", "grading", "pdf", "recommendation"}
+
+
+def test_cache_counters_rise_with_lookups():
+    def recommendation_misses():
+        samples = families()["flashcards_cache_misses_total"][1]
+        return next(value for labels, value in samples if labels["cache"] == "recommendation")
+
+    before = recommendation_misses()
+    recommendation_cache.get("no-such-user")
+    assert recommendation_misses() == before + 1
+
+
+def test_rendered_without_hit_rates():
+    text = registry.render()
+    assert "# TYPE flashcards_cache_hits_total counter" in text
+    assert "hit_rate" not in text
@@ -0,0 +1,34 @@
+import os
+
+from utils import data_dir
+from utils.pdf_cache import PdfTextCache, content_hash
+
+
+def test_relative_paths_resolve_under_the_data_dir_and_open_lazily(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_dir, "DATA_DIR", str(tmp_path))
+    cache = PdfTextCache(path="pdf_cache.sqlite3")
+    assert cache.path == os.path.join(str(tmp_path), "pdf_cache.sqlite3")
+    assert not os.path.exists(cache.path)
+    assert cache.get(content_hash(b"%PDF")) is None
+    assert os.path.exists(cache.path)
+
+
+def test_pages_survive_a_new_process_and_evict_lru(tmp_path):
+    path = str(tmp_path / "pdf_cache.sqlite3")
+    cache = PdfTextCache(path=path, disk_max_bytes=10)
+    cache.put("a", ["12345", "6"])
+    cache.put("b", ["abcd"])
+    assert PdfTextCache(path=path).get("b") == ["abcd"]
+
+    cache.put("c", ["wxyz"])
+    other_process = PdfTextCache(path=path)
+    assert other_process.get("a") is None
+    assert other_process.get("c") == ["wxyz"]
+    assert other_process.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_can_be_disabled():
+    cache = PdfTextCache(path="")
+    assert cache.path is None
+    cache.put("a", ["text"])
+    assert cache.get("a") == ["text"]
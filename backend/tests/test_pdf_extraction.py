@@ -0,0 +1,43 @@
+import io
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from benchmarks.e2e import make_pdf
+from utils.pdf_extraction import PdfExtractionError, extract_pages, extract_text, page_texts, read_uploads
+
+PDF = make_pdf(["Photosynthesis converts light", "into chemical energy"])
+
+
+def upload(data, filename="notes.pdf"):
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def test_inline_and_pooled_extraction_agree():
+    inline = page_texts(PDF, parallel=False)
+    assert "Photosynthesis" in inline[0]
+    assert page_texts(PDF, parallel=True) == inline
+
+
+def test_page_limit():
+    with pytest.raises(PdfExtractionError) as error:
+        page_texts(PDF, max_pages=0)
+    assert error.value.status_code == 413
+
+
+def test_extract_text_goes_through_the_cache():
+    assert extract_pages(PDF) == extract_pages(PDF, use_cache=False)
+    assert extract_text(PDF).endswith("\n")
+
+
+def test_read_uploads_rejects_non_pdfs_and_oversized_files(monkeypatch):
+    with pytest.raises(PdfExtractionError) as error:
+        read_uploads([upload(PDF, "notes.txt")])
+    assert error.value.status_code == 400
+
+    import utils.pdf_extraction as pdf_extraction
+    monkeypatch.setattr(pdf_extraction.read_upload, "__defaults__", (len(PDF) - 1,))
+    with pytest.raises(PdfExtractionError) as error:
+        read_uploads([upload(PDF)])
+    assert error.value.status_code == 413
+    assert read_uploads([upload(b"%PDF small", "a.PDF")]) == [("a.PDF", b"%PDF small")]
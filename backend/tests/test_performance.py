@@ -0,0 +1,92 @@
+import pytest
+from bson.objectid import ObjectId
+
+from controllers.performance_controller import parse_reward, q_update_pipeline
+from utils.q_table import ALPHA, GAMMA
+
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
+
+
+def apply(collection, action, reward):
+    collection.update_one({"_id": 1}, q_update_pipeline(action, reward), upsert=True)
+    return collection.find_one({"_id": 1})
+
+
+def test_q_update_pipeline_matches_the_q_learning_step(mongo_db):
+    cards = mongo_db.card_performance
+    doc = apply(cards, "correct", 10)
+    assert doc["correct"] == pytest.approx(ALPHA * 10)
+    assert doc["incorrect"] == 0.0
+    assert doc["score"] == 0.0
+
+    doc = apply(cards, "incorrect", -5)
+    expected = ALPHA * (-5 + GAMMA * ALPHA * 10)
+    assert doc["incorrect"] == pytest.approx(expected)
+    assert doc["score"] == pytest.approx(min(doc["correct"], doc["incorrect"]))
+
+
+@pytest.mark.parametrize("reward", ["$incorrect", {"$literal": 5}, {"$add": [1, 1]}, "10", None, True,
+                                    float("nan"), float("inf")])
+def test_rewards_must_be_finite_numbers(reward):
+    with pytest.raises(ValueError):
+        parse_reward(reward)
+    with pytest.raises(ValueError):
+        q_update_pipeline("correct", reward)
+
+
+def test_reward_is_passed_as_a_literal():
+    pipeline = q_update_pipeline("correct", 3)
+    assert {"$literal": 3.0} in pipeline[0]["$set"]["correct"]["$add"][1]["$multiply"][1]["$subtract"][0]["$add"]
+
+
+def test_unknown_action_is_rejected():
+    with pytest.raises(ValueError):
+        q_update_pipeline("skipped", 1)
+
+
+def test_log_rejects_non_numeric_rewards(client):
+    # The route reads a JSON body on GET
+    user_id = str(ObjectId())
+    for reward in ("$incorrect", {"$literal": 1}, "ten"):
+        response = client.get(f"/performance/{user_id}/log",
+                              json={"flashcard_id": str(ObjectId()), "action": "correct", "reward": reward})
+        assert response.status_code == 400
+
+    response = client.get(f"/performance/{user_id}/log",
+                          json={"flashcard_id": str(ObjectId()), "action": "correct", "reward": 2})
+    assert response.status_code == 200
+
+
+def test_save_q_table_replaces_the_users_cards_in_place():
+    from controllers.performance_controller import get_q_table, save_q_table
+    from utils.db import card_performance_collection
+
+    user_id = str(ObjectId())
+    save_q_table(user_id, {"a": {"correct": 1.0, "incorrect": 0.0}, "b": {"correct": 2.0, "incorrect": -1.0}})
+    first = {doc["flashcard_id"]: doc["_id"] for doc in card_performance_collection.find({"user_id": ObjectId(user_id)})}
+
+    save_q_table(user_id, {"b": {"correct": 3.0, "incorrect": 0.5}, "c": {"correct": 0.0, "incorrect": 0.0}})
+    docs = {doc["flashcard_id"]: doc for doc in card_performance_collection.find({"user_id": ObjectId(user_id)})}
+    assert set(docs) == {"b", "c"}
+    # Replaced where it was, not deleted and re-inserted
+    assert docs["b"]["_id"] == first["b"]
+    assert docs["b"]["score"] == 0.5
+    assert get_q_table(user_id)["b"] == {"correct": 3.0, "incorrect": 0.5}
+
+
+def test_performance_reads_the_q_table_from_card_performance(client):
+    from utils.db import performance_collection
+
+    user_id = str(ObjectId())
+    q_table = {"card": {"correct": 1.5, "incorrect": -0.5}}
+    assert client.post(f"/performance/{user_id}", json={"performance": {"score": 3}, "q_table": q_table}).status_code == 200
+    assert "q_table" not in performance_collection.find_one({"user_id": ObjectId(user_id)})
+
+    body = client.get(f"/performance/{user_id}").get_json()
+    assert body["user_id"] == user_id
+    assert body["performance"] == {"score": 3}
+    assert body["q_table"] == q_table
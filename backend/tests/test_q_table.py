@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from bson.objectid import ObjectId
+
+from controllers.performance_controller import q_update_pipeline
+from utils.q_table import ALPHA, GAMMA, QTable
+
+
+def sequential(events):
+    # The reference: one Q-learning step at a time, in plain Python
+    table = {}
+    for flashcard_id, action, reward in events:
+        q = table.setdefault(flashcard_id, {"correct": 0.0, "incorrect": 0.0})
+        q[action] += ALPHA * (reward + GAMMA * max(q.values()) - q[action])
+    return table
+
+
+def random_events(n, cards, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        (f"card-{rng.integers(cards)}", ("correct", "incorrect")[rng.integers(2)], float(rng.integers(-10, 11)))
+        for _ in range(n)
+    ]
+
+
+def assert_tables_close(actual, expected):
+    assert set(actual) == set(expected)
+    for flashcard_id, q_values in expected.items():
+        assert actual[flashcard_id] == pytest.approx(q_values, rel=1e-4, abs=1e-4)
+
+
+def test_replay_matches_sequential_updates():
+    events = random_events(500, cards=20)
+    assert_tables_close(QTable.replay(events).to_dict(), sequential(events))
+
+
+def test_batched_updates_match_one_replay():
+    events = random_events(300, cards=5, seed=1)
+    table = QTable()
+    for start in range(0, len(events), 37):
+        flashcard_ids, actions, rewards = zip(*events[start:start + 37])
+        table.update(flashcard_ids, actions, rewards)
+    assert_tables_close(table.to_dict(), sequential(events))
+
+
+def test_replay_matches_the_server_side_pipeline(mongo_db):
+    events = random_events(60, cards=4, seed=2)
+    for flashcard_id, action, reward in events:
+        mongo_db.card_performance.update_one({"flashcard_id": flashcard_id}, q_update_pipeline(action, reward), upsert=True)
+    stored = {doc["flashcard_id"]: {"correct": doc["correct"], "incorrect": doc["incorrect"]}
+              for doc in mongo_db.card_performance.find()}
+    assert_tables_close(QTable.replay(events).to_dict(), stored)
+
+
+def test_unknown_action_is_rejected():
+    with pytest.raises(ValueError):
+        QTable.replay([("card", "skipped", 1.0)])
+
+
+def test_rebuild_keeps_cards_without_history():
+    from controllers.performance_controller import get_q_table, rebuild_q_table, save_q_table, update_q_table
+
+    user_id = str(ObjectId())
+    # Migrated before answer history existed
+    save_q_table(user_id, {"migrated": {"correct": 4.0, "incorrect": -2.0}})
+    update_q_table(user_id, "answered", "correct", 10)
+    update_q_table(user_id, "answered", "incorrect", -5)
+
+    rebuilt = rebuild_q_table(user_id)
+    assert len(rebuilt) == 1
+    q_table = get_q_table(user_id)
+    assert q_table["migrated"] == {"correct": 4.0, "incorrect": -2.0}
+    assert q_table["answered"] == pytest.approx(sequential([("answered", "correct", 10), ("answered", "incorrect", -5)])["answered"])
+
+
+def test_worst_returns_the_lowest_scores_first():
+    table = QTable.from_dict({
+        "a": {"correct": 1.0, "incorrect": 0.5},
+        "b": {"correct": -2.0, "incorrect": 3.0},
+        "c": {"correct": 0.0, "incorrect": -1.0},
+        "d": {"correct": 4.0, "incorrect": 4.0},
+    })
+    assert table.worst(2) == [("b", -2.0), ("c", -1.0)]
+    assert [flashcard_id for flashcard_id, _ in table.worst(10)] == ["b", "c", "a", "d"]
+    assert QTable().worst(3) == []
+
+
+def test_worst_matches_the_score_index(mongo_db):
+    events = random_events(200, cards=30, seed=3)
+    for flashcard_id, action, reward in events:
+        mongo_db.card_performance.update_one({"flashcard_id": flashcard_id}, q_update_pipeline(action, reward), upsert=True)
+    table = QTable.from_documents(mongo_db.card_performance.find())
+    by_score = [doc["flashcard_id"] for doc in mongo_db.card_performance.find().sort("score", 1).limit(5)]
+    assert [flashcard_id for flashcard_id, _ in table.worst(5)] == by_score
+
+
+@pytest.mark.parametrize("ids", [[str(ObjectId()) for _ in range(3)], ["card-1", "card-2", "card-3"]])
+def test_bson_round_trip(mongo_db, ids):
+    table = QTable.replay((flashcard_id, "correct", 10.0 * (i + 1)) for i, flashcard_id in enumerate(ids))
+    packed = table.to_bson()
+    assert packed["id_format"] == ("objectid" if ObjectId.is_valid(ids[0]) else "str")
+
+    mongo_db.q_tables.insert_one({"_id": 1, **packed})
+    restored = QTable.from_bson(mongo_db.q_tables.find_one({"_id": 1}))
+    assert restored.ids == table.ids
+    assert restored.to_dict() == table.to_dict()
+    assert restored.get(ids[1]) == table.get(ids[1])
+    assert ids[2] in restored and "missing" not in restored
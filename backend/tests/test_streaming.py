@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from utils.streaming import JsonArrayStream, format_event
+
+CARDS = [{"question": "What is [1, 2]?", "answer": 'A "list" {of two}'}, {"question": "Q2", "answer": {"a": [1]}}]
+# As the LLM tends to send it: inside a Markdown code fence
+REPLY = "```json\n" + json.dumps(CARDS) + "\n```"
+
+
+def test_whole_reply_at_once():
+    stream = JsonArrayStream()
+    assert stream.feed(REPLY) == CARDS
+    assert stream.finished
+
+
+@pytest.mark.parametrize("size", [1, 2, 7])
+def test_objects_come_out_as_soon_as_they_close(size):
+    stream = JsonArrayStream()
+    items = []
+    for start in range(0, len(REPLY), size):
+        piece = REPLY[start:start + size]
+        completed = stream.feed(piece)
+        if completed:
+            # An object is emitted on the piece holding its closing brace
+            assert "}" in piece
+        items.extend(completed)
+    assert items == CARDS
+
+
+def test_text_after_the_array_is_ignored():
+    stream = JsonArrayStream()
+    assert stream.feed('[{"a": 1}] and then [{"b": 2}]') == [{"a": 1}]
+    assert stream.feed('{"c": 3}') == []
+
+
+def test_unfinished_array():
+    stream = JsonArrayStream()
+    assert stream.feed('Sure! [{"a": 1}, {"b": ') == [{"a": 1}]
+    assert not stream.finished
+
+
+def test_format_event():
+    assert format_event("card", {"a": 1}) == 'event: card\ndata: {"a": 1}\n\n'
+    assert json.loads(format_event("card", {"a": 1}, "ndjson")) == {"event": "card", "data": {"a": 1}}
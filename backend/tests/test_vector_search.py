@@ -0,0 +1,147 @@
+import threading
+
+import numpy as np
+import pytest
+from bson.objectid import ObjectId
+
+import utils.ann_index
+import utils.vector_search as vector_search
+from utils.vector_search import LocalVectorIndex, IVFVectorIndex
+
+DIMENSIONS = 8
+
+
+def insert_cards(collection, count, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, DIMENSIONS)).astype(np.float32)
+    ids = collection.insert_many([{"embedding": vector.tolist()} for vector in vectors]).inserted_ids
+    return ids, vectors
+
+
+def test_stale_index_reloads_in_the_background(mongo_db, monkeypatch):
+    collection = mongo_db.flashcards
+    ids, vectors = insert_cards(collection, 5)
+    index = LocalVectorIndex(collection, DIMENSIONS)
+    assert len(index.search_ids(vectors[0], top_k=1)[0]) == 1
+    assert len(index) == 5
+
+    # Another process adds a card and deletes one
+    other_ids, other_vectors = insert_cards(collection, 1, seed=1)
+    collection.delete_one({"_id": ids[0]})
+
+    monkeypatch.setattr(vector_search, "VECTOR_INDEX_REFRESH_SECONDS", 0.01)
+    index._loaded_at -= 1
+    index.search_ids(other_vectors[0], top_k=1)  # Served from the old index; starts the reload
+    index._refresher.join(5)
+
+    found, _ = index.search_ids(other_vectors[0], top_k=1)
+    assert found == [other_ids[0]]
+    assert ids[0] not in index.index
+
+
+def test_writes_during_a_reload_are_kept(mongo_db):
+    collection = mongo_db.flashcards
+    ids, vectors = insert_cards(collection, 3)
+    index = LocalVectorIndex(collection, DIMENSIONS)
+    index.load()
+
+    reading = threading.Event()
+    resume = threading.Event()
+    original = index._iter_embeddings
+
+    def slow_iter(query=None):
+        reading.set()
+        resume.wait(5)
+        return original(query)
+
+    index._iter_embeddings = slow_iter
+    reload = threading.Thread(target=index.load)
+    reload.start()
+    reading.wait(5)
+    added = ObjectId()
+    index.add([added], [np.ones(DIMENSIONS, dtype=np.float32)])
+    index.remove([ids[1]])
+    resume.set()
+    reload.join(5)
+
+    assert added in index.index
+    assert ids[1] not in index.index
+    assert len(index) == 3
+
+
+def test_ivf_training_runs_off_the_request_thread(mongo_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(utils.ann_index, "IVF_MIN_TRAIN_SIZE", 50)
+    collection = mongo_db.flashcards
+    ids, vectors = insert_cards(collection, 49)
+    index = IVFVectorIndex(collection, DIMENSIONS, path=str(tmp_path / "ivf.npz"))
+    index.load()
+    assert not index.index.is_trained
+
+    release = threading.Event()
+    fit = utils.ann_index.IVFIndex.fit_centroids
+
+    def slow_fit(self, data, n):
+        release.wait(5)
+        return fit(self, data, n)
+
+    monkeypatch.setattr(utils.ann_index.IVFIndex, "fit_centroids", slow_fit)
+    new_ids, new_vectors = insert_cards(collection, 1, seed=1)
+    index.add(new_ids, new_vectors)
+
+    # The add returned and searches still work (by full scan) while training waits
+    assert not index.index.is_trained
+    found, _ = index.search_ids(new_vectors[0], top_k=1)
+    assert found == [new_ids[0]]
+
+    release.set()
+    index._trainer.join(5)
+    assert index.index.is_trained and index.index.trained_size == 50
+    assert (tmp_path / "ivf.npz").exists()
+
+
+@pytest.mark.parametrize("refresh, warns", [(0, True), (300, False)])
+def test_warns_when_local_index_never_refreshes(monkeypatch, capsys, refresh, warns):
+    monkeypatch.setattr(vector_search, "VECTOR_INDEX_REFRESH_SECONDS", refresh)
+    monkeypatch.setattr(vector_search, "_backends", {})
+    vector_search.get_vector_search("local")
+    assert ("single process" in capsys.readouterr().out) == warns
+
+
+def test_ivf_artifact_picks_up_re_embedded_cards(mongo_db, tmp_path):
+    from utils.quantization import embedding_fields
+
+    collection = mongo_db.flashcards
+    ids, vectors = insert_cards(collection, 20)
+    path = str(tmp_path / "ivf.npz")
+    first = IVFVectorIndex(collection, DIMENSIONS, path=path)
+    first.load()
+    first.save()
+
+    # update_flashcard re-embeds a card in another process; the artifact still has the old vector
+    edited = -vectors[3]
+    collection.update_one({"_id": ids[3]}, {"$set": embedding_fields(edited)})
+
+    reloaded = IVFVectorIndex(collection, DIMENSIONS, path=path)
+    found, scores = reloaded.search_ids(edited, top_k=1)
+    assert found == [ids[3]] and scores[0] == pytest.approx(1.0)
+
+
+def test_artifact_without_save_time_is_rebuilt(mongo_db, tmp_path):
+    collection = mongo_db.flashcards
+    ids, vectors = insert_cards(collection, 5)
+    path = str(tmp_path / "ivf.npz")
+    stale = utils.ann_index.IVFIndex(DIMENSIONS)
+    stale.add([str(_id) for _id in ids], -vectors)
+    stale.save(path)
+    with np.load(path) as artifact:
+        np.savez(path + ".npz", **{key: artifact[key] for key in artifact.files if key != "saved_at"})
+
+    index = IVFVectorIndex(collection, DIMENSIONS, path=path + ".npz")
+    found, _ = index.search_ids(vectors[2], top_k=1)
+    assert found == [ids[2]]
+
+
+def test_relative_index_path_resolves_under_the_data_dir(mongo_db, tmp_path, monkeypatch):
+    from utils import data_dir
+
+    monkeypatch.setattr(data_dir, "DATA_DIR", str(tmp_path))
+    assert IVFVectorIndex(mongo_db.flashcards, DIMENSIONS, path="ivf.npz").path == str(tmp_path / "ivf.npz")
@@ -0,0 +1,364 @@
+import itertools
+import math
+import os
+import time
+
+import numpy as np
+
+# Below this many vectors an IVF index just scans everything; clustering buys nothing
+IVF_MIN_TRAIN_SIZE = int(os.getenv("IVF_MIN_TRAIN_SIZE", "10000"))
+# Retrain the coarse quantizer once the index has grown this many times past its training size
+IVF_RETRAIN_GROWTH = float(os.getenv("IVF_RETRAIN_GROWTH", "4"))
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize_binary(vectors):
+    # One sign bit per dimension, packed 8 per byte (matches BSON PACKED_BIT)
+    return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+
+def quantize_int8(vectors):
+    """
+    Scale each vector so its largest component maps to +/-127 and round.
+
+    The per-vector scale is not stored: cosine similarity is scale invariant,
+    so int8 codes can be compared (or rescored) directly.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scale = np.abs(vectors).max(axis=-1, keepdims=True)
+    scale[scale == 0] = 1.0
+    return np.rint(vectors / scale * 127).astype(np.int8)
+
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(codes):
+        return _POPCOUNT_TABLE[codes]
+
+
+def top_k_rows(scores, top_k):
+    """Indices of the top_k largest scores, best first."""
+    k = min(top_k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class FlatIndex:
+    """
+    Exact cosine index over a contiguous float32 matrix.
+
+    Rows are L2-normalized on insert, so a query is one matmul followed by
+    argpartition for the top-k. The matrix grows by doubling and deletes swap
+    the last row into the hole, keeping live rows contiguous.
+    """
+
+    # Row storage; subclasses that store compressed codes override these
+    dtype = np.float32
+
+    def __init__(self, dimensions, capacity=1024):
+        self.dimensions = dimensions
+        self._matrix = np.empty((capacity, self.code_width(dimensions)), dtype=self.dtype)
+        self._ids = []
+        self._rows = {}
+
+    @staticmethod
+    def code_width(dimensions):
+        return dimensions
+
+    def encode(self, vectors):
+        return normalize(vectors).reshape(-1, self.dimensions)
+
+    def scores(self, rows, query):
+        # rows are stored codes, query is one raw vector; higher is more similar
+        return rows @ normalize(query)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, _id):
+        return _id in self._rows
+
+    @property
+    def ids(self):
+        return list(self._ids)
+
+    @property
+    def vectors(self):
+        return self._matrix[:len(self._ids)]
+
+    def add(self, ids, vectors):
+        """Insert or replace vectors for the given ids."""
+        self.add_codes(ids, self.encode(vectors))
+
+    def add_codes(self, ids, codes):
+        """Insert or replace rows that are already encoded (e.g. codes stored in Mongo)."""
+        new_ids, new_rows = [], []
+        for _id, code in zip(ids, codes):
+            row = self._rows.get(_id)
+            if row is None:
+                new_ids.append(_id)
+                new_rows.append(code)
+            else:
+                self._matrix[row] = code
+                self._row_replaced(row)
+        if new_ids:
+            self._append(new_ids, np.vstack(new_rows))
+
+    def _append(self, ids, vectors):
+        n = len(self._ids)
+        needed = n + len(ids)
+        if needed > self._matrix.shape[0]:
+            grown = np.empty((max(needed, 2 * self._matrix.shape[0]), self._matrix.shape[1]), dtype=self.dtype)
+            grown[:n] = self._matrix[:n]
+            self._matrix = grown
+        self._matrix[n:needed] = vectors
+        for offset, _id in enumerate(ids):
+            self._rows[_id] = n + offset
+        self._ids.extend(ids)
+        self._rows_appended(n, needed)
+
+    def remove(self, ids):
+        for _id in ids:
+            row = self._rows.pop(_id, None)
+            if row is None:
+                continue
+            last = len(self._ids) - 1
+            self._row_released(row)
+            if row != last:
+                moved = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved
+                self._rows[moved] = row
+                self._row_moved(last, row)
+            self._ids.pop()
+
+    def search(self, query, top_k=5, num_candidates=None):
+        """Return (ids, cosine similarities) of the top_k rows, best first."""
+        if not self._ids or top_k <= 0:
+            return [], np.empty(0, dtype=np.float32)
+        scores = self.scores(self.vectors, query)
+        top = top_k_rows(scores, top_k)
+        return [self._ids[i] for i in top], scores[top]
+
+    # Hooks for subclasses that keep per-row bookkeeping
+    def _rows_appended(self, start, stop):
+        pass
+
+    def _row_replaced(self, row):
+        pass
+
+    def _row_released(self, row):
+        pass
+
+    def _row_moved(self, src, dst):
+        pass
+
+
+class BinaryIndex(FlatIndex):
+    """
+    Exact Hamming-distance index over sign bits packed 8 per byte.
+
+    A 768-dim float32 vector (3 KB) becomes a 96-byte code, so the whole
+    corpus fits in a fraction of the memory. Ranking by Hamming distance is a
+    coarse approximation of cosine similarity; callers are expected to
+    over-fetch candidates and rescore them at full precision.
+    """
+
+    dtype = np.uint8
+
+    @staticmethod
+    def code_width(dimensions):
+        return (dimensions + 7) // 8
+
+    def encode(self, vectors):
+        return quantize_binary(vectors).reshape(-1, self.code_width(self.dimensions))
+
+    def scores(self, rows, query):
+        # dimensions - 2 * hamming is the dot product of the +/-1 sign vectors
+        hamming = popcount(np.bitwise_xor(rows, quantize_binary(query))).sum(axis=1, dtype=np.int32)
+        return (self.dimensions - 2 * hamming).astype(np.float32)
+
+
+class IVFIndex(FlatIndex):
+    """
+    Inverted-file (IVF-Flat) approximate index.
+
+    A spherical k-means quantizer splits the vectors into nlist cells; a query
+    only scans the cells whose centroids are closest to it. num_candidates is
+    the recall/latency knob, as with Atlas' numCandidates: enough cells are
+    probed to cover roughly that many vectors. New vectors are assigned to
+    their nearest existing centroid, and the quantizer is retrained once the
+    index has grown IVF_RETRAIN_GROWTH times past its training size.
+    """
+
+    def __init__(self, dimensions, nlist=None, capacity=1024, iterations=10, seed=0):
+        super().__init__(dimensions, capacity)
+        self.nlist = nlist
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.trained_size = 0
+        # When the artifact this index was loaded from was written (None when built in memory)
+        self.saved_at = None
+        self._assign = np.empty(capacity, dtype=np.int32)
+        self._lists = []
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    @property
+    def needs_training(self):
+        n = len(self)
+        if not self.is_trained:
+            return n >= IVF_MIN_TRAIN_SIZE
+        return n > IVF_RETRAIN_GROWTH * self.trained_size
+
+    def train(self, sample_size=100_000):
+        """Fit the coarse quantizer on (a sample of) the current vectors and rebuild the lists."""
+        n = len(self)
+        if n == 0:
+            return
+        self.use_centroids(self.fit_centroids(self.training_sample(sample_size), n), n)
+
+    def training_sample(self, sample_size=100_000):
+        # A copy, so fit_centroids can run while the index keeps changing
+        n = len(self)
+        if n > sample_size:
+            return self.vectors[np.random.default_rng(self.seed).choice(n, sample_size, replace=False)]
+        return self.vectors.copy()
+
+    def fit_centroids(self, data, n):
+        """Spherical k-means over data (drawn from n vectors); touches nothing on the index."""
+        rng = np.random.default_rng(self.seed)
+        nlist = min(self.nlist or max(1, int(4 * math.sqrt(n))), len(data))
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = self._nearest(data, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # Reseed empty cells with random points so every centroid stays useful
+            if empty.any():
+                sums[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+            centroids = normalize(sums)
+        return centroids
+
+    def use_centroids(self, centroids, trained_size):
+        """Switch to a fitted quantizer and reassign every vector to its cell."""
+        self.centroids = centroids
+        self.trained_size = trained_size
+        self._lists = [set() for _ in range(len(centroids))]
+        self._rows_appended(0, len(self))
+
+    @staticmethod
+    def _nearest(vectors, centroids, chunk=65536):
+        # Chunked so a full-corpus assignment never materializes an n x nlist matrix
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk):
+            labels[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+        return labels
+
+    def _rows_appended(self, start, stop):
+        if stop > len(self._assign):
+            grown = np.empty(max(stop, 2 * len(self._assign)), dtype=np.int32)
+            grown[:start] = self._assign[:start]
+            self._assign = grown
+        if not self.is_trained or start == stop:
+            return
+        labels = self._nearest(self._matrix[start:stop], self.centroids)
+        self._assign[start:stop] = labels
+        for row, label in zip(range(start, stop), labels):
+            self._lists[label].add(row)
+
+    def _row_replaced(self, row):
+        if self.is_trained:
+            self._row_released(row)
+            self._rows_appended(row, row + 1)
+
+    def _row_released(self, row):
+        if self.is_trained:
+            self._lists[self._assign[row]].discard(row)
+
+    def _row_moved(self, src, dst):
+        if self.is_trained:
+            label = self._assign[src]
+            self._lists[label].discard(src)
+            self._lists[label].add(dst)
+            self._assign[dst] = label
+
+    def nprobe_for(self, num_candidates):
+        # Probe enough cells to cover about num_candidates vectors
+        per_cell = max(len(self) / len(self._lists), 1.0)
+        return int(min(max(math.ceil(num_candidates / per_cell), 1), len(self._lists)))
+
+    def search(self, query, top_k=5, num_candidates=100):
+        if not self.is_trained:
+            return super().search(query, top_k)
+        if not self._ids or top_k <= 0:
+            return [], np.empty(0, dtype=np.float32)
+
+        query = normalize(query)
+        cells = top_k_rows(self.centroids @ query, self.nprobe_for(max(num_candidates, top_k)))
+        candidates = np.fromiter(
+            itertools.chain.from_iterable(self._lists[c] for c in cells), dtype=np.int64
+        )
+        if len(candidates) == 0:
+            return [], np.empty(0, dtype=np.float32)
+        scores = self._matrix[candidates] @ query
+        top = top_k_rows(scores, top_k)
+        return [self._ids[candidates[i]] for i in top], scores[top]
+
+    def save(self, path):
+        """Write the index to an .npz artifact (atomically, via a temp file)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                ids=np.array([str(_id) for _id in self._ids]),
+                vectors=self.vectors,
+                centroids=self.centroids if self.is_trained else np.empty((0, self.dimensions), dtype=np.float32),
+                assign=self._assign[:len(self)],
+                trained_size=np.array(self.trained_size),
+                saved_at=np.array(time.time()),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, id_type=str, **kwargs):
+        """Rebuild an index from an artifact written by save(); id_type converts the stored id strings."""
+        with np.load(path) as artifact:
+            vectors = artifact["vectors"]
+            index = cls(vectors.shape[1], capacity=max(len(vectors), 1024), **kwargs)
+            ids = [id_type(_id) for _id in artifact["ids"]]
+            if len(artifact["centroids"]):
+                index.centroids = artifact["centroids"]
+                index.trained_size = int(artifact["trained_size"])
+                index._lists = [set() for _ in range(len(index.centroids))]
+            if "saved_at" in artifact.files:
+                index.saved_at = float(artifact["saved_at"])
+            # Vectors are stored normalized, so append them directly without re-normalizing
+            index._matrix[:len(vectors)] = vectors
+            index._ids = ids
+            index._rows = {_id: row for row, _id in enumerate(ids)}
+            index._assign = np.empty(len(index._matrix), dtype=np.int32)
+            if index.is_trained:
+                index._assign[:len(ids)] = artifact["assign"]
+                for row, label in enumerate(index._assign[:len(ids)]):
+                    index._lists[label].add(row)
+        return index
+
+
+__all__ = ['FlatIndex', 'BinaryIndex', 'IVFIndex', 'normalize', 'quantize_binary', 'quantize_int8', 'top_k_rows']
@@ -0,0 +1,34 @@
+import threading
+
+from utils.db import MONGO_URI, db
+from utils.metrics import mongo_command_timer
+
+# Async (motor) handles on the same database as utils/db.py, for the ASGI app.
+# motor binds a client to the event loop it is first used on, so the client is
+# created lazily from inside the serving loop rather than at import time.
+_client = None
+_lock = threading.Lock()
+
+
+def get_async_db():
+    global _client
+    with _lock:
+        if _client is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            _client = AsyncIOMotorClient(MONGO_URI, event_listeners=[mongo_command_timer])
+        return _client.get_database(db.name)
+
+
+def get_async_collection(name):
+    return get_async_db().get_collection(name)
+
+
+def close_async_db():
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+__all__ = ['get_async_db', 'get_async_collection', 'close_async_db']
@@ -0,0 +1,64 @@
+import os
+
+# Chunking settings (override via .env)
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "6000"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "300"))
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")  # gpt-4o's encoding
+
+# tiktoken is optional: without it token counts are estimated from word counts
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+except Exception:
+    _encoding = None
+
+# Rough English average, used only when tiktoken isn't installed
+TOKENS_PER_WORD = 4 / 3
+
+
+def count_tokens(text):
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return int(len(text.split()) * TOKENS_PER_WORD)
+
+
+def chunk_text(text, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Split text into chunks of at most max_tokens tokens, each sharing
+    overlap_tokens tokens with the previous one so no fact is cut in half
+    without appearing whole somewhere.
+
+    Returns:
+        list[str]: The chunks in document order (a single chunk if the text fits).
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+    stride = max_tokens - overlap_tokens
+
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        return [
+            _encoding.decode(tokens[start:start + max_tokens])
+            for start in range(0, max(len(tokens) - overlap_tokens, 1), stride)
+        ]
+
+    # Fallback: window over words, converting the token budget with TOKENS_PER_WORD
+    words = text.split()
+    max_words = max(int(max_tokens / TOKENS_PER_WORD), 1)
+    word_stride = max(int(stride / TOKENS_PER_WORD), 1)
+    overlap_words = max_words - word_stride
+    return [
+        " ".join(words[start:start + max_words])
+        for start in range(0, max(len(words) - overlap_words, 1), word_stride)
+    ]
+
+
+def select_evenly(items, limit):
+    """Pick at most limit items spread evenly across the list (keeps document coverage when capping)."""
+    if len(items) <= limit:
+        return list(items)
+    step = len(items) / limit
+    return [items[int(i * step)] for i in range(limit)]
+
+
+__all__ = ['count_tokens', 'chunk_text', 'select_evenly', 'CHUNK_MAX_TOKENS', 'CHUNK_OVERLAP_TOKENS']
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from utils.chunking import count_tokens
+
+# Conversation store settings (override via .env)
+#   CONVERSATION_STORE: "memory" (per process) or "mongo" (shared by every worker)
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "memory")
+# Non-system messages kept per chat; older turns are dropped on write
+CHAT_MAX_MESSAGES = int(os.getenv("CHAT_MAX_MESSAGES", "20"))
+# Token budget for the history sent to the LLM (system prompt excluded); oldest turns are cut on read
+CHAT_MAX_TOKENS = int(os.getenv("CHAT_MAX_TOKENS", "12000"))
+CHAT_MAX_CONVERSATIONS = int(os.getenv("CHAT_MAX_CONVERSATIONS", "1000"))
+CHAT_TTL_SECONDS = int(os.getenv("CHAT_TTL_SECONDS", str(6 * 60 * 60)))
+
+
+def trim_history(messages, max_tokens=CHAT_MAX_TOKENS):
+    """
+    Keep the newest messages that fit in max_tokens. When turns are dropped a
+    short note replaces them, so the model knows the history was truncated.
+    The newest message is always kept.
+    """
+    kept, total = [], 0
+    for message in reversed(messages):
+        tokens = count_tokens(message["content"])
+        if kept and total + tokens > max_tokens:
+            break
+        kept.append(message)
+        total += tokens
+    kept.reverse()
+
+    dropped = len(messages) - len(kept)
+    if dropped:
+        kept.insert(0, {"role": "system", "content": f"[{dropped} earlier messages omitted]"})
+    return kept
+
+
+class MemoryConversationStore:
+    """
+    Per-process conversation store: an LRU of chats with a TTL on last use.
+
+    Each chat keeps its system prompt plus at most max_messages later messages.
+    """
+
+    def __init__(self, max_conversations=CHAT_MAX_CONVERSATIONS, ttl_seconds=CHAT_TTL_SECONDS,
+                 max_messages=CHAT_MAX_MESSAGES, max_tokens=CHAT_MAX_TOKENS):
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, chat_id):
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return None
+        if time.monotonic() - chat["updated_at"] > self.ttl_seconds:
+            del self._chats[chat_id]
+            return None
+        chat["updated_at"] = time.monotonic()
+        self._chats.move_to_end(chat_id)
+        return chat
+
+    def exists(self, chat_id):
+        with self._lock:
+            return self._get(chat_id) is not None
+
+    def ensure(self, chat_id, system_prompt):
+        """Start a conversation with system_prompt unless one already exists."""
+        with self._lock:
+            if self._get(chat_id) is None:
+                self._chats[chat_id] = {"system": system_prompt, "messages": [], "updated_at": time.monotonic()}
+                while len(self._chats) > self.max_conversations:
+                    self._chats.popitem(last=False)
+
+    def append(self, chat_id, *messages):
+        with self._lock:
+            chat = self._get(chat_id)
+            if chat is None:
+                raise KeyError(chat_id)
+            chat["messages"].extend(messages)
+            del chat["messages"][:-self.max_messages]
+
+    def system_prompt(self, chat_id):
+        with self._lock:
+            chat = self._get(chat_id)
+            return chat["system"] if chat else None
+
+    def messages(self, chat_id):
+        """Messages to send to the LLM: the system prompt, then the history trimmed to the token budget."""
+        with self._lock:
+            chat = self._get(chat_id)
+            if chat is None:
+                return []
+            system, history = chat["system"], list(chat["messages"])
+        return [{"role": "system", "content": system}] + trim_history(history, self.max_tokens)
+
+    def delete(self, chat_id):
+        with self._lock:
+            self._chats.pop(chat_id, None)
+
+    def __len__(self):
+        return len(self._chats)
+
+
+class MongoConversationStore:
+    """
+    Conversation store in a Mongo collection, shared by every worker process.
+
+    Appends are a single $push with $slice, so the per-chat cap is enforced
+    atomically; expiry is handled by a TTL index on updated_at (declared in
+    utils/indexes.py, with CHAT_TTL_SECONDS).
+    """
+
+    def __init__(self, collection, max_messages=CHAT_MAX_MESSAGES, max_tokens=CHAT_MAX_TOKENS):
+        self.collection = collection
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc)
+
+    def exists(self, chat_id):
+        return self.collection.count_documents({"_id": chat_id}, limit=1) > 0
+
+    def ensure(self, chat_id, system_prompt):
+        self.collection.update_one(
+            {"_id": chat_id},
+            {"$setOnInsert": {"system": system_prompt, "messages": []}, "$set": {"updated_at": self._now()}},
+            upsert=True,
+        )
+
+    def append(self, chat_id, *messages):
+        result = self.collection.update_one(
+            {"_id": chat_id},
+            {
+                "$push": {"messages": {"$each": list(messages), "$slice": -self.max_messages}},
+                "$set": {"updated_at": self._now()},
+            },
+        )
+        if not result.matched_count:
+            raise KeyError(chat_id)
+
+    def system_prompt(self, chat_id):
+        chat = self.collection.find_one({"_id": chat_id}, {"system": 1})
+        return chat["system"] if chat else None
+
+    def messages(self, chat_id):
+        chat = self.collection.find_one({"_id": chat_id}, {"system": 1, "messages": 1})
+        if not chat:
+            return []
+        return [{"role": "system", "content": chat["system"]}] + trim_history(chat["messages"], self.max_tokens)
+
+    def delete(self, chat_id):
+        self.collection.delete_one({"_id": chat_id})
+
+
+def create_conversation_store(backend=CONVERSATION_STORE):
+    if backend == "memory":
+        return MemoryConversationStore()
+    if backend == "mongo":
+        from utils.db import db
+        return MongoConversationStore(db.get_collection("conversations"))
+    raise ValueError(f"Unknown conversation store backend: {backend}")
+
+
+# Shared store for the process
+conversation_store = create_conversation_store()
+
+__all__ = ['MemoryConversationStore', 'MongoConversationStore', 'conversation_store', 'create_conversation_store', 'trim_history']
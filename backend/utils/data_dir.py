@@ -0,0 +1,14 @@
+import os
+
+# Where the on-disk state lives (override via .env): the caches, the job queue and the IVF index
+# artifact. Relative file settings resolve under it, not the working directory, so every process
+# on the host (web servers, worker.py, migrations) finds the same files wherever it was started.
+DATA_DIR = os.getenv("DATA_DIR", os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def data_path(path):
+    """Resolve a configured file path; absolute paths are kept as they are."""
+    return os.path.join(DATA_DIR, path)
+
+
+__all__ = ['DATA_DIR', 'data_path']
@@ -1,6 +1,8 @@
 from pymongo import MongoClient
 import os
 
+from utils.metrics import mongo_command_timer
+
 # Load environment variables if using a .env file
 from dotenv import load_dotenv
 load_dotenv()
@@ -8,28 +10,24 @@ load_dotenv()
 # MongoDB connection string from your Atlas dashboard
 MONGO_URI = os.getenv("MONGO_URI")
 
-# Create a client instance
-client = MongoClient(MONGO_URI)
+# Create a client instance. connect=False defers connecting to the first operation, so
+# importing this module does no network I/O; collections are created on first write.
+# Indexes are declared in utils/indexes.py (every command is timed for /metrics).
+client = MongoClient(MONGO_URI, connect=False, event_listeners=[mongo_command_timer])
 
 # Access a specific database
 db = client.get_database("database_name")
 
-# Create user and flashcard collections if they do not exist
-if "users" not in db.list_collection_names():
-    db.create_collection("users")
-if "flashcards" not in db.list_collection_names():
-    db.create_collection("flashcards")
-if "performance_data" not in db.list_collection_names():
-    db.create_collection("performance_data")
-if "classes" not in db.list_collection_names():
-    db.create_collection("classes")
-
 # Access a collection
 user_collection = db.get_collection("users")
 flashcard_collection = db.get_collection("flashcards")
 performance_collection = db.get_collection("performance_data")
 class_collection = db.get_collection("classes")
+# One small document per (user, flashcard) Q-learning state (see controllers/performance_controller.py)
+card_performance_collection = db.get_collection("card_performance")
+# Append-only log of graded answers, replayed to rebuild Q-tables (see utils/q_table.py)
+answer_history_collection = db.get_collection("answer_history")
 
 
 # Export db and collection for use in other modules
-__all__ = ['db', 'user_collection', 'flashcard_collection', 'performance_collection', 'class_collection']
+__all__ = ['db', 'user_collection', 'flashcard_collection', 'performance_collection', 'class_collection', 'card_performance_collection', 'answer_history_collection']
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.data_dir import data_path
+
+# Cache settings (override via .env). Set EMBEDDING_CACHE_PATH to "" to disable the disk tier.
+# Relative paths are resolved under DATA_DIR (see utils/data_dir.py).
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+
+
+def normalize_text(text):
+    # Unicode-normalize and collapse whitespace; case is kept since the model is cased
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(text, precision, model_name=""):
+    raw = f"{model_name}\0{precision}\0{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier, content-addressed embedding cache.
+
+    Tier 1 is an in-process LRU (OrderedDict) of numpy vectors; tier 2 is an
+    optional SQLite file shared by every worker on the host, opened on first
+    use. Disk hits are promoted into the LRU.
+    """
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE, path=EMBEDDING_CACHE_PATH):
+        self.max_entries = max_entries
+        self.path = data_path(path) if path else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        # Called with the lock held; None when the disk tier is disabled
+        if self._conn is None and self.path:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, dtype TEXT NOT NULL, vector BLOB NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            conn = self._connection()
+            if conn is not None:
+                row = conn.execute(
+                    "SELECT dtype, vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    vector = np.frombuffer(row[1], dtype=row[0])
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, key, vector):
+        return self.put_many([(key, vector)])[0]
+
+    def put_many(self, items):
+        """Store (key, vector) pairs in one disk transaction; returns the stored read-only vectors, in order."""
+        vectors = []
+        for _, vector in items:
+            vector = np.array(vector)
+            vector.setflags(write=False)
+            vectors.append(vector)
+        keys = [key for key, _ in items]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+            conn = self._connection()
+            if conn is not None and vectors:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, dtype, vector) VALUES (?, ?, ?)",
+                        [(key, vector.dtype.str, vector.tobytes()) for key, vector in zip(keys, vectors)],
+                    )
+        return vectors
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            conn = self._connection()
+            if conn is not None:
+                conn.execute("DELETE FROM embeddings")
+                conn.commit()
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+# Shared cache instance for the process
+embedding_cache = EmbeddingCache()
+
+__all__ = ['EmbeddingCache', 'embedding_cache', 'cache_key', 'normalize_text']
@@ -0,0 +1,59 @@
+import os
+import threading
+import time
+
+# Embedding model settings (override via .env)
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "nomic-ai/nomic-embed-text-v1")
+
+_model = None
+_load_seconds = None
+_lock = threading.Lock()
+
+
+def get_model():
+    """
+    Return the process-wide SentenceTransformer, loading it on first use.
+
+    sentence_transformers (and torch) are imported here rather than at module
+    import so processes that only serve CRUD routes never pay for the model.
+    """
+    global _model, _load_seconds
+    if _model is not None:
+        return _model
+
+    with _lock:
+        # Another thread may have finished loading while we waited
+        if _model is None:
+            from sentence_transformers import SentenceTransformer
+
+            start = time.perf_counter()
+            _model = SentenceTransformer(EMBEDDING_MODEL_NAME, trust_remote_code=True)
+            _load_seconds = time.perf_counter() - start
+            print(f"Loaded embedding model {EMBEDDING_MODEL_NAME} in {_load_seconds:.2f}s")
+    return _model
+
+
+def warm_up():
+    """
+    Eagerly load the model and run one encode so the first request doesn't pay for it.
+
+    Returns:
+        float: Seconds spent loading the model.
+    """
+    get_model().encode("warm up")
+    return _load_seconds
+
+
+def is_loaded():
+    return _model is not None
+
+
+def model_info():
+    return {
+        "model": EMBEDDING_MODEL_NAME,
+        "loaded": is_loaded(),
+        "load_seconds": _load_seconds,
+    }
+
+
+__all__ = ['get_model', 'warm_up', 'is_loaded', 'model_info', 'EMBEDDING_MODEL_NAME']
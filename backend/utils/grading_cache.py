@@ -0,0 +1,119 @@
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# Grading cache settings (override via .env)
+#   GRADING_CACHE_PERSIST: "" (per-process only) or "mongo" (verdicts shared by every worker)
+GRADING_CACHE_SIZE = int(os.getenv("GRADING_CACHE_SIZE", "10000"))
+GRADING_CACHE_TTL_SECONDS = int(os.getenv("GRADING_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+GRADING_CACHE_PERSIST = os.getenv("GRADING_CACHE_PERSIST", "")
+
+# Only sentence-final punctuation is dropped: "C++", "C#", "x'" and "5%" must not collapse into "c", "x" and "5"
+_SENTENCE_END = ".!? "
+
+
+def normalize_answer(text):
+    # Case, Unicode form, spacing and a closing full stop/!/? don't change a grade
+    text = " ".join(unicodedata.normalize("NFKC", text or "").casefold().split())
+    return text.rstrip(_SENTENCE_END)
+
+
+def grading_key(flashcard_id, question, answer):
+    raw = f"{flashcard_id or ''}\0{normalize_answer(question)}\0{normalize_answer(answer)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class GradingCache:
+    """
+    Verdicts from the answer-grading LLM call, keyed by grading_key().
+
+    Tier 1 is an in-process LRU with a TTL; tier 2 is an optional Mongo
+    collection (expired by the TTL index in utils/indexes.py) so a verdict computed by one worker is
+    reused by all of them. Tier 2 hits are promoted into memory.
+    """
+
+    def __init__(self, max_entries=GRADING_CACHE_SIZE, ttl_seconds=GRADING_CACHE_TTL_SECONDS, collection=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.collection = collection
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached verdict dict for key, or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if time.monotonic() - entry[0] <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return dict(entry[1])
+                del self._memory[key]
+
+        if self.collection is not None:
+            doc = self.collection.find_one({"_id": key}, {"verdict": 1})
+            if doc:
+                with self._lock:
+                    self._remember(key, doc["verdict"])
+                    self.persistent_hits += 1
+                return dict(doc["verdict"])
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, verdict):
+        verdict = dict(verdict)
+        with self._lock:
+            self._remember(key, verdict)
+        if self.collection is not None:
+            self.collection.update_one(
+                {"_id": key},
+                {"$set": {"verdict": verdict, "created_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+        return verdict
+
+    def _remember(self, key, verdict):
+        self._memory[key] = (time.monotonic(), verdict)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.collection is not None:
+            self.collection.delete_many({})
+
+    def stats(self):
+        lookups = self.memory_hits + self.persistent_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.persistent_hits) / lookups if lookups else 0.0,
+        }
+
+
+def create_grading_cache(persist=GRADING_CACHE_PERSIST):
+    if not persist:
+        return GradingCache()
+    if persist == "mongo":
+        from utils.db import db
+        return GradingCache(collection=db.get_collection("grading_cache"))
+    raise ValueError(f"Unknown grading cache persistence: {persist}")
+
+
+# Shared cache instance for the process
+grading_cache = create_grading_cache()
+
+__all__ = ['GradingCache', 'grading_cache', 'create_grading_cache', 'grading_key', 'normalize_answer']
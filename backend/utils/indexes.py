@@ -0,0 +1,204 @@
+import os
+import threading
+
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+from pymongo.operations import SearchIndexModel
+
+from utils.conversation_store import CHAT_TTL_SECONDS
+from utils.grading_cache import GRADING_CACHE_TTL_SECONDS
+from utils.job_queue import JOB_RETENTION_SECONDS
+from utils.quantization import EMBEDDING_STORAGE, EMBEDDING_FIELDS
+from utils.vector_search import EMBEDDING_DIMENSIONS, VECTOR_INDEX_NAME
+
+# Indexes every collection needs, applied by ensure_indexes() (python -m migrations.ensure_indexes).
+# Names are fixed so re-running is a no-op and the report can match them up.
+INDEXES = {
+    # Login looks users up by email
+    "users": [
+        IndexModel([("email", 1)], name="email_1"),
+    ],
+    # Profile reads, upserts and deletes go by user_id
+    "performance_data": [
+        IndexModel([("user_id", 1)], name="user_id_1"),
+    ],
+    # GET /flashcards filters, each paired with _id so keyset pages stay index range scans
+    "flashcards": [
+        IndexModel([("owner_id", 1), ("_id", 1)], name="owner_id_1__id_1"),
+        IndexModel([("topic", 1), ("_id", 1)], name="topic_1__id_1"),
+        IndexModel([("difficulty", 1), ("_id", 1)], name="difficulty_1__id_1"),
+    ],
+    # One document per (user, flashcard); ordered by score within a user so recommendations are a range scan
+    "card_performance": [
+        IndexModel([("user_id", 1), ("flashcard_id", 1)], name="user_id_1_flashcard_id_1", unique=True),
+        IndexModel([("user_id", 1), ("score", 1)], name="user_id_1_score_1"),
+    ],
+    # Replayed per user, oldest first, to rebuild Q-tables
+    "answer_history": [
+        IndexModel([("user_id", 1), ("_id", 1)], name="user_id_1__id_1"),
+    ],
+    # Chats when CONVERSATION_STORE=mongo, dropped once idle for CHAT_TTL_SECONDS
+    "conversations": [
+        IndexModel([("updated_at", 1)], name="updated_at_1", expireAfterSeconds=CHAT_TTL_SECONDS),
+    ],
+    # Shared grading verdicts (GRADING_CACHE_PERSIST=mongo), kept for GRADING_CACHE_TTL_SECONDS
+    "grading_cache": [
+        IndexModel([("created_at", 1)], name="created_at_1", expireAfterSeconds=GRADING_CACHE_TTL_SECONDS),
+    ],
+    # Jobs when JOB_QUEUE_BACKEND=mongo: claims take the oldest queued job; finished ones expire
+    "jobs": [
+        IndexModel([("status", 1), ("created_at", 1)], name="status_1_created_at_1"),
+        IndexModel([("finished_at", 1)], name="finished_at_1", expireAfterSeconds=JOB_RETENTION_SECONDS),
+    ],
+}
+
+# Apply the declared indexes in a background thread when the app starts (override via .env)
+ENSURE_INDEXES_ON_STARTUP = os.getenv("ENSURE_INDEXES_ON_STARTUP", "1") == "1"
+
+# Atlas vector search similarity per stored encoding (sign-bit vectors only support euclidean)
+VECTOR_SIMILARITY = {"float32": "cosine", "int8": "cosine", "binary": "euclidean"}
+
+
+def vector_index_model(storage=None, dimensions=EMBEDDING_DIMENSIONS, name=VECTOR_INDEX_NAME):
+    """
+    The Atlas vectorSearch index over the stored embedding encodings, with the
+    GET /flashcards filter fields available as $vectorSearch pre-filters.
+    """
+    fields = [
+        {
+            "type": "vector",
+            "path": EMBEDDING_FIELDS[precision],
+            "numDimensions": dimensions,
+            "similarity": VECTOR_SIMILARITY[precision],
+        }
+        for precision in storage or EMBEDDING_STORAGE
+    ]
+    fields += [{"type": "filter", "path": path} for path in ("owner_id", "topic", "difficulty")]
+    return SearchIndexModel(definition={"fields": fields}, name=name, type="vectorSearch")
+
+
+def _index_name(model):
+    return model.document["name"]
+
+
+def ensure_indexes(db, indexes=INDEXES, dry_run=False):
+    """
+    Create the declared indexes that don't exist yet, one create_indexes call per collection.
+
+    Returns:
+        dict: collection -> {"existing": [...], "missing": [...], "created": [...], "failed": {name: error}}
+    """
+    report = {}
+    for collection_name, models in indexes.items():
+        collection = db.get_collection(collection_name)
+        try:
+            existing = set(collection.index_information())
+        except OperationFailure:
+            # Collection doesn't exist yet; create_indexes creates it
+            existing = set()
+        missing = [model for model in models if _index_name(model) not in existing]
+        result = report[collection_name] = {
+            "existing": [_index_name(model) for model in models if _index_name(model) in existing],
+            "missing": [_index_name(model) for model in missing],
+            "created": [],
+            "failed": {},
+        }
+        if not missing or dry_run:
+            continue
+        try:
+            collection.create_indexes(missing)
+            result["created"] = [_index_name(model) for model in missing]
+        except OperationFailure:
+            # Create one at a time so a single conflict (e.g. duplicates under a unique index) is pinpointed
+            for model in missing:
+                try:
+                    collection.create_indexes([model])
+                    result["created"].append(_index_name(model))
+                except OperationFailure as e:
+                    result["failed"][_index_name(model)] = str(e)
+    return report
+
+
+def ensure_vector_index(collection, model=None, dry_run=False):
+    """
+    Create or update the Atlas vector index to match vector_index_model().
+
+    Returns:
+        str: "created", "updated", "unchanged", "missing"/"outdated" (dry run) or "unsupported" (not on Atlas).
+    """
+    model = model or vector_index_model()
+    name, definition = model.document["name"], model.document["definition"]
+    try:
+        current = next(iter(collection.list_search_indexes(name)), None)
+        if current is None:
+            if not dry_run:
+                collection.create_search_index(model)
+            return "missing" if dry_run else "created"
+        if current.get("latestDefinition", current.get("definition")) == definition:
+            return "unchanged"
+        if not dry_run:
+            collection.update_search_index(name, definition)
+        return "outdated" if dry_run else "updated"
+    except (OperationFailure, NotImplementedError, AttributeError, TypeError):
+        # Search indexes only exist on Atlas (and Atlas local deployments); mocks lack the methods entirely
+        return "unsupported"
+
+
+def ensure_indexes_in_background(db):
+    """
+    Run ensure_indexes() off the import path, so startup doesn't wait on the
+    database; its first command also shows whether the database is reachable.
+    """
+    def bootstrap():
+        try:
+            report = ensure_indexes(db)
+        except PyMongoError as e:
+            print("Failed to connect to the database:", e)
+            return
+        created = [f"{name}.{index}" for name, result in report.items() for index in result["created"]]
+        print(f"Connected to the database; created indexes: {', '.join(created) or 'none needed'}")
+        for name, result in report.items():
+            for index, error in result["failed"].items():
+                print(f"Could not create index {name}.{index}: {error}")
+
+    thread = threading.Thread(target=bootstrap, name="index-bootstrap", daemon=True)
+    thread.start()
+    return thread
+
+
+def index_usage(collection):
+    # Index name -> operations since the server last started (None where $indexStats isn't available)
+    try:
+        return {stat["name"]: stat["accesses"]["ops"] for stat in collection.aggregate([{"$indexStats": {}}])}
+    except (PyMongoError, NotImplementedError):
+        return None
+
+
+def index_report(db, indexes=INDEXES):
+    """
+    Compare the declared indexes with what the database has.
+
+    Returns:
+        dict: collection -> {"missing": declared but absent, "extra": present but not declared,
+                             "unused": present with no operations since the server started}
+    """
+    report = {}
+    for collection_name, models in indexes.items():
+        collection = db.get_collection(collection_name)
+        try:
+            existing = set(collection.index_information())
+        except OperationFailure:
+            existing = set()
+        declared = {_index_name(model) for model in models}
+        usage = index_usage(collection)
+        report[collection_name] = {
+            "missing": sorted(declared - existing),
+            "extra": sorted(existing - declared - {"_id_"}),
+            "unused": sorted(name for name, ops in (usage or {}).items() if ops == 0 and name != "_id_"),
+            "usage": usage,
+        }
+    return report
+
+
+__all__ = ['INDEXES', 'vector_index_model', 'ensure_indexes', 'ensure_indexes_in_background', 'ensure_vector_index',
+           'index_usage', 'index_report']
@@ -0,0 +1,497 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from utils.data_dir import data_path
+
+# Job queue settings (override via .env)
+#   JOB_QUEUE_BACKEND: "sqlite" (one host) or "mongo" (workers on any host; uploads go to GridFS)
+#   JOB_QUEUE_PATH: the SQLite queue, relative to DATA_DIR (see utils/data_dir.py) so the web
+#                   process and worker.py share it wherever each was started
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "sqlite")
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+# A running job whose worker hasn't sent a heartbeat for this long is assumed lost and requeued
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "600"))
+# Workers renew the lease on each running job this often, however long its current stage takes
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Finished jobs (and their results) are kept this long
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(24 * 60 * 60)))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job handler at a progress checkpoint after cancellation was requested."""
+
+
+class JobLeaseLost(Exception):
+    """
+    Raised when a worker's lease on a job is gone (requeued as stale, or finished
+    elsewhere): the job may already be running on another worker, so this one
+    must stop without writing anything.
+    """
+
+
+class SQLiteJobStore:
+    """
+    Job queue in a SQLite file: jobs, plus the uploaded files they work on.
+
+    Claims run in an IMMEDIATE transaction, so worker threads and separate
+    worker processes on the same host never pick up the same job. The file is
+    opened on first use.
+    """
+
+    def __init__(self, path=JOB_QUEUE_PATH):
+        self.path = data_path(path)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        # Called with the lock held
+        if self._conn is None:
+            self._conn = self._open()
+        return self._conn
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, params TEXT NOT NULL,"
+            " progress REAL NOT NULL DEFAULT 0, stage TEXT, result TEXT, error TEXT,"
+            " cancel_requested INTEGER NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL, lease TEXT)"
+        )
+        try:
+            # Queue files created before leases existed
+            conn.execute("ALTER TABLE jobs ADD COLUMN lease TEXT")
+        except sqlite3.OperationalError:
+            pass
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_files ("
+            " job_id TEXT NOT NULL, position INTEGER NOT NULL, filename TEXT NOT NULL, data BLOB NOT NULL,"
+            " PRIMARY KEY (job_id, position))"
+        )
+        return conn
+
+    def _transaction(self, statements):
+        # statements: callable taking the connection; runs under BEGIN IMMEDIATE
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(conn)
+                conn.execute("COMMIT")
+                return result
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def create(self, kind, params, files=()):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        def insert(conn):
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(params), now, now),
+            )
+            conn.executemany(
+                "INSERT INTO job_files (job_id, position, filename, data) VALUES (?, ?, ?, ?)",
+                [(job_id, i, filename, data) for i, (filename, data) in enumerate(files)],
+            )
+
+        self._transaction(insert)
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            return self._job(self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def files(self, job_id):
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT filename, data FROM job_files WHERE job_id = ? ORDER BY position", (job_id,)
+            ).fetchall()
+        return [(row["filename"], bytes(row["data"])) for row in rows]
+
+    def claim(self):
+        """
+        Mark the oldest queued job as running under a fresh lease and return it
+        (with its "lease" token), or None if the queue is empty.
+        """
+        def take(conn):
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, uuid.uuid4().hex, time.time(), row["id"]),
+            )
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+
+        return self._job(self._transaction(take))
+
+    def report(self, job_id, lease, progress=None, stage=None):
+        """
+        Renew the job's lease, recording progress if given; returns True if
+        cancellation was requested.
+
+        Raises:
+            JobLeaseLost: if the job is no longer running under this lease.
+        """
+        with self._lock:
+            conn = self._connection()
+            if progress is None:
+                cursor = conn.execute(
+                    "UPDATE jobs SET updated_at = ? WHERE id = ? AND status = ? AND lease = ?",
+                    (time.time(), job_id, RUNNING, lease),
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE jobs SET progress = ?, stage = ?, updated_at = ? WHERE id = ? AND status = ? AND lease = ?",
+                    (progress, stage, time.time(), job_id, RUNNING, lease),
+                )
+            if cursor.rowcount == 0:
+                raise JobLeaseLost()
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row["cancel_requested"])
+
+    def finish(self, job_id, status, result=None, error=None, lease=None):
+        """
+        Record a job's outcome. With a lease, only while the job still runs
+        under it; returns False (and writes nothing) otherwise.
+        """
+        def complete(conn):
+            fence, args = (" AND status = ? AND lease = ?", (RUNNING, lease)) if lease is not None else ("", ())
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, progress = CASE WHEN ? = ? THEN 1 ELSE progress END,"
+                " lease = NULL, updated_at = ? WHERE id = ?" + fence,
+                (status, json.dumps(result) if result is not None else None, error, status, SUCCEEDED, time.time(),
+                 job_id, *args),
+            )
+            if cursor.rowcount == 0:
+                return False
+            conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+            return True
+
+        return self._transaction(complete)
+
+    def cancel(self, job_id):
+        """Cancel a queued job at once, or ask a running one to stop; returns the job's status afterwards."""
+        def request(conn):
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] == QUEUED:
+                conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (CANCELLED, time.time(), job_id))
+                conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+                return CANCELLED
+            if row["status"] == RUNNING:
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return row["status"]
+
+        return self._transaction(request)
+
+    def requeue_stale(self, stale_seconds=JOB_STALE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        """Requeue running jobs whose worker went silent; fail them once they've used max_attempts."""
+        cutoff = time.time() - stale_seconds
+
+        def requeue(conn):
+            # Clearing the lease fences off the lost worker, should it come back
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = 'Worker lost too many times.', lease = NULL, updated_at = ?"
+                " WHERE status = ? AND updated_at < ? AND attempts >= ?",
+                (FAILED, time.time(), RUNNING, cutoff, max_attempts),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease = NULL, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (QUEUED, time.time(), RUNNING, cutoff),
+            )
+
+        self._transaction(requeue)
+
+    def purge_finished(self, retention_seconds=JOB_RETENTION_SECONDS):
+        cutoff = time.time() - retention_seconds
+        self._transaction(lambda conn: conn.execute(
+            f"DELETE FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED))}) AND updated_at < ?",
+            (*FINISHED, cutoff),
+        ))
+
+
+class MongoJobStore:
+    """
+    Job queue in a Mongo collection, with uploads in GridFS, so web servers and
+    workers can run on different hosts. Claims are a single find_one_and_update.
+    Finished jobs expire through a TTL index on finished_at; both indexes are
+    declared in utils/indexes.py.
+    """
+
+    def __init__(self, db, collection_name="jobs"):
+        import gridfs
+
+        self.collection = db.get_collection(collection_name)
+        self.files_bucket = gridfs.GridFSBucket(db, bucket_name="job_files")
+
+    @staticmethod
+    def _job(doc):
+        if doc is None:
+            return None
+        job = {key: value for key, value in doc.items() if key not in ("_id", "file_ids", "finished_at")}
+        job["id"] = doc["_id"]
+        job.setdefault("lease", None)
+        return job
+
+    def create(self, kind, params, files=()):
+        job_id = uuid.uuid4().hex
+        file_ids = [self.files_bucket.upload_from_stream(filename, data) for filename, data in files]
+        now = time.time()
+        self.collection.insert_one({
+            "_id": job_id, "kind": kind, "status": QUEUED, "params": params, "progress": 0.0,
+            "stage": None, "result": None, "error": None, "cancel_requested": False, "attempts": 0,
+            "file_ids": file_ids, "created_at": now, "updated_at": now,
+        })
+        return job_id
+
+    def get(self, job_id):
+        return self._job(self.collection.find_one({"_id": job_id}))
+
+    def files(self, job_id):
+        doc = self.collection.find_one({"_id": job_id}, {"file_ids": 1})
+        files = []
+        for file_id in (doc or {}).get("file_ids", []):
+            stream = self.files_bucket.open_download_stream(file_id)
+            files.append((stream.filename, stream.read()))
+        return files
+
+    def claim(self):
+        from pymongo import ReturnDocument
+
+        return self._job(self.collection.find_one_and_update(
+            {"status": QUEUED},
+            {"$set": {"status": RUNNING, "lease": uuid.uuid4().hex, "updated_at": time.time()}, "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        ))
+
+    def report(self, job_id, lease, progress=None, stage=None):
+        update = {"updated_at": time.time()}
+        if progress is not None:
+            update.update(progress=progress, stage=stage)
+        doc = self.collection.find_one_and_update(
+            {"_id": job_id, "status": RUNNING, "lease": lease}, {"$set": update}, projection={"cancel_requested": 1}
+        )
+        if doc is None:
+            raise JobLeaseLost()
+        return bool(doc.get("cancel_requested"))
+
+    def _delete_files(self, file_ids):
+        for file_id in file_ids or []:
+            self.files_bucket.delete(file_id)
+
+    def finish(self, job_id, status, result=None, error=None, lease=None):
+        update = {"status": status, "result": result, "error": error, "lease": None, "updated_at": time.time(),
+                  "finished_at": datetime.now(timezone.utc), "file_ids": []}
+        if status == SUCCEEDED:
+            update["progress"] = 1.0
+        query = {"_id": job_id} if lease is None else {"_id": job_id, "status": RUNNING, "lease": lease}
+        doc = self.collection.find_one_and_update(query, {"$set": update}, projection={"file_ids": 1})
+        if doc is None:
+            return False
+        self._delete_files(doc.get("file_ids"))
+        return True
+
+    def cancel(self, job_id):
+        doc = self.collection.find_one_and_update(
+            {"_id": job_id, "status": QUEUED},
+            {"$set": {"status": CANCELLED, "updated_at": time.time(), "finished_at": datetime.now(timezone.utc), "file_ids": []}},
+            projection={"file_ids": 1},
+        )
+        if doc is not None:
+            self._delete_files(doc.get("file_ids"))
+            return CANCELLED
+        doc = self.collection.find_one_and_update(
+            {"_id": job_id, "status": RUNNING}, {"$set": {"cancel_requested": True}}, projection={"status": 1}
+        )
+        if doc is not None:
+            return RUNNING
+        doc = self.collection.find_one({"_id": job_id}, {"status": 1})
+        return doc["status"] if doc else None
+
+    def requeue_stale(self, stale_seconds=JOB_STALE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        cutoff = time.time() - stale_seconds
+        self.collection.update_many(
+            {"status": RUNNING, "updated_at": {"$lt": cutoff}, "attempts": {"$gte": max_attempts}},
+            {"$set": {"status": FAILED, "error": "Worker lost too many times.", "lease": None, "updated_at": time.time(),
+                      "finished_at": datetime.now(timezone.utc)}},
+        )
+        self.collection.update_many(
+            {"status": RUNNING, "updated_at": {"$lt": cutoff}},
+            {"$set": {"status": QUEUED, "lease": None, "updated_at": time.time()}},
+        )
+
+    def purge_finished(self, retention_seconds=JOB_RETENTION_SECONDS):
+        # Handled by the TTL index on finished_at
+        pass
+
+
+def create_job_store(backend=JOB_QUEUE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteJobStore()
+    if backend == "mongo":
+        from utils.db import db
+        return MongoJobStore(db)
+    raise ValueError(f"Unknown job queue backend: {backend}")
+
+
+class JobContext:
+    """
+    Handed to job handlers; progress() is both the progress report and the
+    cancellation checkpoint. Meanwhile a heartbeat thread renews the job's
+    lease, so a slow stage isn't mistaken for a lost worker.
+    """
+
+    def __init__(self, store, job, heartbeat_seconds=JOB_HEARTBEAT_SECONDS):
+        self.store = store
+        self.job = job
+        self.heartbeat_seconds = heartbeat_seconds
+        self.lease_lost = threading.Event()
+        self._done = threading.Event()
+        self._heartbeat = None
+
+    def progress(self, fraction, stage=None):
+        if self.lease_lost.is_set():
+            raise JobLeaseLost()
+        if self.store.report(self.job["id"], self.job["lease"], fraction, stage):
+            raise JobCancelled()
+
+    def _beat(self):
+        while not self._done.wait(self.heartbeat_seconds):
+            try:
+                self.store.report(self.job["id"], self.job["lease"])
+            except JobLeaseLost:
+                self.lease_lost.set()
+                return
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
+
+    def __enter__(self):
+        self._heartbeat = threading.Thread(target=self._beat, name=f"job-heartbeat-{self.job['id']}", daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+        self._heartbeat.join()
+
+
+class JobWorkerPool:
+    """
+    Worker threads that claim jobs from a store and run the handler for each job's kind.
+
+    A handler is called as handler(params, files, context) and returns the
+    job's result; raising marks the job failed. The same pool runs inside the
+    web process or on its own (worker.py).
+    """
+
+    def __init__(self, store, handlers, workers=JOB_WORKERS, poll_seconds=JOB_POLL_SECONDS):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._threads = []
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._maintenance_lock = threading.Lock()
+        self._last_maintenance = 0.0
+
+    def start(self):
+        if self._threads:
+            return self
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        # Wake idle workers in this process as soon as a job is submitted
+        self._wake.set()
+
+    def _maintain(self):
+        with self._maintenance_lock:
+            if time.monotonic() - self._last_maintenance < min(JOB_STALE_SECONDS, 60):
+                return
+            self._last_maintenance = time.monotonic()
+        self.store.requeue_stale()
+        self.store.purge_finished()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self._maintain()
+                job = self.store.claim()
+            except Exception as e:
+                print(f"Job queue unavailable: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        handler = self.handlers.get(job["kind"])
+        lease = job["lease"]
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for job kind: {job['kind']}")
+            with JobContext(self.store, job) as context:
+                result = handler(job["params"], self.store.files(job["id"]), context)
+            finished = self.store.finish(job["id"], SUCCEEDED, result=result, lease=lease)
+        except JobLeaseLost:
+            finished = False
+        except JobCancelled:
+            finished = self.store.finish(job["id"], CANCELLED, lease=lease)
+        except Exception as e:
+            finished = self.store.finish(job["id"], FAILED, error=str(e), lease=lease)
+        if not finished:
+            # Requeued (or finished) elsewhere while this worker held it; the other run's outcome stands
+            print(f"Job {job['id']} lost its lease; dropped this run's outcome")
+
+
+# Shared job store for the process (the SQLite store opens its file on first use)
+job_store = create_job_store()
+
+__all__ = ['SQLiteJobStore', 'MongoJobStore', 'JobWorkerPool', 'JobContext', 'JobCancelled', 'JobLeaseLost', 'job_store',
+           'create_job_store', 'QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED', 'CANCELLED', 'FINISHED']
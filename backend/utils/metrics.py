@@ -0,0 +1,266 @@
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+# Latency buckets in seconds, from sub-millisecond Mongo reads up to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, in the Prometheus layout."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield self.name + "_bucket", labels + (("le", _format_value(float(bound))),), cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """
+    Metrics for /metrics in the Prometheus text format.
+
+    Besides counters and histograms, collectors can be registered: callables
+    returning [(name, type, help, [(labels dict, value), ...]), ...], read at
+    scrape time, for state other modules already track (cache stats, LLM totals).
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def collector(self, collect):
+        with self._lock:
+            self._collectors.append(collect)
+        return collect
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics, collectors = list(self._metrics.values()), list(self._collectors)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in metric.samples())
+        for collect in collectors:
+            for name, metric_type, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.extend(
+                    f"{name}{_format_labels(tuple(labels.items()))} {_format_value(value)}"
+                    for labels, value in samples if value is not None
+                )
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry for the process
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "flashcards_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage",))
+stage_errors = registry.counter(
+    "flashcards_stage_errors_total", "Pipeline stages that raised.", ("stage",))
+mongo_command_seconds = registry.histogram(
+    "flashcards_mongo_command_duration_seconds", "MongoDB command latency.", ("command",))
+mongo_command_errors = registry.counter(
+    "flashcards_mongo_command_errors_total", "MongoDB commands that failed.", ("command",))
+
+
+class RequestProfile:
+    """Spans recorded for one request while profiling is on, for its Server-Timing header."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.spans.append((stage, seconds))
+
+    def totals(self):
+        # Total seconds and count per stage, in first-seen order
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for stage, seconds in spans:
+            total, count = totals.get(stage, (0.0, 0))
+            totals[stage] = (total + seconds, count + 1)
+        return totals
+
+    def server_timing(self, total_seconds=None):
+        entries = [
+            f'{stage};dur={seconds * 1000:.2f};desc="{count}x"' for stage, (seconds, count) in self.totals().items()
+        ]
+        if total_seconds is not None:
+            entries.append(f"total;dur={total_seconds * 1000:.2f}")
+        return ", ".join(entries)
+
+
+_profile = contextvars.ContextVar("request_profile", default=None)
+
+
+def start_profile():
+    """Start collecting spans for the current request; returns the token for stop_profile()."""
+    return _profile.set(RequestProfile())
+
+
+def current_profile():
+    return _profile.get()
+
+
+def stop_profile(token):
+    profile = _profile.get()
+    _profile.reset(token)
+    return profile
+
+
+def _record(stage, seconds):
+    stage_seconds.observe(seconds, stage=stage)
+    profile = _profile.get()
+    if profile is not None:
+        profile.add(stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a block as one pipeline stage: observed in the stage histogram and,
+    while the request is being profiled, added to its Server-Timing.
+
+    Expects:
+        stage (str): A short, fixed name (pdf_extraction, llm, json_parse, embedding, recommendation, ...).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        _record(stage, time.perf_counter() - start)
+
+
+def timed(stage):
+    """Decorator form of span() for whole functions, sync or async."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """pymongo command listener timing every Mongo operation (synchronous clients call it on the request thread)."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1e6
+        mongo_command_seconds.observe(seconds, command=event.command_name)
+        profile = _profile.get()
+        if profile is not None:
+            profile.add("mongo", seconds)
+
+    def failed(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name)
+        mongo_command_errors.inc(command=event.command_name)
+
+
+mongo_command_timer = MongoCommandTimer()
+
+__all__ = ['MetricsRegistry', 'Counter', 'Histogram', 'RequestProfile', 'registry', 'span', 'timed', 'start_profile',
+           'current_profile', 'stop_profile', 'mongo_command_timer']
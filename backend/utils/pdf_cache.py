@@ -0,0 +1,150 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils.data_dir import data_path
+
+# Cache settings (override via .env). Set PDF_CACHE_PATH to "" to disable the disk tier.
+# Relative paths are resolved under DATA_DIR (see utils/data_dir.py).
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+PDF_CACHE_DISK_MAX_BYTES = int(os.getenv("PDF_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+PDF_CACHE_PATH = os.getenv("PDF_CACHE_PATH", "pdf_cache.sqlite3")
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _text_size(pages):
+    return sum(len(page) for page in pages)
+
+
+class PdfTextCache:
+    """
+    Extracted page text keyed by the SHA-256 of the uploaded PDF bytes.
+
+    Tier 1 is an in-process LRU bounded by total text size; tier 2 is a SQLite
+    file with one row per page, bounded by PDF_CACHE_DISK_MAX_BYTES and evicted
+    least-recently-used document first, and opened on first use. Disk hits are
+    promoted into memory.
+    """
+
+    def __init__(self, max_bytes=PDF_CACHE_MAX_BYTES, path=PDF_CACHE_PATH, disk_max_bytes=PDF_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.path = data_path(path) if path else None
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        # Called with the lock held; None when the disk tier is disabled
+        if self._conn is None and self.path:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pdf_documents ("
+                " digest TEXT PRIMARY KEY, page_count INTEGER NOT NULL,"
+                " text_bytes INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pdf_pages ("
+                " digest TEXT NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL,"
+                " PRIMARY KEY (digest, page))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, digest):
+        """Return the list of page texts for a document, or None if it isn't cached."""
+        with self._lock:
+            pages = self._memory.get(digest)
+            if pages is not None:
+                self._memory.move_to_end(digest)
+                self.memory_hits += 1
+                return pages
+
+            conn = self._connection()
+            if conn is not None:
+                rows = conn.execute(
+                    "SELECT text FROM pdf_pages WHERE digest = ? ORDER BY page", (digest,)
+                ).fetchall()
+                if rows:
+                    pages = [row[0] for row in rows]
+                    conn.execute(
+                        "UPDATE pdf_documents SET last_used = ? WHERE digest = ?", (time.time(), digest)
+                    )
+                    conn.commit()
+                    self._remember(digest, pages)
+                    self.disk_hits += 1
+                    return pages
+
+            self.misses += 1
+            return None
+
+    def put(self, digest, pages):
+        pages = list(pages)
+        with self._lock:
+            self._remember(digest, pages)
+            conn = self._connection()
+            if conn is not None:
+                conn.execute("DELETE FROM pdf_pages WHERE digest = ?", (digest,))
+                conn.executemany(
+                    "INSERT INTO pdf_pages (digest, page, text) VALUES (?, ?, ?)",
+                    [(digest, i, text) for i, text in enumerate(pages)],
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO pdf_documents (digest, page_count, text_bytes, last_used)"
+                    " VALUES (?, ?, ?, ?)",
+                    (digest, len(pages), _text_size(pages), time.time()),
+                )
+                self._evict_disk(conn)
+                conn.commit()
+        return pages
+
+    def _remember(self, digest, pages):
+        if digest in self._memory:
+            self._memory_bytes -= _text_size(self._memory.pop(digest))
+        self._memory[digest] = pages
+        self._memory_bytes += _text_size(pages)
+        # Always keep the newest document, even if it alone exceeds the budget
+        while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= _text_size(evicted)
+
+    def _evict_disk(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(text_bytes), 0) FROM pdf_documents").fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        for digest, text_bytes in conn.execute(
+            "SELECT digest, text_bytes FROM pdf_documents ORDER BY last_used"
+        ).fetchall():
+            if total <= self.disk_max_bytes:
+                break
+            conn.execute("DELETE FROM pdf_pages WHERE digest = ?", (digest,))
+            conn.execute("DELETE FROM pdf_documents WHERE digest = ?", (digest,))
+            total -= text_bytes
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_documents": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+# Shared cache instance for the process
+pdf_cache = PdfTextCache()
+
+__all__ = ['PdfTextCache', 'pdf_cache', 'content_hash']
@@ -0,0 +1,166 @@
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PyPDF2 import PdfReader
+
+from utils.pdf_cache import pdf_cache, content_hash
+from utils.metrics import timed
+
+# Extraction limits and parallelism (override via .env)
+MAX_PDF_BYTES = int(os.getenv("MAX_PDF_BYTES", str(50 * 1024 * 1024)))
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "500"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+# Documents with fewer pages are extracted inline; a process pool only pays off for big decks
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "24"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+# Workers are never forked from the app process: it runs job, index-bootstrap and pymongo threads whose
+# locks a forked child could inherit mid-acquire. forkserver forks from a clean single-threaded server.
+PDF_START_METHOD = os.getenv("PDF_START_METHOD", "forkserver")
+
+
+class PdfExtractionError(ValueError):
+    """Raised when an upload can't be extracted; status_code is the HTTP status to return."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = PDF_START_METHOD if PDF_START_METHOD in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def _extract_page_range(path, start, stop):
+    # Runs in a worker process: each task parses the PDF once and extracts a run of pages
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def read_upload(file, max_bytes=MAX_PDF_BYTES):
+    """Read an uploaded file, refusing anything larger than max_bytes without reading all of it."""
+    data = file.stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise PdfExtractionError(
+            f"File {file.filename} is larger than the {max_bytes // (1024 * 1024)} MB limit.", 413
+        )
+    return data
+
+
+def page_texts(data, max_pages=MAX_PDF_PAGES, parallel=None):
+    """
+    Return the text of each page of a PDF, in page order.
+
+    Small documents are extracted inline. Larger ones are split into runs of
+    PDF_PAGES_PER_TASK pages and extracted in the process pool, so the GIL
+    doesn't serialize PyPDF2's pure-Python parsing.
+
+    Parameters:
+        data (bytes): The PDF file contents.
+        max_pages (int): Raise PdfExtractionError if the document has more pages.
+        parallel (bool): Force (True) or disable (False) the process pool; None decides by page count.
+    """
+    reader = PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+    if page_count > max_pages:
+        raise PdfExtractionError(f"PDF has {page_count} pages; the limit is {max_pages}.", 413)
+
+    if parallel is None:
+        parallel = PDF_WORKERS > 1 and page_count >= PDF_PARALLEL_MIN_PAGES
+
+    if not parallel:
+        return [page.extract_text() or "" for page in reader.pages]
+
+    # Workers read the document from a temp file rather than each receiving a pickled copy
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(data)
+    try:
+        starts = range(0, page_count, PDF_PAGES_PER_TASK)
+        stops = [min(start + PDF_PAGES_PER_TASK, page_count) for start in starts]
+        runs = get_pool().map(_extract_page_range, [tmp.name] * len(stops), starts, stops)
+        return [text for texts in runs for text in texts]
+    finally:
+        os.remove(tmp.name)
+
+
+def extract_pages(data, max_pages=MAX_PDF_PAGES, parallel=None, use_cache=True):
+    """
+    Return the text of every page, going through the PDF text cache.
+
+    The cache is keyed by the SHA-256 of the file bytes, so re-uploads of the
+    same document skip PyPDF2 entirely.
+    """
+    if not use_cache:
+        return page_texts(data, max_pages, parallel)
+
+    digest = content_hash(data)
+    pages = pdf_cache.get(digest)
+    if pages is None:
+        return pdf_cache.put(digest, page_texts(data, max_pages, parallel))
+    if len(pages) > max_pages:
+        raise PdfExtractionError(f"PDF has {len(pages)} pages; the limit is {max_pages}.", 413)
+    return pages
+
+
+def extract_text(data, max_pages=MAX_PDF_PAGES, parallel=None, use_cache=True):
+    """Extract a PDF's text, one line break after each non-empty page."""
+    return "".join(f"{text}\n" for text in extract_pages(data, max_pages, parallel, use_cache) if text)
+
+
+def read_uploads(files):
+    """
+    Read uploaded PDF files (werkzeug FileStorage objects) into (filename, bytes) pairs.
+
+    Raises:
+        PdfExtractionError: for non-PDF or oversized files.
+    """
+    uploads = []
+    for file in files:
+        if not file.filename.lower().endswith(".pdf"):
+            raise PdfExtractionError(f"File {file.filename} is not a PDF.", 400)
+        uploads.append((file.filename, read_upload(file)))
+    return uploads
+
+
+@timed("pdf_extraction")
+def extract_files(uploads):
+    """
+    Extract and join the text of (filename, bytes) pairs from read_uploads().
+
+    Raises:
+        PdfExtractionError: for documents that fail to parse.
+    """
+    texts = []
+    for filename, data in uploads:
+        try:
+            texts.append(extract_text(data))
+        except PdfExtractionError:
+            raise
+        except Exception as e:
+            raise PdfExtractionError(f"Error processing {filename}: {str(e)}", 500)
+    return "".join(texts)
+
+
+def extract_uploads(files):
+    """
+    Extract and join the text of uploaded PDF files (werkzeug FileStorage objects).
+
+    Raises:
+        PdfExtractionError: for non-PDF files, oversized files or documents that fail to parse.
+    """
+    return extract_files(read_uploads(files))
+
+
+__all__ = ['PdfExtractionError', 'read_upload', 'page_texts', 'extract_pages', 'extract_text', 'read_uploads', 'extract_files', 'extract_uploads']
@@ -0,0 +1,174 @@
+import numpy as np
+from bson.binary import Binary
+from bson.objectid import ObjectId
+
+# Q-learning parameters
+ALPHA = 0.1  # Learning rate
+GAMMA = 0.9  # Discount factor
+Q_ACTIONS = ("correct", "incorrect")
+
+
+def _is_object_id(value):
+    return isinstance(value, str) and len(value) == 24 and ObjectId.is_valid(value)
+
+
+class QTable:
+    """
+    Compact Q-table: a flashcard-id -> row index plus a float32 array of shape
+    (n_cards, n_actions), in place of a dict of dicts of Python floats.
+
+    update() applies a whole batch of answers with vectorized NumPy ops (replay()
+    runs answer_history through it for rebuild_q_table()), worst() answers
+    top-k queries with argpartition, and to_bson()/from_bson() pack the table
+    into two binary blobs (12-byte ObjectIds plus the raw float32 values).
+    """
+
+    def __init__(self, actions=Q_ACTIONS, alpha=ALPHA, gamma=GAMMA):
+        self.actions = tuple(actions)
+        self.alpha = alpha
+        self.gamma = gamma
+        self.action_index = {action: i for i, action in enumerate(self.actions)}
+        self.ids = []
+        self.index = {}
+        self.values = np.zeros((0, len(self.actions)), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, flashcard_id):
+        return str(flashcard_id) in self.index
+
+    def _rows_for(self, flashcard_ids):
+        # Rows for the given IDs, appending zero rows for IDs not seen yet
+        rows = np.empty(len(flashcard_ids), dtype=np.int64)
+        new_ids = []
+        for i, flashcard_id in enumerate(flashcard_ids):
+            flashcard_id = str(flashcard_id)
+            row = self.index.get(flashcard_id)
+            if row is None:
+                row = self.index[flashcard_id] = len(self.ids) + len(new_ids)
+                new_ids.append(flashcard_id)
+            rows[i] = row
+        if new_ids:
+            self.ids.extend(new_ids)
+            self.values = np.vstack([self.values, np.zeros((len(new_ids), len(self.actions)), dtype=np.float32)])
+        return rows
+
+    def set(self, flashcard_id, q_values):
+        row = self._rows_for([flashcard_id])[0]
+        self.values[row] = [q_values.get(action, 0.0) for action in self.actions]
+
+    def get(self, flashcard_id):
+        row = self.index.get(str(flashcard_id))
+        if row is None:
+            return None
+        return dict(zip(self.actions, self.values[row].tolist()))
+
+    def update(self, flashcard_ids, actions, rewards):
+        """
+        Apply one Q-learning step per (flashcard_id, action, reward), in order:
+
+            Q[action] <- Q[action] + alpha * (reward + gamma * max(Q) - Q[action])
+
+        Distinct cards are updated together in one vectorized step. A card that
+        appears several times is updated in successive rounds, so its result is
+        the same as applying the steps one at a time.
+        """
+        if len(flashcard_ids) == 0:
+            return self
+        rows = self._rows_for(flashcard_ids)
+        try:
+            cols = np.fromiter((self.action_index[a] for a in actions), dtype=np.int64, count=len(rows))
+        except KeyError as e:
+            raise ValueError(f"Unknown action: {e.args[0]}")
+        rewards = np.asarray(rewards, dtype=np.float32)
+
+        # Occurrence number of each entry among the entries for the same row
+        order = np.argsort(rows, kind="stable")
+        sorted_rows = rows[order]
+        starts = np.flatnonzero(np.r_[True, sorted_rows[1:] != sorted_rows[:-1]])
+        group_sizes = np.diff(np.r_[starts, len(rows)])
+        occurrence = np.empty(len(rows), dtype=np.int64)
+        occurrence[order] = np.arange(len(rows)) - np.repeat(starts, group_sizes)
+
+        for round_number in range(int(occurrence.max()) + 1):
+            mask = occurrence == round_number
+            r, c = rows[mask], cols[mask]
+            old_value = self.values[r, c]
+            next_max = self.values[r].max(axis=1)
+            self.values[r, c] = old_value + self.alpha * (rewards[mask] + self.gamma * next_max - old_value)
+        return self
+
+    @classmethod
+    def replay(cls, events, **kwargs):
+        """Rebuild a table from (flashcard_id, action, reward) answer events, oldest first."""
+        events = list(events)
+        table = cls(**kwargs)
+        if events:
+            flashcard_ids, actions, rewards = zip(*events)
+            table.update(flashcard_ids, actions, rewards)
+        return table
+
+    def scores(self):
+        # Ranking score per card: the worst Q-value across actions
+        return self.values.min(axis=1) if len(self) else np.zeros(0, dtype=np.float32)
+
+    def worst(self, k=5):
+        """The k lowest-scoring cards as (flashcard_id, score) pairs, lowest first; O(n + k log k)."""
+        scores = self.scores()
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        rows = np.argpartition(scores, k - 1)[:k]
+        rows = rows[np.argsort(scores[rows], kind="stable")]
+        return [(self.ids[row], float(scores[row])) for row in rows]
+
+    @classmethod
+    def from_dict(cls, q_table, **kwargs):
+        table = cls(**kwargs)
+        items = [(flashcard_id, q) for flashcard_id, q in dict(q_table).items() if isinstance(q, dict)]
+        rows = table._rows_for([flashcard_id for flashcard_id, _ in items])
+        for row, (_, q_values) in zip(rows, items):
+            table.values[row] = [q_values.get(action, 0.0) for action in table.actions]
+        return table
+
+    def to_dict(self):
+        return {flashcard_id: dict(zip(self.actions, row)) for flashcard_id, row in zip(self.ids, self.values.tolist())}
+
+    @classmethod
+    def from_documents(cls, docs, **kwargs):
+        """Build a table from card_performance documents ({"flashcard_id", <action>: value, ...})."""
+        table = cls(**kwargs)
+        docs = list(docs)
+        if not docs:
+            return table
+        rows = table._rows_for([doc["flashcard_id"] for doc in docs])
+        table.values[rows] = [[doc.get(action, 0.0) for action in table.actions] for doc in docs]
+        return table
+
+    def to_bson(self):
+        """Pack the table into a BSON-ready dict; ObjectId-shaped IDs take 12 bytes each."""
+        packed_ids = all(_is_object_id(flashcard_id) for flashcard_id in self.ids)
+        return {
+            "actions": list(self.actions),
+            "count": len(self),
+            "id_format": "objectid" if packed_ids else "str",
+            "ids": Binary(b"".join(ObjectId(i).binary for i in self.ids)) if packed_ids else list(self.ids),
+            "values": Binary(self.values.astype("<f4").tobytes()),
+        }
+
+    @classmethod
+    def from_bson(cls, doc, **kwargs):
+        table = cls(actions=doc["actions"], **kwargs)
+        if doc["id_format"] == "objectid":
+            raw = bytes(doc["ids"])
+            ids = [str(ObjectId(raw[i:i + 12])) for i in range(0, len(raw), 12)]
+        else:
+            ids = list(doc["ids"])
+        table.ids = ids
+        table.index = {flashcard_id: row for row, flashcard_id in enumerate(ids)}
+        table.values = np.frombuffer(bytes(doc["values"]), dtype="<f4").reshape(doc["count"], len(table.actions)).astype(np.float32)
+        return table
+
+
+__all__ = ['QTable', 'ALPHA', 'GAMMA', 'Q_ACTIONS']
@@ -0,0 +1,56 @@
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+from bson.binary import Binary, BinaryVectorDtype
+
+from utils.ann_index import quantize_binary, quantize_int8
+
+# Which embedding encodings to store on each flashcard (override via .env), e.g.
+#   EMBEDDING_STORAGE=float32            full precision only (default, ~3 KB per card)
+#   EMBEDDING_STORAGE=float32,binary     add a 96-byte sign-bit code for a cheap first pass
+#   EMBEDDING_STORAGE=int8,binary        drop float32 entirely; int8 is used for rescoring
+EMBEDDING_STORAGE = [p.strip() for p in os.getenv("EMBEDDING_STORAGE", "float32").split(",") if p.strip()]
+
+# Document field holding each encoding
+EMBEDDING_FIELDS = {
+    "float32": "embedding",
+    "int8": "embedding_int8",
+    "binary": "embedding_binary",
+}
+
+for _precision in EMBEDDING_STORAGE:
+    if _precision not in EMBEDDING_FIELDS:
+        raise ValueError(f"Unknown EMBEDDING_STORAGE precision: {_precision}")
+if "float32" not in EMBEDDING_STORAGE and "int8" not in EMBEDDING_STORAGE:
+    raise ValueError("EMBEDDING_STORAGE needs float32 or int8 so search results can be rescored")
+
+
+def embedding_fields(vector, storage=None):
+    """
+    Encode one float32 embedding into every configured storage precision.
+
+    Returns:
+        dict: Document field name -> BSON binary vector, ready for insert or $set,
+              plus "embedded_at", which tells in-process indexes loaded from an
+              older artifact which cards to re-read.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    fields = {"embedded_at": datetime.now(timezone.utc)}
+    for precision in storage or EMBEDDING_STORAGE:
+        if precision == "float32":
+            fields["embedding"] = Binary.from_vector(vector, BinaryVectorDtype.FLOAT32)
+        elif precision == "int8":
+            fields["embedding_int8"] = Binary.from_vector(quantize_int8(vector).tolist(), BinaryVectorDtype.INT8)
+        elif precision == "binary":
+            fields["embedding_binary"] = Binary.from_vector(quantize_binary(vector).tolist(), BinaryVectorDtype.PACKED_BIT)
+    return fields
+
+
+def full_precision_field(storage=None):
+    """Most precise stored encoding: used to build float indexes and to rescore candidates."""
+    storage = storage or EMBEDDING_STORAGE
+    return "embedding" if "float32" in storage else "embedding_int8"
+
+
+__all__ = ['EMBEDDING_STORAGE', 'EMBEDDING_FIELDS', 'embedding_fields', 'full_precision_field']
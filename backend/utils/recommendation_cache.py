@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Recommendation cache settings (override via .env). Each worker has its own cache, and
+# invalidation is local to it, so the TTL bounds how stale another worker's entry can be.
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "10000"))
+RECOMMENDATION_CACHE_TTL_SECONDS = float(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "60"))
+
+
+class RecommendationCache:
+    """
+    Per-user cache of recommended flashcards (the list of card projections
+    get_recommended_flashcards returns), as an LRU with a TTL.
+
+    Write-through invalidation: Q-table writes call invalidate(user_id), and
+    flashcard edits and deletes call invalidate_flashcard(), which drops every
+    user whose cached list contains that card. A lookup that misses returns an
+    epoch token; put() ignores the result if any invalidation happened since,
+    so a slow read can't cache data that was already stale.
+    """
+
+    def __init__(self, max_entries=RECOMMENDATION_CACHE_SIZE, ttl_seconds=RECOMMENDATION_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._users_by_flashcard = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        """
+        Returns:
+            tuple: (cards, epoch); cards is a copy of the cached list or None on a miss.
+        """
+        user_id = str(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return [dict(card) for card in entry[1]], self._epoch
+            if entry is not None:
+                self._drop(user_id)
+            self.misses += 1
+            return None, self._epoch
+
+    def put(self, user_id, cards, epoch):
+        user_id = str(user_id)
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._drop(user_id)
+            self._entries[user_id] = (time.monotonic(), [dict(card) for card in cards])
+            for card in cards:
+                self._users_by_flashcard.setdefault(str(card["_id"]), set()).add(user_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        for card in entry[1]:
+            users = self._users_by_flashcard.get(str(card["_id"]))
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._users_by_flashcard[str(card["_id"])]
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += 1
+            self._drop(str(user_id))
+
+    def invalidate_flashcard(self, flashcard_id):
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += 1
+            for user_id in list(self._users_by_flashcard.get(str(flashcard_id), ())):
+                self._drop(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._users_by_flashcard.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Shared cache instance for the process
+recommendation_cache = RecommendationCache()
+
+__all__ = ['RecommendationCache', 'recommendation_cache']
@@ -0,0 +1,71 @@
+import json
+
+# Content types for the two streaming formats
+STREAM_MIMETYPES = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class JsonArrayStream:
+    """
+    Incremental parser for a JSON array of objects that arrives in pieces.
+
+    feed() takes the next piece of text and returns the top-level objects it
+    completed, so each one can be used before the array is closed. Anything
+    before the opening bracket (such as a Markdown code fence) is skipped, as
+    is anything after the closing one.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.finished = False
+
+    def feed(self, text):
+        items = []
+        for ch in text:
+            if self.finished:
+                break
+            if not self._started:
+                self._started = ch == "["
+                continue
+            if self._depth == 0:
+                # Between items: only an object start or the end of the array matter
+                if ch == "{":
+                    self._depth = 1
+                    self._buffer = [ch]
+                elif ch == "]":
+                    self.finished = True
+                continue
+
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    items.append(json.loads("".join(self._buffer)))
+        return items
+
+
+def format_event(event, data, fmt="sse"):
+    """Serialize one event as a Server-Sent Event or as an NDJSON line."""
+    if fmt == "ndjson":
+        return json.dumps({"event": event, "data": data}) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+__all__ = ['JsonArrayStream', 'format_event', 'STREAM_MIMETYPES']
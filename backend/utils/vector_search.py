@@ -0,0 +1,408 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from bson.binary import Binary
+from bson.objectid import ObjectId
+
+from utils.ann_index import BinaryIndex, FlatIndex, IVFIndex, normalize
+from utils.data_dir import data_path
+from utils.db import flashcard_collection
+from utils.quantization import EMBEDDING_STORAGE, full_precision_field
+
+# Vector search settings (override via .env)
+#   VECTOR_SEARCH_BACKEND: "atlas" uses the Atlas $vectorSearch stage,
+#                          "local" keeps an exact in-process NumPy index (works on self-hosted Mongo)
+#                          "ivf" keeps an approximate in-process IVF index for large corpora
+#                          "quantized" keeps in-process sign-bit codes and rescores candidates from Mongo
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "atlas")
+VECTOR_INDEX_NAME = os.getenv("VECTOR_INDEX_NAME", "flashcard_index")
+# Atlas index path, e.g. "embedding_binary" for a cheap first pass over quantized vectors
+VECTOR_SEARCH_PATH = os.getenv("VECTOR_SEARCH_PATH", full_precision_field())
+# Rescore Atlas' numCandidates hits at full precision (useful when the index is on a quantized path)
+VECTOR_SEARCH_RESCORE = os.getenv("VECTOR_SEARCH_RESCORE", "0") == "1"
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "768"))
+# Reload the local index from Mongo (in the background) after this many seconds; picks up writes
+# from other processes. 0 = never, which is only correct with a single process serving requests
+VECTOR_INDEX_REFRESH_SECONDS = float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", "300"))
+# Where the "ivf" backend persists its build artifact (relative to DATA_DIR), and its cell count (default: 4 * sqrt(n))
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "flashcard_ivf_index.npz")
+# Cards re-embedded this long before an artifact was written are re-read on load too
+# (covers clock skew between hosts and writes still in flight when it was saved)
+VECTOR_INDEX_SAVE_MARGIN_SECONDS = float(os.getenv("VECTOR_INDEX_SAVE_MARGIN_SECONDS", "300"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0")) or None
+
+
+def to_float32(embedding):
+    # Stored embeddings are BSON binary vectors (float32 or int8); older documents may hold plain lists
+    if isinstance(embedding, Binary):
+        embedding = embedding.as_vector().data
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def to_bits(embedding):
+    # Packed sign bits from a PACKED_BIT vector, as stored in embedding_binary
+    return np.asarray(embedding.as_vector().data, dtype=np.uint8)
+
+
+def rescore(docs, query_vector, top_k, field=None):
+    """
+    Re-rank candidate documents by exact cosine similarity on their full-precision embedding.
+
+    The embedding field is dropped from the returned documents and the score is
+    reported on Atlas' cosine scale, (1 + cosine) / 2.
+    """
+    field = field or full_precision_field()
+    docs = [doc for doc in docs if field in doc]
+    if not docs:
+        return []
+    similarities = normalize(np.vstack([to_float32(doc.pop(field)) for doc in docs])) @ normalize(query_vector)
+    ranked = []
+    for i in np.argsort(-similarities)[:top_k]:
+        doc = docs[i]
+        doc["_id"] = str(doc["_id"])
+        doc["score"] = float((1.0 + similarities[i]) / 2.0)
+        ranked.append(doc)
+    return ranked
+
+
+def fetch_flashcards(ids, scores, projection=None):
+    """
+    Load flashcard fields for ranked ids with one $in query, preserving rank order.
+    Scores are attached under "score", like the Atlas vectorSearchScore projection.
+    """
+    projection = projection or {"question": 1, "answer": 1}
+    docs = {doc["_id"]: doc for doc in flashcard_collection.find({"_id": {"$in": list(ids)}}, projection)}
+    results = []
+    for _id, score in zip(ids, scores):
+        doc = docs.get(_id)
+        if doc is None:
+            continue
+        doc["_id"] = str(doc["_id"])
+        doc["score"] = float(score)
+        results.append(doc)
+    return results
+
+
+class AtlasVectorSearch:
+    """Vector search through the Atlas-only $vectorSearch aggregation stage."""
+
+    def __init__(self, collection, index_name=VECTOR_INDEX_NAME, path=VECTOR_SEARCH_PATH, rescore=VECTOR_SEARCH_RESCORE):
+        self.collection = collection
+        self.index_name = index_name
+        self.path = path
+        self.rescore = rescore
+
+    def search(self, query_vector, top_k=5, num_candidates=100):
+        num_candidates = max(num_candidates, top_k)
+        projection = {
+            "question": 1,
+            "answer": 1,
+            "score": {"$meta": "vectorSearchScore"}
+        }
+        if self.rescore:
+            projection[full_precision_field()] = 1
+
+        pipeline = [
+            {
+                "$vectorSearch": {
+                    "index": self.index_name,
+                    "queryVector": np.asarray(query_vector, dtype=np.float32).tolist(),
+                    "path": self.path,
+                    # When rescoring, return every candidate and re-rank them locally
+                    "limit": num_candidates if self.rescore else top_k,
+                    "numCandidates": num_candidates,
+                }
+            },
+            {"$project": projection}
+        ]
+        results = list(self.collection.aggregate(pipeline))
+        if self.rescore:
+            return rescore(results, query_vector, top_k)
+        for result in results:
+            result["_id"] = str(result["_id"])
+        return results
+
+    # Atlas maintains its own index, so writes need no bookkeeping here
+    def add(self, ids, vectors):
+        pass
+
+    def remove(self, ids):
+        pass
+
+
+class LocalVectorIndex:
+    """
+    In-process vector search over the flashcard embeddings.
+
+    The index is built from flashcard_collection on first use and kept in sync
+    by index_flashcards / unindex_flashcards. Writes made by other processes are
+    picked up by a background reload every VECTOR_INDEX_REFRESH_SECONDS; requests
+    keep searching the current index meanwhile. The default FlatIndex is an
+    exact scan; subclasses swap in an approximate index.
+    """
+
+    def __init__(self, collection, dimensions=EMBEDDING_DIMENSIONS):
+        self.collection = collection
+        self.dimensions = dimensions
+        self.index = self._new_index()
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        # Writes made while a reload reads the collection, replayed onto the new index before it is swapped in
+        self._pending = None
+        self._refresher = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def _new_index(self):
+        return FlatIndex(self.dimensions)
+
+    def _iter_embeddings(self, query=None):
+        field = full_precision_field()
+        query = dict(query or {}, **{field: {"$exists": True}})
+        for doc in self.collection.find(query, {field: 1}):
+            vector = to_float32(doc[field])
+            if vector.shape == (self.dimensions,):
+                yield doc["_id"], vector
+
+    def load(self):
+        """(Re)build the index from every flashcard embedding in the collection."""
+        self._start_reload()
+        index = self._new_index()
+        ids, vectors = [], []
+        for _id, vector in self._iter_embeddings():
+            ids.append(_id)
+            vectors.append(vector)
+        if ids:
+            index.add(ids, np.vstack(vectors))
+        return self._swap(index)
+
+    def _start_reload(self):
+        with self._lock:
+            self._pending = []
+
+    def _swap(self, index):
+        # Install a freshly loaded index, replaying the writes it may have missed
+        with self._lock:
+            for method, args in self._pending or ():
+                getattr(index, method)(*args)
+            self._pending = None
+            self.index = index
+            self._loaded_at = time.monotonic()
+            return len(index)
+
+    def _refresh(self):
+        try:
+            self.load()
+        except Exception as e:
+            print(f"Vector index refresh failed: {e}")
+            with self._lock:
+                self._pending = None
+                self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None:
+            self.load()
+            return
+        stale = (
+            VECTOR_INDEX_REFRESH_SECONDS > 0
+            and time.monotonic() - self._loaded_at > VECTOR_INDEX_REFRESH_SECONDS
+        )
+        if stale and not (self._refresher and self._refresher.is_alive()):
+            self._refresher = threading.Thread(target=self._refresh, name="vector-index-refresh", daemon=True)
+            self._refresher.start()
+
+    def _apply(self, method, *args):
+        getattr(self.index, method)(*args)
+        if self._pending is not None:
+            self._pending.append((method, args))
+
+    def add(self, ids, vectors):
+        """Insert or replace vectors for the given flashcard ids."""
+        with self._lock:
+            self._ensure_loaded()
+            self._apply("add", [ObjectId(i) for i in ids], np.asarray([to_float32(v) for v in vectors]))
+
+    def remove(self, ids):
+        with self._lock:
+            self._ensure_loaded()
+            self._apply("remove", [ObjectId(i) for i in ids])
+
+    def search_ids(self, query_vector, top_k=5, num_candidates=100):
+        """Return (ids, cosine similarities) of the top_k flashcards, best first."""
+        with self._lock:
+            self._ensure_loaded()
+            return self.index.search(to_float32(query_vector), top_k, num_candidates)
+
+    def search(self, query_vector, top_k=5, num_candidates=100):
+        ids, similarities = self.search_ids(query_vector, top_k, num_candidates)
+        # Report scores on Atlas' cosine scale: (1 + cosine) / 2
+        return fetch_flashcards(ids, (1.0 + similarities) / 2.0)
+
+
+class IVFVectorIndex(LocalVectorIndex):
+    """
+    LocalVectorIndex backed by an approximate IVF index, for large corpora.
+
+    The built index is persisted to VECTOR_INDEX_PATH. On startup the artifact
+    is loaded and reconciled with the collection (missing cards added, deleted
+    ones dropped, re-embedded ones re-read by embedded_at) instead of
+    re-clustering everything. Inserts are incremental;
+    the quantizer is retrained, and the artifact rewritten, as the corpus grows.
+    Training runs on a background thread; searches scan the current cells (or
+    everything, before the first training) until it finishes.
+    """
+
+    def __init__(self, collection, dimensions=EMBEDDING_DIMENSIONS, path=VECTOR_INDEX_PATH):
+        self.path = data_path(path) if path else None
+        self._trainer = None
+        super().__init__(collection, dimensions)
+
+    def _new_index(self):
+        return IVFIndex(self.dimensions, nlist=IVF_NLIST)
+
+    def load(self):
+        index = IVFIndex.load(self.path, id_type=ObjectId, nlist=IVF_NLIST) if self.path and os.path.exists(self.path) else None
+        if index is None or index.saved_at is None:
+            # No artifact, or one too old to say which of its vectors are stale: build from the collection
+            count = super().load()
+            self._train_if_needed()
+            return count
+
+        self._start_reload()
+        field = full_precision_field()
+        stored_ids = set(index.ids)
+        live_ids = {doc["_id"] for doc in self.collection.find({field: {"$exists": True}}, {"_id": 1})}
+        since = datetime.fromtimestamp(index.saved_at - VECTOR_INDEX_SAVE_MARGIN_SECONDS, timezone.utc)
+        changed = {doc["_id"] for doc in self.collection.find({field: {"$exists": True}, "embedded_at": {"$gte": since}}, {"_id": 1})}
+
+        removed = list(stored_ids - live_ids)
+        index.remove(removed)
+        # New cards, and cards re-embedded since the artifact was written (add() replaces their vectors)
+        missing = list((live_ids - stored_ids) | (changed & live_ids))
+        for start in range(0, len(missing), 1000):
+            batch = list(self._iter_embeddings({"_id": {"$in": missing[start:start + 1000]}}))
+            if batch:
+                index.add([_id for _id, _ in batch], np.vstack([vector for _, vector in batch]))
+
+        count = self._swap(index)
+        if removed or missing:
+            # So the next load starts from here rather than re-reading the same cards
+            self.save()
+        self._train_if_needed()
+        return count
+
+    def _train_if_needed(self):
+        with self._lock:
+            if not self.index.needs_training or (self._trainer and self._trainer.is_alive()):
+                return
+            index = self.index
+            sample, size = index.training_sample(), len(index)
+            self._trainer = threading.Thread(
+                target=self._train, args=(index, sample, size), name="vector-index-train", daemon=True
+            )
+            self._trainer.start()
+
+    def _train(self, index, sample, size):
+        # k-means runs on a copied sample without the lock; only reassigning the cells holds it
+        try:
+            centroids = index.fit_centroids(sample, size)
+            with self._lock:
+                if self.index is not index:
+                    # Replaced by a reload meanwhile; train the new index instead
+                    self._trainer = None
+                    self._train_if_needed()
+                    return
+                index.use_centroids(centroids, size)
+                self.save()
+        except Exception as e:
+            print(f"Vector index training failed: {e}")
+
+    def add(self, ids, vectors):
+        super().add(ids, vectors)
+        self._train_if_needed()
+
+    def save(self):
+        if self.path:
+            with self._lock:
+                self.index.save(self.path)
+
+
+class QuantizedVectorIndex(LocalVectorIndex):
+    """
+    Two-stage search: an in-process Hamming scan over 96-byte sign-bit codes
+    picks num_candidates flashcards, which are then fetched from Mongo and
+    rescored at full precision in the same round-trip that loads their fields.
+
+    Keeps about 1/32 of the memory of the float32 index. Codes come from the
+    embedding_binary field when it is stored, otherwise from the full vector.
+    """
+
+    def _new_index(self):
+        return BinaryIndex(self.dimensions)
+
+    def load(self):
+        self._start_reload()
+        index = self._new_index()
+        field = full_precision_field()
+        stored_bits = "binary" in EMBEDDING_STORAGE
+        code_field = "embedding_binary" if stored_bits else field
+        ids, codes = [], []
+        for doc in self.collection.find({code_field: {"$exists": True}}, {code_field: 1}):
+            code = to_bits(doc[code_field]) if stored_bits else index.encode(to_float32(doc[code_field]))[0]
+            if code.shape == (index.code_width(self.dimensions),):
+                ids.append(doc["_id"])
+                codes.append(code)
+        if ids:
+            index.add_codes(ids, np.vstack(codes))
+        return self._swap(index)
+
+    def search(self, query_vector, top_k=5, num_candidates=100):
+        candidate_ids, _ = self.search_ids(query_vector, max(num_candidates, top_k))
+        docs = self.collection.find(
+            {"_id": {"$in": candidate_ids}},
+            {"question": 1, "answer": 1, full_precision_field(): 1}
+        )
+        return rescore(list(docs), to_float32(query_vector), top_k)
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_vector_search(backend=None):
+    """Return the shared vector search backend for this process."""
+    backend = backend or VECTOR_SEARCH_BACKEND
+    with _backends_lock:
+        if backend not in _backends:
+            if backend == "atlas":
+                _backends[backend] = AtlasVectorSearch(flashcard_collection)
+            elif backend == "local":
+                _backends[backend] = LocalVectorIndex(flashcard_collection)
+            elif backend == "ivf":
+                _backends[backend] = IVFVectorIndex(flashcard_collection)
+            elif backend == "quantized":
+                _backends[backend] = QuantizedVectorIndex(flashcard_collection)
+            else:
+                raise ValueError(f"Unknown vector search backend: {backend}")
+            if backend != "atlas" and VECTOR_INDEX_REFRESH_SECONDS <= 0:
+                print(f"Warning: the {backend} vector index never reloads (VECTOR_INDEX_REFRESH_SECONDS=0), "
+                      "so it misses flashcards added or deleted by other processes; use it with a single process only.")
+        return _backends[backend]
+
+
+def index_flashcards(ids, vectors):
+    # Keep in-process indexes in sync after flashcards are inserted or re-embedded
+    for index in list(_backends.values()):
+        index.add(ids, vectors)
+
+
+def unindex_flashcards(ids):
+    for index in list(_backends.values()):
+        index.remove(ids)
+
+
+__all__ = ['AtlasVectorSearch', 'LocalVectorIndex', 'IVFVectorIndex', 'QuantizedVectorIndex', 'get_vector_search', 'index_flashcards', 'unindex_flashcards', 'fetch_flashcards', 'rescore', 'to_float32', 'to_bits']
@@ -0,0 +1,39 @@
+"""
+Standalone job worker: runs the /jobs pipeline outside the web process, so the
+worker pool can be sized (JOB_WORKERS) and scaled separately from the web servers.
+
+This is how /jobs get run: the web process only queues them (unless
+JOB_WORKERS_IN_APP=1, for a single-process dev setup). With the default
+SQLite queue, run it on the same host (JOB_QUEUE_PATH); with JOB_QUEUE_BACKEND=mongo
+it can run anywhere (use CONVERSATION_STORE=mongo so chats are shared too).
+
+Usage (from the backend directory):
+    python worker.py
+"""
+
+import signal
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from controllers.jobs_controller import job_workers
+
+
+def main():
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    job_workers.start()
+    print(f"Job worker started with {job_workers.workers} threads")
+    try:
+        while not stopping.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    # Running jobs are cut off here; they're requeued once JOB_STALE_SECONDS passes
+    job_workers.stop(timeout=5)
+
+
+if __name__ == "__main__":
+    main()